@@ -0,0 +1,122 @@
+# batch validation of many json files at once
+# every file goes through the whole scanner -> semantic parser pipeline (compiler.compile_file)
+# in a pool of worker processes, and the errors of all files are collected into one report:
+# a human readable one (printed, or written with --output) and a json one (written with --json)
+# with --cache DIR results are kept in a cache.ResultCache shared by every worker, so files that
+# haven't changed since the last run aren't scanned or parsed again
+#
+#   python batch.py payloads/ "more/**/*.json" --workers 8 --chunksize 64 --json report.json
+#   python batch.py payloads/ --cache .jsoncache
+
+import argparse
+import glob
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from cache import DEFAULT_MAX_BYTES, ResultCache
+from compiler import compile_file
+
+# the cache.ResultCache of this process, if results are cached
+result_cache = None
+
+# runs in every worker process when the pool starts
+def init_cache(directory, max_bytes=DEFAULT_MAX_BYTES):
+    global result_cache
+    result_cache = ResultCache(directory, max_bytes) if directory else None
+
+# directories are searched recursively for files matching pattern, anything else is treated as a glob
+def find_files(paths, pattern="*.json"):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(glob.glob(os.path.join(path, "**", pattern), recursive=True))
+        elif os.path.isfile(path):
+            files.append(path)
+        else:
+            matches = [match for match in glob.glob(path, recursive=True) if os.path.isfile(match)]
+            if not matches:
+                print(f"No files match '{path}'", file=sys.stderr)
+            files.extend(matches)
+    return sorted(set(files))
+
+# runs in a worker process, only the errors are sent back (the AST would just be thrown away)
+# with a cache the result also says whether it came out of the cache
+def validate_file(path):
+    if result_cache is None:
+        try:
+            ast, errors = compile_file(path)
+        except OSError as e:
+            errors = [f"File Error: {e}"]
+        return {"path": path, "errors": errors}
+
+    hits = result_cache.hits
+    try:
+        ast, errors = result_cache.compile_file(path)
+    except OSError as e:
+        errors = [f"File Error: {e}"]
+    return {"path": path, "errors": errors, "cached": result_cache.hits > hits}
+
+def validate_files(files, workers=None, chunksize=16, cache_dir=None, cache_size=DEFAULT_MAX_BYTES):
+    if workers == 1:
+        init_cache(cache_dir, cache_size)
+        return [validate_file(path) for path in files]
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_cache, initargs=(cache_dir, cache_size)) as pool:
+        return list(pool.map(validate_file, files, chunksize=chunksize))
+
+def summarize(results):
+    summary = {
+        "files": len(results),
+        "files_with_errors": sum(1 for result in results if result["errors"]),
+        "errors": sum(len(result["errors"]) for result in results),
+    }
+    if any("cached" in result for result in results):
+        summary["cached"] = sum(1 for result in results if result.get("cached"))
+    return summary
+
+def write_text_report(results, file):
+    for result in results:
+        if result["errors"]:
+            file.write(f"{result['path']}: {len(result['errors'])} error(s)\n")
+            for error in result["errors"]:
+                file.write(f"    {error}\n")
+        else:
+            file.write(f"{result['path']}: OK\n")
+    summary = summarize(results)
+    file.write(f"{summary['files']} file(s) checked, {summary['files_with_errors']} with errors, {summary['errors']} error(s) in total\n")
+    if "cached" in summary:
+        file.write(f"{summary['cached']} of them from the cache\n")
+
+def write_json_report(results, file):
+    json.dump({"summary": summarize(results), "files": results}, file, indent=2)
+    file.write("\n")
+
+def main(argv=None):
+    arguments = argparse.ArgumentParser(description="Validate many json files in parallel.")
+    arguments.add_argument("paths", nargs="+", help="files, directories or glob patterns")
+    arguments.add_argument("--pattern", default="*.json", help="file pattern used inside directories (default: *.json)")
+    arguments.add_argument("--workers", type=int, default=None, help="worker processes (default: one per cpu, 1 runs everything in this process)")
+    arguments.add_argument("--chunksize", type=int, default=16, help="files handed to a worker at a time (default: 16)")
+    arguments.add_argument("--output", help="write the human readable report here instead of printing it")
+    arguments.add_argument("--json", help="also write a machine readable report here")
+    arguments.add_argument("--cache", help="directory to cache results in, unchanged files are not checked again")
+    arguments.add_argument("--cache-size", type=int, default=DEFAULT_MAX_BYTES >> 20, help="size limit of the cache in MB (default: 256)")
+    options = arguments.parse_args(argv)
+
+    files = find_files(options.paths, options.pattern)
+    results = validate_files(files, options.workers, options.chunksize, options.cache, options.cache_size << 20)
+
+    if options.output:
+        with open(options.output, "w") as file:
+            write_text_report(results, file)
+    else:
+        write_text_report(results, sys.stdout)
+    if options.json:
+        with open(options.json, "w") as file:
+            write_json_report(results, file)
+
+    return 1 if any(result["errors"] for result in results) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
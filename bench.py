@@ -0,0 +1,298 @@
+# benchmarks for every stage of the compiler on generated json documents
+# each shape of document is made by a seeded generator, so the same seed and size always give the same input.
+# the stages are timed on their own (tokens are made once up front and handed to both parsers):
+#   tokenize-dfa   - DFA().tokenize, the original scanner
+#   tokenize-regex - RegexDFA().tokenize
+#   tokenize-numpy - StructuralDFA().tokenize (the structural engine), only when numpy is installed
+#   parse-tree     - parser.Parser(tokens=...).parse
+#   semantic       - semanticparser.Parser(tokens=...).parse, including the semantic rules
+#   json.loads     - the stdlib parser on the same text, as a baseline
+# every stage is run --repeat times and the best time is kept, then run once more under tracemalloc
+# for its peak memory. results are written one line per shape and stage, in a fixed order and format,
+# so the output of two versions can be diffed (or compared with --compare)
+#
+#   python bench.py --size 1000 --seed 1 --output bench_output.txt
+#   python bench.py --compare old_bench_output.txt
+#   python bench.py --check
+
+import argparse
+import gc
+import json
+import random
+import string
+import sys
+import time
+import tracemalloc
+
+import semanticparser
+import structural
+import parser
+from scanner import DFA, RegexDFA, StructuralDFA, Lexer
+
+# generators, each one makes a valid json document of about size characters
+
+def random_value(rng):
+    kind = rng.randrange(4)
+    if kind == 0:
+        return rng.randrange(-10 ** 6, 10 ** 6)
+    if kind == 1:
+        return "".join(rng.choices(string.ascii_letters, k=rng.randrange(1, 16)))
+    if kind == 2:
+        return rng.choice([True, False, None])
+    return round(rng.uniform(-1000, 1000), 4)
+
+# one object with a great many keys
+def wide_object(rng, size):
+    parts = []
+    length = 2
+    index = 0
+    while length < size:
+        part = f"{json.dumps('key' + str(index))}: {json.dumps(random_value(rng))}"
+        parts.append(part)
+        length += len(part) + 2
+        index += 1
+    return "{" + ", ".join(parts) + "}"
+
+# a list of deeply nested lists and dicts, each kept under the stdlib's recursion limit
+def deep_nesting(rng, size, depth=500):
+    parts = []
+    length = 2
+    while length < size:
+        opening = []
+        closing = []
+        for level in range(depth):
+            if rng.random() < 0.5:
+                opening.append('{"k%d": ' % level)
+                closing.append("}")
+            else:
+                opening.append("[")
+                closing.append("]")
+        part = "".join(opening) + json.dumps(random_value(rng)) + "".join(reversed(closing))
+        parts.append(part)
+        length += len(part) + 2
+    return "[" + ", ".join(parts) + "]"
+
+# a list of long strings, some with escape sequences in them
+def long_strings(rng, size):
+    parts = []
+    length = 2
+    alphabet = string.ascii_letters + string.digits + " "
+    while length < size:
+        text = "".join(rng.choices(alphabet, k=rng.randrange(1000, 10000)))
+        if rng.random() < 0.3:
+            text = text.replace("a", "\n").replace("b", '"')
+        part = json.dumps(text)
+        parts.append(part)
+        length += len(part) + 2
+    return "[" + ", ".join(parts) + "]"
+
+# a list of integers, decimals and exponents
+def number_array(rng, size):
+    parts = []
+    length = 2
+    while length < size:
+        kind = rng.randrange(3)
+        if kind == 0:
+            part = str(rng.randrange(-10 ** 9, 10 ** 9))
+        elif kind == 1:
+            part = repr(round(rng.uniform(-10 ** 6, 10 ** 6), rng.randrange(1, 8)))
+        else:
+            part = f"{rng.randrange(1, 10)}.{rng.randrange(10 ** 4)}e{rng.randrange(-30, 30)}"
+        parts.append(part)
+        length += len(part) + 2
+    return "[" + ", ".join(parts) + "]"
+
+# a list of objects whose keys come from a small pool, so most objects repeat a key (Type 5 errors)
+def duplicate_keys(rng, size):
+    pool = ["id", "name", "value", "type", "tags", "owner"]
+    parts = []
+    length = 2
+    while length < size:
+        pairs = [f"{json.dumps(rng.choice(pool))}: {json.dumps(random_value(rng))}" for _ in range(rng.randrange(4, 12))]
+        part = "{" + ", ".join(pairs) + "}"
+        parts.append(part)
+        length += len(part) + 2
+    return "[" + ", ".join(parts) + "]"
+
+SHAPES = {
+    "wide": wide_object,
+    "deep": deep_nesting,
+    "strings": long_strings,
+    "numbers": number_array,
+    "duplicates": duplicate_keys,
+}
+
+# the stages, each one is given the text and the tokens of one document
+def tokenize_dfa(text, tokens):
+    return DFA().tokenize(Lexer(text, []))
+
+def tokenize_regex(text, tokens):
+    return RegexDFA().tokenize(Lexer(text, []))
+
+def tokenize_structural(text, tokens):
+    return StructuralDFA().tokenize(Lexer(text, []))
+
+def parse_tree(text, tokens):
+    return parser.Parser(tokens=tokens, errors=[]).parse()
+
+def semantic(text, tokens):
+    return semanticparser.Parser(tokens=tokens, errors=[]).parse()
+
+def stdlib_json(text, tokens):
+    return json.loads(text)
+
+STAGES = {
+    "tokenize-dfa": tokenize_dfa,
+    "tokenize-regex": tokenize_regex,
+    **({"tokenize-numpy": tokenize_structural} if structural.numpy is not None else {}),
+    "parse-tree": parse_tree,
+    "semantic": semantic,
+    "json.loads": stdlib_json,
+}
+
+# inputs the scanner engines have disagreed on before, checked along with every generated shape by --check
+EDGE_CASES = [
+    '[1\u00b2]', # a superscript two is a digit to str.isdigit but not to the json grammar
+    '[\u0663, 1\u0663]',
+    '{"a": tru, "b": nul}',
+    '["\\q", "never closed',
+    '[1, @@@ 2, #]',
+]
+
+# the engines that make tokens, by name
+ENGINES = {"dfa": DFA, "regex": RegexDFA, **({"structural": StructuralDFA} if structural.numpy is not None else {})}
+
+# names of the engines whose tokens or lexer errors for text aren't the same as the DFA's
+def engine_differences(text):
+    results = {}
+    for name, engine in ENGINES.items():
+        errors = []
+        tokens = [(token.type, token.value) for token in engine().tokenize(Lexer(text, errors))]
+        results[name] = (tokens, errors)
+    return [name for name in ENGINES if results[name] != results["dfa"]]
+
+# best time out of repeat runs
+def time_stage(stage, text, tokens, repeat):
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        result = stage(text, tokens)
+        seconds = time.perf_counter() - start
+        del result
+        if best is None or seconds < best:
+            best = seconds
+    return best
+
+# peak bytes allocated while the stage runs (the text and tokens are already there, so they don't count)
+def peak_memory(stage, text, tokens):
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = stage(text, tokens)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    del result
+    return peak
+
+def run(shapes, stages, size, seed, repeat):
+    results = []
+    for shape in shapes:
+        text = SHAPES[shape](random.Random(seed), size)
+        tokens = RegexDFA().tokenize(Lexer(text, []))
+        megabytes = len(text.encode("utf-8")) / 1e6
+        for name in stages:
+            seconds = time_stage(STAGES[name], text, tokens, repeat)
+            peak = peak_memory(STAGES[name], text, tokens)
+            results.append({
+                "shape": shape,
+                "stage": name,
+                "bytes": len(text.encode("utf-8")),
+                "tokens": len(tokens),
+                "seconds": seconds,
+                "mb_per_s": megabytes / seconds,
+                "tokens_per_s": len(tokens) / seconds,
+                "peak_kb": peak // 1024,
+            })
+        del text, tokens
+    return results
+
+HEADER = f"{'shape':<12}{'stage':<16}{'bytes':>12}{'tokens':>10}{'MB/s':>10}{'tokens/s':>14}{'peak KB':>12}"
+
+def format_result(result):
+    return (f"{result['shape']:<12}{result['stage']:<16}{result['bytes']:>12}{result['tokens']:>10}"
+            f"{result['mb_per_s']:>10.2f}{result['tokens_per_s']:>14.0f}{result['peak_kb']:>12}")
+
+def write_results(results, file, size, seed, repeat):
+    file.write(f"# bench.py size={size} seed={seed} repeat={repeat} python={sys.version.split()[0]}\n")
+    file.write(HEADER + "\n")
+    for result in results:
+        file.write(format_result(result) + "\n")
+
+# reads the results back out of a file written by write_results
+def read_results(path):
+    results = {}
+    with open(path) as file:
+        for line in file:
+            if line.startswith("#") or line.startswith("shape"):
+                continue
+            columns = line.split()
+            if len(columns) == 7:
+                results[(columns[0], columns[1])] = {"mb_per_s": float(columns[4]), "peak_kb": int(columns[6])}
+    return results
+
+# throughput and memory change against an older run, slower or bigger by more than threshold is flagged
+def compare(results, old, file, threshold=0.10):
+    regressions = 0
+    for result in results:
+        before = old.get((result["shape"], result["stage"]))
+        if before is None:
+            continue
+        speed = result["mb_per_s"] / before["mb_per_s"] - 1 if before["mb_per_s"] else 0.0
+        memory = result["peak_kb"] / before["peak_kb"] - 1 if before["peak_kb"] else 0.0
+        flag = ""
+        if speed < -threshold or memory > threshold:
+            flag = "  REGRESSION"
+            regressions += 1
+        file.write(f"{result['shape']:<12}{result['stage']:<16}{speed:>+10.1%} speed{memory:>+10.1%} memory{flag}\n")
+    return regressions
+
+def main(argv=None):
+    arguments = argparse.ArgumentParser(description="Benchmark the compiler stages on generated json.")
+    arguments.add_argument("--size", type=int, default=200, help="size of each generated document in KB (default: 200)")
+    arguments.add_argument("--seed", type=int, default=0, help="seed for the generators (default: 0)")
+    arguments.add_argument("--repeat", type=int, default=3, help="timed runs per stage, the best one is kept (default: 3)")
+    arguments.add_argument("--shapes", nargs="+", choices=list(SHAPES), default=list(SHAPES))
+    arguments.add_argument("--stages", nargs="+", choices=list(STAGES), default=list(STAGES))
+    arguments.add_argument("--output", default="bench_output.txt", help="file the results are written to (default: bench_output.txt)")
+    arguments.add_argument("--compare", help="results of an older run to compare against")
+    arguments.add_argument("--check", action="store_true",
+                           help="only check that every engine gives the same tokens and errors on the shapes and EDGE_CASES")
+    options = arguments.parse_args(argv)
+
+    if options.check:
+        texts = EDGE_CASES + [SHAPES[shape](random.Random(options.seed), options.size * 1000) for shape in options.shapes]
+        failures = 0
+        for text in texts:
+            differences = engine_differences(text)
+            if differences:
+                failures += 1
+                print(f"{', '.join(differences)} differ from dfa on {text[:40]!r}")
+        print(f"{len(texts)} input(s), {failures} with differences")
+        return 1 if failures else 0
+
+    results = run(options.shapes, options.stages, options.size * 1000, options.seed, options.repeat)
+
+    write_results(results, sys.stdout, options.size, options.seed, options.repeat)
+    with open(options.output, "w") as file:
+        write_results(results, file, options.size, options.seed, options.repeat)
+
+    if options.compare:
+        print()
+        regressions = compare(results, read_results(options.compare), sys.stdout)
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
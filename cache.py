@@ -0,0 +1,256 @@
+# on-disk cache of compile results, for inputs that are checked again and again without changing (e.g. on every CI run)
+# an entry is keyed by the sha256 of the input bytes together with compiler.PIPELINE_VERSION, the engine and
+# the signature of the rule set (rules.RuleSet.signature), so changing the compiler or the rules never hands
+# back stale results. an entry holds the tokens the parser read (as TokenBuffer bytes), the AST (in
+# serialize's binary format) and the error list, marshalled and zlib compressed.
+# on a hit nothing is scanned or parsed, the AST is rebuilt straight from the entry.
+#
+# entries live in directory/<2 hex digits>/<rest of the key>. they are written to a temporary file and renamed
+# into place, so readers in other processes only ever see whole entries. the cache is kept under max_bytes by
+# evicting the least recently used entries (a hit touches the entry's mtime), with a lock file (fcntl) so only
+# one process evicts at a time. hits, misses, writes and evictions are counted per ResultCache, see stats().
+#
+#   cache = ResultCache(".jsoncache", max_bytes=256 << 20)
+#   ast, errors = cache.compile_file("payload.json")
+
+import hashlib
+import marshal
+import os
+import tempfile
+import zlib
+from contextlib import contextmanager
+
+from compiler import PIPELINE_VERSION
+from rules import RuleSet
+from scanner import ENGINES, Lexer, iter_file_tokens
+from semanticparser import Parser
+from serialize import to_binary, from_binary
+from tokenbuffer import TokenBuffer
+
+try:
+    import fcntl
+except ImportError: # no fcntl on windows, entries are still written atomically but eviction isn't locked
+    fcntl = None
+
+# bump when the layout of an entry changes
+FORMAT = 2
+DEFAULT_MAX_BYTES = 256 << 20
+# eviction goes down to this fraction of max_bytes, so it doesn't have to run again on the very next write
+EVICT_TO = 0.9
+
+# passes tokens through, keeping every one of them in seen
+def recorded(tokens, seen):
+    for token in tokens:
+        seen.append(token)
+        yield token
+
+# what the compiler made of one input
+class Entry:
+    def __init__(self, token_bytes, ast_bytes, errors):
+        self.token_bytes = token_bytes
+        self.ast_bytes = ast_bytes
+        self.errors = errors
+
+    # the tokens the parser read, as a TokenBuffer (its source is made from the token values, see TokenBuffer.from_tokens)
+    def tokens(self):
+        return TokenBuffer.from_bytes(self.token_bytes)
+
+    def ast(self):
+        return from_binary(self.ast_bytes)
+
+    def to_bytes(self):
+        return zlib.compress(marshal.dumps((FORMAT, self.token_bytes, self.ast_bytes, self.errors)), 1)
+
+    @classmethod
+    def from_bytes(cls, data):
+        version, token_bytes, ast_bytes, errors = marshal.loads(zlib.decompress(data))
+        if version != FORMAT:
+            raise ValueError("cache entry has another format")
+        return cls(token_bytes, ast_bytes, errors)
+
+class ResultCache:
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES, rules=None, engine="regex"):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.rules = rules if rules is not None else RuleSet()
+        self.engine = engine
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+        self.salt = f"{PIPELINE_VERSION}|{FORMAT}|{engine}|{self.rules.signature()}|".encode("utf-8")
+
+    def key(self, data):
+        return hashlib.sha256(self.salt + data).hexdigest()
+
+    def file_key(self, path):
+        digest = hashlib.sha256(self.salt)
+        with open(path, "rb") as file:
+            for block in iter(lambda: file.read(1 << 20), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key[2:])
+
+    # the entry for key, or None. entries that can't be read (half deleted, another format) are misses
+    def get(self, key):
+        path = self.path(key)
+        try:
+            with open(path, "rb") as file:
+                entry = Entry.from_bytes(file.read())
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except (OSError, ValueError, EOFError, TypeError, zlib.error):
+            self.misses += 1
+            size = self.size_of(path)
+            if self.remove(path):
+                self.add_size(-size)
+            return None
+        try:
+            os.utime(path) # most recently used
+        except OSError: # removed or read-only meanwhile, the entry read fine so it's still a hit
+            pass
+        self.hits += 1
+        return entry
+
+    def put(self, key, entry):
+        data = entry.to_bytes()
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        handle, temporary = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp")
+        try:
+            with os.fdopen(handle, "wb") as file:
+                file.write(data)
+            replaced = self.size_of(path) # an entry already there (written by another process) stops counting
+            os.replace(temporary, path)
+        except OSError:
+            self.remove(temporary)
+            raise
+        self.writes += 1
+        self.add_size(len(data) - replaced)
+
+    # ast and errors for text, from the cache when it's there
+    def compile_json(self, text):
+        key = self.key(text.encode("utf-8", errors="surrogatepass"))
+        entry = self.get(key)
+        if entry is None:
+            errors = []
+            entry = self.compile(ENGINES[self.engine]().iter_tokens(Lexer(text, errors)), errors)
+            self.put(key, entry)
+        return entry.ast(), list(entry.errors)
+
+    # the same for a file, a miss streams it with scanner.iter_file_tokens like compiler.compile_file
+    def compile_file(self, path):
+        key = self.file_key(path)
+        entry = self.get(key)
+        if entry is None:
+            errors = []
+            entry = self.compile(iter_file_tokens(path, errors=errors), errors)
+            self.put(key, entry)
+        return entry.ast(), list(entry.errors)
+
+    # runs the whole pipeline like compiler.compile_json, keeping the tokens as they go by.
+    # errors is the list the scanner of tokens reports into, the parser adds its own to it
+    def compile(self, tokens, errors):
+        seen = []
+        ast = Parser(tokens=recorded(tokens, seen), rules=self.rules, errors=errors).parse()
+        return Entry(TokenBuffer.from_tokens(seen).to_bytes(), to_binary(ast), errors)
+
+    # held while the size file is updated or entries are evicted
+    @contextmanager
+    def locked(self):
+        with open(os.path.join(self.directory, "lock"), "a") as file:
+            if fcntl is not None:
+                fcntl.flock(file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(file, fcntl.LOCK_UN)
+
+    # the total size of the entries is kept in a file, so a write doesn't have to look at every entry
+    def read_size(self):
+        try:
+            with open(os.path.join(self.directory, "size")) as file:
+                return int(file.read() or 0)
+        except (OSError, ValueError):
+            return None
+
+    def write_size(self, size):
+        with open(os.path.join(self.directory, "size"), "w") as file:
+            file.write(str(size))
+
+    def add_size(self, added):
+        with self.locked():
+            size = self.read_size()
+            if size is None:
+                size = sum(entry_size for entry_size, _, _ in self.entries())
+            else:
+                size = max(size + added, 0)
+            if self.max_bytes is not None and size > self.max_bytes:
+                size = self.evict(int(self.max_bytes * EVICT_TO))
+            self.write_size(size)
+
+    # (size, mtime, path) of every entry
+    def entries(self):
+        found = []
+        for folder in os.scandir(self.directory):
+            if not folder.is_dir():
+                continue
+            for item in os.scandir(folder.path):
+                if item.name.startswith(".tmp"):
+                    continue
+                try:
+                    info = item.stat()
+                except FileNotFoundError:
+                    continue
+                found.append((info.st_size, info.st_mtime, item.path))
+        return found
+
+    # removes the least recently used entries until they take up at most limit bytes, returns what's left
+    def evict(self, limit):
+        entries = self.entries()
+        size = sum(entry_size for entry_size, _, _ in entries)
+        for entry_size, _, path in sorted(entries, key=lambda entry: entry[1]):
+            if size <= limit:
+                break
+            if self.remove(path):
+                self.evictions += 1
+            size -= entry_size
+        return size
+
+    # size of the file at path, 0 when there is none
+    def size_of(self, path):
+        try:
+            return os.stat(path).st_size
+        except OSError:
+            return 0
+
+    def remove(self, path):
+        try:
+            os.remove(path)
+            return True
+        except OSError:
+            return False
+
+    def clear(self):
+        with self.locked():
+            self.evict(0)
+            self.write_size(0)
+
+    # counters of this ResultCache, and the entries and bytes the whole cache holds
+    def stats(self):
+        entries = self.entries()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "writes": self.writes,
+            "evictions": self.evictions,
+            "entries": len(entries),
+            "bytes": sum(entry_size for entry_size, _, _ in entries),
+        }
@@ -0,0 +1,153 @@
+# single entry point for the whole compiler
+# tokens from the scanner are streamed straight into the semantic parser,
+# so the document is only scanned once and nothing is written to or read back from a token file
+
+import os
+import time
+
+from core import NodeTree, ErrorCollector, ErrorLimitReached
+from scanner import ENGINES, Lexer, iter_file_tokens
+from semanticparser import Parser
+from tokenbuffer import TokenBuffer
+from structural import scanning_buffer
+from flattree import FlatTree
+from rules import RuleSet
+from numeric import PackedTree
+
+# bump when the scanner or parsers change the tokens, AST or errors they produce, cached results (see cache.py) depend on it
+PIPELINE_VERSION = 2
+
+# scans, parses and semantically checks a json document given as a string
+# engine picks the scanner from scanner.ENGINES ("regex" is the fast one, "dfa" the original,
+# "structural" the numpy one for big inputs, see structural.py)
+# with flat=True the AST is a flattree.FlatTree built over a TokenBuffer instead of Node objects,
+# which takes far less memory for big documents (the buffer is scanned with the regex engine,
+# or with structural.scanning_buffer for engine="structural"), and its numbers are checked a batch at a time
+# (see rules.RuleSet.batched)
+# rules is the rules.RuleSet of semantic checks to run, all of them by default
+# instruments is an instrument.Instruments that times and counts the run, nothing is measured without one
+# pack_numbers="array" (or "numpy") builds the AST with numeric.PackedTree, so lists of nothing but numbers
+# come out as numeric.PackedList nodes holding one packed array instead of a leaf per number
+# (it's ignored with flat=True, a FlatTree never holds a string per number to begin with)
+# with max_errors the run stops as soon as that many errors are found, in whichever stage finds them
+# (max_errors=1 is fail fast), and the AST is None. recover=True has the scanner report a run of
+# invalid characters as one error and carry on after it (see scanner.BAD_RUN)
+# returns the AST and the errors (lexer errors and semantic errors, in the order they were found) as a
+# core.ErrorCollector, a list of its own for every run, so runs in other threads never mix their errors in
+def compile_json(text, engine="regex", flat=False, rules=None, instruments=None, pack_numbers=None,
+                 max_errors=None, recover=False):
+    errors = ErrorCollector(max_errors)
+    ast = None
+
+    if instruments is not None:
+        instruments.counters["chars_scanned"] += len(text)
+        with instruments.profiled(), instruments.stage("total"):
+            try:
+                if flat:
+                    with instruments.stage("scan"):
+                        buffer, tokens = new_buffer(text, engine, errors, recover)
+                    flat_rules = (rules if rules is not None else RuleSet(timed=True)).batched(buffer)
+                    ast = instrumented_parse(instruments, tokens, FlatTree(buffer), flat_rules, errors, streamed=True)
+                else:
+                    tokens = ENGINES[engine]().iter_tokens(Lexer(text, errors, recover))
+                    ast = instrumented_parse(instruments, tokens, new_tree(pack_numbers), rules, errors, streamed=True)
+            except ErrorLimitReached:
+                pass
+        instruments.count_errors(errors)
+        instruments.finish()
+        return ast, errors
+
+    try:
+        if flat:
+            buffer, tokens = new_buffer(text, engine, errors, recover)
+            flat_rules = (rules if rules is not None else RuleSet()).batched(buffer)
+            parser = Parser(tokens=tokens, tree=FlatTree(buffer), rules=flat_rules, errors=errors)
+        else:
+            lexer = Lexer(text, errors, recover)
+            parser = Parser(tokens=ENGINES[engine]().iter_tokens(lexer), tree=new_tree(pack_numbers), rules=rules,
+                            errors=errors)
+        ast = parser.parse()
+    except ErrorLimitReached:
+        pass
+    return ast, errors
+
+# same as compile_json, but tokens are streamed out of the file at path (see scanner.iter_file_tokens)
+# so the document itself is never loaded into memory. once max_errors is reached nothing more of the file is read
+def compile_file(path, rules=None, instruments=None, pack_numbers=None, max_errors=None, recover=False):
+    errors = ErrorCollector(max_errors)
+    ast = None
+
+    if instruments is not None:
+        instruments.counters["bytes_scanned"] += os.path.getsize(path)
+        with instruments.profiled(), instruments.stage("total"):
+            try:
+                tokens = iter_file_tokens(path, errors=errors, recover=recover)
+                ast = instrumented_parse(instruments, tokens, new_tree(pack_numbers), rules, errors, streamed=True)
+            except ErrorLimitReached:
+                pass
+        instruments.count_errors(errors)
+        instruments.finish()
+        return ast, errors
+
+    try:
+        parser = Parser(tokens=iter_file_tokens(path, errors=errors, recover=recover), tree=new_tree(pack_numbers),
+                        rules=rules, errors=errors)
+        ast = parser.parse()
+    except ErrorLimitReached:
+        pass
+    return ast, errors
+
+# the TokenBuffer for a FlatTree AST and the tokens to parse, which fill it as they are read.
+# the scan stops where the parser does, so flat and streamed runs find the same errors in the same order
+def new_buffer(text, engine, errors, recover):
+    if engine == "structural":
+        return scanning_buffer(text, errors, recover)
+    return TokenBuffer.scanning(text, errors, recover)
+
+# the tree builder for a Node AST
+def new_tree(pack_numbers=None):
+    return PackedTree(pack_numbers) if pack_numbers is not None else NodeTree()
+
+# runs the semantic parser with instruments counting the tokens and nodes that go through it.
+# streamed tokens are scanned while they are parsed, so the time spent scanning is taken out of the parse time
+def instrumented_parse(instruments, tokens, tree, rules, errors, streamed):
+    if rules is None:
+        rules = RuleSet(timed=True)
+    rule_seconds = sum(stats["seconds"] or 0.0 for stats in rules.stats().values())
+    tokens = instruments.count_tokens(tokens, timed=streamed)
+
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    ast = Parser(tokens=tokens, tree=instruments.count_tree(tree), rules=rules, errors=errors).parse()
+    wall = time.perf_counter() - wall
+    cpu = time.process_time() - cpu
+
+    if streamed:
+        instruments.add_time("scan", tokens.seconds)
+        instruments.add_time("parse", wall - tokens.seconds)
+    else:
+        instruments.add_time("parse", wall, cpu)
+    if rules.timed:
+        instruments.add_time("semantic", sum(stats["seconds"] for stats in rules.stats().values()) - rule_seconds)
+    return ast
+
+if __name__ == "__main__":
+    json_location = "sample inputs scanner/input8.json"
+    error_output_file = "errors.txt"
+    output_file = "output.txt"
+
+    ast, errors = compile_file(json_location)
+
+    with open(error_output_file, 'w') as file:
+        file.write("ERROR LIST:\n")
+        for error in errors:
+            file.write(error + "\n")
+
+    for error in errors:
+        print(error)
+
+    if len(errors) == 0: # create AST only if there are no errors
+        with open(output_file, 'w') as file:
+            ast.print_tree(file)
+    else: # errors found!
+        open(output_file, 'w').close() # erase content of output file in case a previous trial had AST output
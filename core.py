@@ -0,0 +1,121 @@
+# shared core for the scanner, parser and semantic parser
+# these classes used to be copied into each part of the compiler, they now live here
+# so that tokens produced by the scanner can be handed straight to either parser
+
+class TokenType:  # JSON token types
+    LBRACE = '{'  # '{'
+    RBRACE = '}'  # '}'
+    LBRACKET = '['  # '['
+    RBRACKET = ']'  # ']'
+    COMMA = ','  # ','
+    COLON = ':'  # ':'
+    STRING = 'STRING'  # strings
+    NUMBER = 'NUMBER'  # numeric values
+    BOOL_TRUE = 'BOOL_TRUE'  # true
+    BOOL_FALSE = 'BOOL_FALSE'  # false
+    NULL = 'NULL'  # null
+    EOF = 'EOF'  # end of input
+
+class Token:
+    def __init__(self, type_, value=None):
+        self.type = type_
+        self.value = value
+
+    def __repr__(self):
+        if self.value is not None:
+            return f"<{self.type}, {self.value}>"
+        return f"<{self.type}>"
+
+# raised by an ErrorCollector once it holds max_errors errors, the run stops there
+class ErrorLimitReached(Exception):
+    pass
+
+# the errors of one run. every stage of the run (scanner, parser, semantic checks) gets the same collector
+# instead of a module level list, so runs never share errors, not even two at once in one process.
+# it is a list, so anything that reads an error list reads it the same way.
+# with max_errors the run is stopped as soon as that many errors are found (max_errors=1 stops at the first one),
+# stopped says whether that happened
+class ErrorCollector(list):
+    # class level defaults, unpickling adds the errors back before it sets the attributes
+    max_errors = None
+    stopped = False
+
+    def __init__(self, max_errors=None):
+        super().__init__()
+        if max_errors is not None and max_errors < 1:
+            raise ValueError(f"max_errors must be at least 1, not {max_errors}")
+        self.max_errors = max_errors
+
+    def append(self, message):
+        super().append(message)
+        if self.max_errors is not None and len(self) >= self.max_errors:
+            self.stopped = True
+            raise ErrorLimitReached(f"Stopped after {len(self)} error(s)")
+
+# errors go here when a run isn't given its own list, for the scanner, both parsers and everything built on them
+errors = []
+
+def default_errors():
+    return errors
+
+class Node:
+    __slots__ = ('label', 'children', 'is_leaf', 'token_type')  # no per-node __dict__, trees get big
+
+    def __init__(self, label=None, is_leaf=False, token_type=None):
+        self.label = label # value of the node
+        self.children = [] # child nodes of a node on the tree (leaves should have an empty list)
+        self.is_leaf = is_leaf
+        self.token_type = token_type  # token type to distinguish terminal symbols
+
+    def add_child(self, child):
+        self.children.append(child)
+
+    # the parse tree prints leaves as "TYPE: value" while the AST only prints the value
+    # see serialize.write_text, which walks the tree with an explicit stack and writes the lines in batches
+    def print_tree(self, file, depth=0, show_types=False):
+        from serialize import write_text # imported here since serialize needs this module first
+        write_text(self, file, depth, show_types)
+
+# the semantic parser hands every node it finds to a tree builder instead of making Node objects itself,
+# so other representations of the AST (see flattree.FlatTree) can come out of the same parser.
+# index is the index of the token the node starts (or, for close, ends) at
+class NodeTree:
+    def __init__(self):
+        self.root = Node()  # holds the top level value until parsing is done
+
+    def add_container(self, parent, label, index):
+        node = Node(label=label)
+        parent.add_child(node)
+        return node
+
+    def add_leaf(self, parent, token_type, value, index):
+        parent.add_child(Node(label=value, is_leaf=True, token_type=token_type))
+
+    # a value was expected but the token can't start one
+    def add_missing(self, parent, index):
+        parent.add_child(None)
+
+    def close(self, node, index):
+        pass
+
+    def result(self):
+        return self.root.children[0]
+
+# have to read tokens somehow, so we do it quickly with this function
+# tokens are read from a file which contains scanner output, one "<TYPE, value>" per line,
+# or from a binary file written by TokenBuffer.save, which is loaded as is and handed out one token at a time
+def read_tokens(token_file):
+    from tokenbuffer import MAGIC, TokenBuffer # imported here since tokenbuffer needs this module first
+    with open(token_file, "rb") as file:
+        if file.read(len(MAGIC)) == MAGIC:
+            return TokenBuffer.load(token_file)
+    tokens = []
+    with open(token_file, "r") as file:
+        for line in file:
+            line = line.strip()
+            if line.startswith("<") and line.endswith(">"):
+                parts = line[1:-1].split(", ", 1)
+                tokenType = parts[0]
+                tokenValue = parts[1] if len(parts) > 1 else None
+                tokens.append(Token(tokenType, tokenValue))
+    return tokens
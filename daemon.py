@@ -0,0 +1,387 @@
+# long running validation service, so callers don't pay for a new python process (and its imports) every time
+# an asyncio front end takes requests over localhost http or a unix domain socket and hands the scanning and
+# semantic checks (events.validate_json, the same errors compile_json finds) to a pool of worker processes
+# that are started, and have every module imported, before the first request comes in.
+#
+#   POST /validate[?max_errors=N&recover=1]  the body is the json document, answers {"errors": [...]}
+#   GET  /stats                              queue depth, counters and latency percentiles
+#   GET  /health                             {"ok": true}
+#
+# small requests (up to small_size bytes) are batched: they wait up to batch_delay for others to come in
+# and go to a worker together, batch_size at a time, so the pool isn't flooded with tiny jobs. bigger
+# requests go to a worker on their own. once max_pending requests are waiting for an answer, or have jobs
+# still waiting in the batch or the pool, new ones are turned away with 503 (backpressure). a request that
+# isn't answered within timeout gets 504, but its job still counts until it finishes in the worker (there is
+# no stopping a job another process is running). when a worker dies the pool is started again, and the
+# requests whose jobs were in the broken pool get 503.
+# connections are kept open between requests unless the client says otherwise.
+#
+#   python daemon.py --port 8765 --workers 4
+#   python daemon.py --unix /tmp/jsonc.sock
+#   curl -s --data-binary @payload.json localhost:8765/validate
+
+import argparse
+import asyncio
+import json
+import os
+import signal
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from urllib.parse import urlsplit, parse_qs
+
+from events import validate_json
+from rules import RuleSet
+
+SMALL_SIZE = 16 << 10
+BATCH_SIZE = 64
+BATCH_DELAY = 0.002 # seconds
+MAX_PENDING = 1024
+TIMEOUT = 30.0 # seconds
+MAX_BODY = 64 << 20
+# latencies of the last this many requests are kept for the percentiles
+LATENCY_WINDOW = 10000
+
+STATUS_TEXT = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    411: "Length Required",
+    413: "Payload Too Large",
+    431: "Request Header Fields Too Large",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
+    504: "Gateway Timeout",
+}
+
+# the rules.RuleSet of this worker process, kept between jobs
+worker_rules = None
+
+# runs in every worker process when the pool starts. a forked worker shares the event loop's signal wakeup fd,
+# so a SIGTERM it gets (a broken pool terminates its workers) would look like one sent to the daemon
+def init_worker():
+    global worker_rules
+    signal.set_wakeup_fd(-1)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    worker_rules = RuleSet()
+
+# makes the pool start a worker, and has it run the whole pipeline once
+def warm_up():
+    validate_json('{"a": [1, "b", null]}', rules=worker_rules)
+    return os.getpid()
+
+# runs in a worker, jobs are (body bytes, max_errors, recover). bodies are decoded like scanner.iter_file_tokens does
+def validate_batch(jobs):
+    return [list(validate_json(body.decode("utf-8", errors="replace"), rules=worker_rules,
+                               max_errors=max_errors, recover=recover))
+            for body, max_errors, recover in jobs]
+
+# answered with status and {"error": message}, and the connection is closed
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+# nearest rank percentiles of values (sorted), in milliseconds
+def percentiles(values, points=(50, 90, 99)):
+    if not values:
+        return {f"p{point}": None for point in points} | {"max": None}
+    result = {}
+    for point in points:
+        rank = max(1, -(-point * len(values) // 100))
+        result[f"p{point}"] = round(values[rank - 1] * 1000, 3)
+    result["max"] = round(values[-1] * 1000, 3)
+    return result
+
+class Daemon:
+    def __init__(self, workers=None, max_pending=MAX_PENDING, timeout=TIMEOUT, batch_size=BATCH_SIZE,
+                 batch_delay=BATCH_DELAY, small_size=SMALL_SIZE):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.small_size = small_size
+        self.pool = None
+        self.batch = [] # (job, future) of the small requests waiting to be sent
+        self.timer = None # sends the batch when batch_delay is up
+        self.pending = 0 # requests taken and not answered yet
+        self.queued = 0 # requests whose jobs are in the batch or the pool, answered or not
+        self.running = 0 # jobs handed to the pool and not back yet
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.started = time.monotonic()
+        self.counters = {
+            "requests": 0,
+            "rejected": 0,
+            "timeouts": 0,
+            "failed": 0,
+            "batches": 0,
+            "batched_requests": 0,
+            "pool_restarts": 0,
+        }
+
+    # starts every worker up front, so the first requests don't wait for processes to start
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        self.new_pool()
+        await asyncio.gather(*(loop.run_in_executor(self.pool, warm_up) for _ in range(self.workers)))
+
+    def new_pool(self):
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=init_worker)
+
+    def close(self):
+        if self.timer is not None:
+            self.timer.cancel()
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+
+    # the errors for one document, see the top of the file for batching, backpressure and timeouts
+    async def validate(self, body, max_errors=None, recover=False):
+        if max(self.pending, self.queued) >= self.max_pending:
+            self.counters["rejected"] += 1
+            raise HttpError(503, "Too many requests waiting, try again later")
+        self.pending += 1
+        self.queued += 1
+        self.counters["requests"] += 1
+        start = time.perf_counter()
+        job = (body, max_errors, recover)
+        try:
+            if len(body) <= self.small_size:
+                future = asyncio.get_running_loop().create_future()
+                self.batch.append((job, future))
+                if len(self.batch) >= self.batch_size:
+                    self.flush()
+                elif self.timer is None:
+                    self.timer = asyncio.get_running_loop().call_later(self.batch_delay, self.flush)
+            else:
+                future = self.submit([job], None)
+            try:
+                errors = await asyncio.wait_for(future, self.timeout)
+            except asyncio.TimeoutError:
+                self.counters["timeouts"] += 1
+                raise HttpError(504, f"Not done after {self.timeout} seconds")
+            self.latencies.append(time.perf_counter() - start)
+            return errors
+        finally:
+            self.pending -= 1
+
+    # sends the waiting small requests to the pool as one job
+    def flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        batch, self.batch = self.batch, []
+        if batch:
+            self.counters["batches"] += 1
+            self.counters["batched_requests"] += len(batch)
+            self.submit([job for job, future in batch], [future for job, future in batch])
+
+    # runs jobs in the pool. with futures every one of them gets its own result,
+    # without the result of the only job is what the returned future gives
+    def submit(self, jobs, futures):
+        loop = asyncio.get_running_loop()
+        pool = self.pool
+        try:
+            done = loop.run_in_executor(pool, validate_batch, jobs)
+        except BrokenProcessPool: # a worker died since the last job came back, and nothing noticed yet
+            self.restart(pool)
+            pool = self.pool
+            done = loop.run_in_executor(pool, validate_batch, jobs)
+        self.running += 1
+        result = loop.create_future() if futures is None else None
+        waiting = futures if futures is not None else [result]
+
+        def finished(done):
+            self.running -= 1
+            self.queued -= len(jobs)
+            if not done.cancelled() and isinstance(done.exception(), BrokenProcessPool):
+                self.restart(pool)
+                self.counters["failed"] += len(waiting)
+                error = HttpError(503, "A worker stopped while validating, try again")
+                for future in waiting:
+                    if not future.done():
+                        future.set_exception(error)
+                return
+            if done.cancelled() or done.exception() is not None:
+                self.counters["failed"] += len(waiting)
+                error = HttpError(500, f"Validation failed: {done.exception() if not done.cancelled() else 'cancelled'}")
+                for future in waiting:
+                    if not future.done():
+                        future.set_exception(error)
+                return
+            for future, errors in zip(waiting, done.result()):
+                if not future.done(): # a request that timed out isn't waiting any more
+                    future.set_result(errors)
+
+        done.add_done_callback(finished)
+        return result
+
+    # starts a new pool in place of pool once one of its workers died (a broken pool shuts itself down). every
+    # job still in it fails with BrokenProcessPool, so this is called once for each and only the first starts one
+    def restart(self, pool):
+        if pool is not self.pool:
+            return
+        self.counters["pool_restarts"] += 1
+        self.new_pool()
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "uptime": round(time.monotonic() - self.started, 3),
+            "pending": self.pending,
+            "queued": self.queued,
+            "waiting_in_batch": len(self.batch),
+            "running_jobs": self.running,
+            "max_pending": self.max_pending,
+            **self.counters,
+            "latency_ms": percentiles(sorted(self.latencies)),
+        }
+
+    # one connection, request after request until the client closes it or asks to
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await read_request(reader)
+                    if request is None:
+                        break
+                    method, target, headers, body = request
+                    keep_alive = headers.get("connection", "").lower() != "close"
+                    status, payload = await self.route(method, target, body)
+                except HttpError as e:
+                    status, payload, keep_alive = e.status, {"error": e.message}, False
+                write_response(writer, status, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def route(self, method, target, body):
+        url = urlsplit(target)
+        if url.path == "/validate":
+            if method != "POST":
+                raise HttpError(405, "Use POST for /validate")
+            query = parse_qs(url.query)
+            try:
+                max_errors = int(query["max_errors"][0]) if "max_errors" in query else None
+            except ValueError:
+                raise HttpError(400, "max_errors must be a number")
+            if max_errors is not None and max_errors < 1:
+                raise HttpError(400, "max_errors must be at least 1")
+            recover = query.get("recover", ["0"])[0].lower() in ("1", "true", "yes")
+            return 200, {"errors": await self.validate(body, max_errors, recover)}
+        if url.path == "/stats" or url.path == "/health":
+            if method != "GET":
+                raise HttpError(405, f"Use GET for {url.path}")
+            return 200, self.stats() if url.path == "/stats" else {"ok": True}
+        raise HttpError(404, f"Nothing at {url.path}")
+
+# the next line of the request head. a line longer than the reader's limit (64 KiB by default) is answered
+# with status instead of ending the connection without a response
+async def read_line(reader, status, message):
+    try:
+        return await reader.readline()
+    except (ValueError, asyncio.LimitOverrunError):
+        raise HttpError(status, message)
+
+# (method, target, headers, body) of the next request on the connection, None once the client is done
+async def read_request(reader):
+    line = await read_line(reader, 400, "Request line too long")
+    if not line.strip():
+        return None
+    parts = line.decode("latin-1").split()
+    if len(parts) != 3:
+        raise HttpError(400, "Malformed request line")
+    method, target, version = parts
+    headers = {}
+    while True:
+        line = await read_line(reader, 431, "Header line too long")
+        if not line:
+            raise asyncio.IncompleteReadError(b"", None)
+        if line in (b"\r\n", b"\n"):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    if headers.get("transfer-encoding", "identity").lower() != "identity":
+        raise HttpError(411, "Send the body with a Content-Length")
+    try:
+        length = int(headers.get("content-length", 0))
+    except ValueError:
+        raise HttpError(400, "Bad Content-Length")
+    if length < 0:
+        raise HttpError(400, "Bad Content-Length")
+    if length > MAX_BODY:
+        raise HttpError(413, f"Bodies are limited to {MAX_BODY} bytes")
+    body = await reader.readexactly(length) if length else b""
+    if version == "HTTP/1.0" and headers.get("connection", "").lower() != "keep-alive":
+        headers["connection"] = "close"
+    return method, target, headers, body
+
+def write_response(writer, status, payload, keep_alive):
+    body = json.dumps(payload).encode("utf-8")
+    head = (f"HTTP/1.1 {status} {STATUS_TEXT[status]}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n")
+    if status == 503:
+        head += "Retry-After: 1\r\n"
+    writer.write(head.encode("latin-1") + b"\r\n" + body)
+
+# SIGTERM stops the server the same way ctrl-c does, so the workers and the socket file are cleaned up
+async def serve(daemon, host="127.0.0.1", port=8765, unix=None, ready=None):
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    except NotImplementedError: # no signal handlers in windows event loops
+        pass
+    await daemon.start()
+    if unix is not None:
+        if os.path.exists(unix):
+            os.remove(unix) # left behind by a daemon that didn't shut down
+        server = await asyncio.start_unix_server(daemon.handle, path=unix)
+    else:
+        server = await asyncio.start_server(daemon.handle, host, port)
+    if ready is not None:
+        ready(server)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        daemon.close()
+        if unix is not None and os.path.exists(unix):
+            os.remove(unix)
+
+def main(argv=None):
+    arguments = argparse.ArgumentParser(description="Serve json validation over http.")
+    arguments.add_argument("--host", default="127.0.0.1")
+    arguments.add_argument("--port", type=int, default=8765)
+    arguments.add_argument("--unix", help="listen on this unix domain socket instead of host and port")
+    arguments.add_argument("--workers", type=int, default=None, help="worker processes (default: one per cpu)")
+    arguments.add_argument("--max-pending", type=int, default=MAX_PENDING, help=f"requests waiting at most, more get 503 (default: {MAX_PENDING})")
+    arguments.add_argument("--timeout", type=float, default=TIMEOUT, help=f"seconds a request may take, then it gets 504 (default: {TIMEOUT})")
+    arguments.add_argument("--batch-size", type=int, default=BATCH_SIZE, help=f"small requests sent to a worker at a time (default: {BATCH_SIZE})")
+    arguments.add_argument("--batch-delay", type=float, default=BATCH_DELAY * 1000, help=f"milliseconds a small request waits for others (default: {BATCH_DELAY * 1000:g})")
+    arguments.add_argument("--small-size", type=int, default=SMALL_SIZE, help=f"requests up to this many bytes are batched (default: {SMALL_SIZE})")
+    options = arguments.parse_args(argv)
+
+    daemon = Daemon(options.workers, options.max_pending, options.timeout, options.batch_size,
+                    options.batch_delay / 1000, options.small_size)
+
+    def ready(server):
+        where = options.unix or f"http://{options.host}:{options.port}"
+        print(f"Listening on {where} with {daemon.workers} worker(s)", file=sys.stderr)
+
+    try:
+        asyncio.run(serve(daemon, options.host, options.port, options.unix, ready))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,182 @@
+# event based (SAX style) validation, for when only the errors are wanted and not the AST
+# iter_events walks the tokens with the same grammar as the semantic parser, but instead of building
+# nodes it hands out one event per thing it finds, as (event, token_type, value, token index):
+#   "start_object" / "end_object"  - a dict was opened / closed (end events also come at EOF)
+#   "start_array" / "end_array"    - the same for a list
+#   "key"                          - a dict key (a STRING token)
+#   "value"                        - a STRING, NUMBER, true, false or null value
+#   "missing"                      - a value was expected but the token can't start one
+# events can be pulled from iter_events, or pushed into a handler with push_events.
+#
+# Validator is a handler that runs the semantic rules on the events, it finds the same errors
+# in the same order as semanticparser.Parser. it only keeps one frame per open dict or list,
+# so memory follows the nesting depth of the document instead of its size.
+# with fail_fast=True it stops at the first error (lexer errors included), and nothing after it is scanned.
+# validate_json and validate_file also take max_errors, to stop after that many, and recover (see scanner.BAD_RUN).
+#
+#   errors = validate_json(text, fail_fast=True)
+
+from core import TokenType, Token, ErrorCollector, ErrorLimitReached
+from rules import RuleSet
+from scanner import ENGINES, Lexer, iter_file_tokens
+from semanticparser import VALUE, DICT, DICT_NEXT, LIST, LIST_NEXT, LEAF_TYPES
+
+# tokens are pulled one at a time, the steps are the same as in semanticparser.Parser.parse
+def iter_events(tokens):
+    tokens = iter(tokens)
+    eof = Token(TokenType.EOF)
+    token = next(tokens, None) or eof
+    index = 0
+    stack = [(VALUE, None)]
+    while stack:
+        step, start = stack.pop()
+
+        if step == VALUE:
+            token_type = token.type
+            if token_type == TokenType.LBRACE:
+                yield "start_object", token_type, None, index
+                index += 1
+                token = next(tokens, None) or eof
+                stack.append((DICT, None))
+            elif token_type == TokenType.LBRACKET:
+                yield "start_array", token_type, None, index
+                index += 1
+                token = next(tokens, None) or eof
+                stack.append((LIST, None))
+            elif token_type in LEAF_TYPES:
+                yield "value", token_type, token.value, index
+                index += 1
+                token = next(tokens, None) or eof
+            else:
+                yield "missing", token_type, None, index # the token is left for the dict or list to deal with
+
+        elif step == DICT or step == DICT_NEXT:
+            if step == DICT_NEXT and token.type == TokenType.COMMA:
+                index += 1
+                token = next(tokens, None) or eof
+            if token.type == TokenType.RBRACE or token.type == TokenType.EOF:
+                yield "end_object", token.type, None, index
+                index += 1
+                token = next(tokens, None) or eof
+                continue
+
+            stack.append((DICT_NEXT, None))
+            if token.type == TokenType.STRING:
+                yield "key", token.type, token.value, index
+                index += 2 # the key and whatever stands where the ":" should be
+                token = next(tokens, None) or eof
+                token = next(tokens, None) or eof
+                stack.append((VALUE, None))
+            else:
+                index += 1
+                token = next(tokens, None) or eof
+
+        elif step == LIST or step == LIST_NEXT:
+            if step == LIST_NEXT:
+                if token.type == TokenType.COMMA:
+                    index += 1
+                    token = next(tokens, None) or eof
+                elif index == start and token.type != TokenType.RBRACKET:
+                    index += 1 # the token couldn't start a value, skip it so the list can carry on
+                    token = next(tokens, None) or eof
+            if token.type == TokenType.RBRACKET or token.type == TokenType.EOF:
+                yield "end_array", token.type, None, index
+                index += 1
+                token = next(tokens, None) or eof
+                continue
+
+            stack.append((LIST_NEXT, index))
+            stack.append((VALUE, None))
+
+# calls handler.<event>(token_type, value, index) for every event, until one of them returns True
+# then handler.finish(), if the handler has one
+def push_events(tokens, handler):
+    for event, token_type, value, index in iter_events(tokens):
+        if getattr(handler, event)(token_type, value, index):
+            break
+    finish = getattr(handler, "finish", None)
+    if finish is not None:
+        finish()
+
+# runs the rules of a rules.RuleSet on events, errors are appended to errors
+# each open dict keeps its key rule states and each open list its element rule states
+class Validator:
+    def __init__(self, rules=None, errors=None, fail_fast=False):
+        self.rules = rules if rules is not None else RuleSet()
+        self.errors = errors if errors is not None else []
+        self.fail_fast = fail_fast
+        self.stack = [] # (is a list, rule states) for every open dict and list
+
+    # a value starts here, if it's in a list it's checked as one of the list's elements
+    def element(self, token_type, index):
+        if self.stack and self.stack[-1][0]:
+            for rule, state in zip(self.rules.element_rules, self.stack[-1][1]):
+                rule.check_element(token_type, index, state, self.errors)
+
+    def leaf(self, token_type, value, index):
+        for rule in self.rules.leaf_table.get(token_type, ()):
+            rule.check_leaf(token_type, value, index, self.errors)
+
+    # every handler returns whether to stop. one token can cause more than one error,
+    # with fail_fast only the first one is kept
+    def stop(self):
+        if self.fail_fast and self.errors:
+            del self.errors[1:]
+            return True
+        return False
+
+    def start_object(self, token_type, value, index):
+        self.element(token_type, index)
+        self.stack.append((False, [rule.container_state() for rule in self.rules.key_rules]))
+        return self.stop()
+
+    def start_array(self, token_type, value, index):
+        self.element(token_type, index)
+        self.stack.append((True, [rule.container_state() for rule in self.rules.element_rules]))
+        return self.stop()
+
+    def end_object(self, token_type, value, index):
+        self.stack.pop()
+        return self.stop()
+
+    end_array = end_object
+
+    # keys go through the key rules and then the leaf rules, like the semantic parser does
+    def key(self, token_type, value, index):
+        for rule, state in zip(self.rules.key_rules, self.stack[-1][1]):
+            rule.check_key(value, index, state, self.errors)
+        self.leaf(token_type, value, index)
+        return self.stop()
+
+    def value(self, token_type, value, index):
+        self.element(token_type, index)
+        self.leaf(token_type, value, index)
+        return self.stop()
+
+    def missing(self, token_type, value, index):
+        self.element(token_type, index)
+        return self.stop()
+
+    # lexer errors can still come in after the last event
+    def finish(self):
+        self.stop()
+
+# the errors compile_json would find, without building the AST
+# lexer errors go into the same list, so they come out in the same order too.
+# fail_fast is the same as max_errors=1
+def validate_json(text, engine="regex", rules=None, fail_fast=False, max_errors=None, recover=False):
+    errors = ErrorCollector(1 if fail_fast else max_errors)
+    try:
+        push_events(ENGINES[engine]().iter_tokens(Lexer(text, errors, recover)), Validator(rules, errors))
+    except ErrorLimitReached:
+        pass
+    return errors
+
+# the same for a file, streamed with scanner.iter_file_tokens like compile_file
+def validate_file(path, rules=None, fail_fast=False, max_errors=None, recover=False):
+    errors = ErrorCollector(1 if fail_fast else max_errors)
+    try:
+        push_events(iter_file_tokens(path, errors=errors, recover=recover), Validator(rules, errors))
+    except ErrorLimitReached:
+        pass
+    return errors
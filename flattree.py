@@ -0,0 +1,153 @@
+# memory-efficient AST, an alternative to a tree of Node objects
+# every node is one slot in a set of parallel typed arrays: its kind, its parent, its first child,
+# its next sibling and the span of source text it covers. leaf labels are never stored, they are
+# sliced out of the source when asked for. FlatNode is a thin view over one slot with the same
+# label/is_leaf/token_type/children/print_tree surface as Node, so existing consumers can walk it.
+#
+# the tree is built by the semantic parser like any other tree builder:
+#   buffer = TokenBuffer.from_text(text)
+#   ast = Parser(tokens=buffer, tree=FlatTree(buffer)).parse()
+
+from array import array
+
+from core import TokenType
+
+# node kinds, leaves use the token type they were made from
+DICT = 0
+LIST = 1
+PAIR = 2
+STRING = 3
+NUMBER = 4
+BOOL_TRUE = 5
+BOOL_FALSE = 6
+NULL = 7
+MISSING = 8 # a value was expected but the token couldn't start one
+ROOT = 9 # holds the top level value
+
+CONTAINER_KINDS = {"dict": DICT, "list": LIST, "pair": PAIR}
+LABELS = ["dict", "list", "pair"]
+LEAF_KINDS = {
+    TokenType.STRING: STRING,
+    TokenType.NUMBER: NUMBER,
+    TokenType.BOOL_TRUE: BOOL_TRUE,
+    TokenType.BOOL_FALSE: BOOL_FALSE,
+    TokenType.NULL: NULL,
+}
+TOKEN_TYPES = {kind: token_type for token_type, kind in LEAF_KINDS.items()}
+
+class FlatTree:
+    # buffer is the TokenBuffer the parser reads from, token indices are turned into source offsets with it
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self.source = buffer.source
+        self.kinds = array('B')
+        self.parents = array('i')
+        self.first_child = array('i')
+        self.next_sibling = array('i')
+        self.starts = array(buffer.starts.typecode)
+        self.ends = array(buffer.ends.typecode)
+        self.last_child = array('i') # only needed while the tree is built
+        self.root = self.new_node(ROOT, -1, 0, len(self.source))
+
+    def __len__(self):
+        return len(self.kinds) - 1 # without the root
+
+    def new_node(self, kind, parent, start, end):
+        index = len(self.kinds)
+        self.kinds.append(kind)
+        self.parents.append(parent)
+        self.first_child.append(-1)
+        self.next_sibling.append(-1)
+        self.last_child.append(-1)
+        self.starts.append(start)
+        self.ends.append(end)
+        if parent >= 0:
+            last = self.last_child[parent]
+            if last < 0:
+                self.first_child[parent] = index
+            else:
+                self.next_sibling[last] = index
+            self.last_child[parent] = index
+        return index
+
+    # builder interface used by the semantic parser, see core.NodeTree
+    def add_container(self, parent, label, index):
+        start = self.buffer.starts[index]
+        return self.new_node(CONTAINER_KINDS[label], parent, start, start)
+
+    def add_leaf(self, parent, token_type, value, index):
+        self.new_node(LEAF_KINDS[token_type], parent, self.buffer.starts[index], self.buffer.ends[index])
+
+    def add_missing(self, parent, index):
+        start = self.buffer.starts[index] if index < len(self.buffer) else len(self.source)
+        self.new_node(MISSING, parent, start, start)
+
+    def close(self, node, index):
+        self.ends[node] = self.buffer.ends[index] if index < len(self.buffer) else len(self.source)
+
+    # the token buffer and the build-only column aren't needed once parsing is done
+    def result(self):
+        self.buffer = None
+        self.last_child = None
+        first = self.first_child[self.root]
+        if first < 0 or self.kinds[first] == MISSING:
+            return None
+        return FlatNode(self, first)
+
+    def label(self, index):
+        kind = self.kinds[index]
+        if kind < STRING:
+            return LABELS[kind]
+        return self.source[self.starts[index]:self.ends[index]]
+
+    def children(self, index):
+        child = self.first_child[index]
+        while child >= 0:
+            yield child
+            child = self.next_sibling[child]
+
+    # a pair ends where its value does
+    def span(self, index):
+        if self.kinds[index] == PAIR:
+            last = index
+            for child in self.children(index):
+                last = child
+            return self.starts[index], self.span(last)[1] if last != index else self.ends[index]
+        return self.starts[index], self.ends[index]
+
+    # same output as Node.print_tree, walked straight over the arrays (see serialize.iter_flat_text_lines)
+    def print_tree(self, file, index, depth=0, show_types=False):
+        from serialize import write_text # imported here since serialize needs this module first
+        write_text(FlatNode(self, index), file, depth, show_types)
+
+class FlatNode:
+    __slots__ = ('tree', 'index')
+
+    def __init__(self, tree, index):
+        self.tree = tree
+        self.index = index
+
+    @property
+    def label(self):
+        return self.tree.label(self.index)
+
+    @property
+    def is_leaf(self):
+        return STRING <= self.tree.kinds[self.index] <= NULL
+
+    @property
+    def token_type(self):
+        return TOKEN_TYPES.get(self.tree.kinds[self.index])
+
+    # missing values show up as None, like they do in a Node tree
+    @property
+    def children(self):
+        return [FlatNode(self.tree, child) if self.tree.kinds[child] != MISSING else None
+                for child in self.tree.children(self.index)]
+
+    @property
+    def span(self):
+        return self.tree.span(self.index)
+
+    def print_tree(self, file, depth=0, show_types=False):
+        self.tree.print_tree(file, self.index, depth, show_types)
@@ -0,0 +1,830 @@
+# incremental re-validation of a document that is edited over and over (e.g. checked on every save)
+# a Document keeps everything a full run worked out: the tokens with their offsets, the lexer errors
+# found in front of each token, the span and parent of every dict and list, which tokens are keys and
+# values, and the semantic errors found at each token. an edit (offset, deleted length, inserted text) then
+#   1. re-lexes from the token in front of the edit until the new tokens line up with the old ones again,
+#   2. re-parses only the elements (or key/value pairs) of the smallest dict or list around the changed tokens,
+#      from the comma or key in front of them until the parse lines up with one of the old ones after them,
+#      re-running the rules for those only. the dict's or list's own checks (Type 5 and 6) are worked out again
+#      from what it keeps about the rest: the count of every key, or the first element's type and where the
+#      first one of another type is. only when the changed tokens take in one of its brackets is its parent
+#      re-parsed (and so on outwards). when the changed tokens have the same types as before (e.g. typing
+#      inside a string or number) the structure can't have changed, so only the leaf rules of those are run again.
+# errors hold token indices and character positions, so they are kept split around the number and put
+# back together when asked for, and the error list is always the same as compile_json(doc.text) gives.
+#
+# tokens are kept in blocks of up to BLOCK_SIZE, every block with its own first token index and character
+# offset, so an edit only rebuilds the blocks it touches and moves the bases of the ones after it.
+# an edit costs about the same no matter how big the document or the dict or list it's in is, unless it
+# changes what comes after it to the end (e.g. a quote or bracket that is never closed), or the Type 5 or 6
+# checks of the rest of its dict or list (a key that is in the dict somewhere else, a new first element).
+#
+#   doc = Document(text)
+#   errors = doc.edit(120, 1, "x")
+
+import bisect
+import re
+from array import array
+from collections import Counter
+from itertools import chain
+
+from core import Token, TokenType
+from events import Validator, iter_events
+from rules import DuplicateKey, ListTypes, RuleSet
+from scanner import SHARED_TOKENS
+from semanticparser import LEAF_TYPES
+from tokenbuffer import TYPES, CODES, STRING, NUMBER, iter_spans
+
+BLOCK_SIZE = 1024
+
+# what the parser made of a token
+OTHER = 0
+VALUE = 1
+KEY = 2
+
+SHARED_BY_CODE = {CODES[token.type]: token for token in SHARED_TOKENS.values()}
+COMMA = CODES[TokenType.COMMA]
+LBRACKET = CODES[TokenType.LBRACKET]
+RBRACKET = CODES[TokenType.RBRACKET]
+OPENING = {CODES[TokenType.LBRACE], LBRACKET}
+LEAVES = {CODES[token_type] for token_type in LEAF_TYPES}
+
+LEXER_POSITION = re.compile(r"(.*at position )(\d+)(.*)", re.DOTALL)
+
+# lexer errors are kept as (text before the position, position, text after it)
+def split_lexer_error(message):
+    found = LEXER_POSITION.match(message)
+    if found is None:
+        return message, None, None
+    return found.group(1), int(found.group(2)), found.group(3)
+
+# rule errors are kept as (text before the token index, text after it, came from a leaf rule)
+# every built-in message ends with "at Token N" (Type 1 and 3 too), so the index moves with the token when
+# the blocks before it change. a custom rule's message without the index in it keeps None for the text after it
+def split_rule_error(message, index, leaf):
+    head, marker, tail = message.rpartition(f"at Token {index}")
+    if not marker:
+        return message, None, leaf
+    return head + "at Token ", tail, leaf
+
+class Block:
+    __slots__ = ('index', 'offset', 'types', 'starts', 'ends', 'roles', 'lexer', 'rules', 'containers', 'formatted')
+
+    def __init__(self, index, offset):
+        self.index = index # index of the block's first token
+        self.offset = offset # starts, ends and lexer error positions are relative to this
+        self.types = array('B')
+        self.starts = array('q')
+        self.ends = array('q')
+        self.roles = array('B')
+        self.lexer = {} # local index -> lexer errors found while scanning that token
+        self.rules = {} # local index -> rule errors found at that token
+        self.containers = {} # local index -> Container starting at that token
+        self.formatted = None # (index, offset, error messages), see Document.block_errors
+
+# a dict or list, found at block.index + local and ending length tokens later.
+# a list also keeps what Type 6 needs to know about its elements, a dict the count of each of its keys
+# (worked out the first time an edit inside it needs them), so an edit of a few elements can be checked
+# against the rest without going over them again
+class Container:
+    __slots__ = ('block', 'local', 'length', 'parent', 'first', 'mismatch', 'others', 'keys')
+
+    def __init__(self, parent):
+        self.block = None
+        self.local = 0
+        self.length = 0
+        self.parent = parent
+        self.first = None # type of the first element
+        self.mismatch = None # how many tokens after the start the first element of another type is
+        self.others = 0 # elements of another type than the first
+        self.keys = None # key -> how often it's in the dict
+
+    @property
+    def start(self):
+        return self.block.index + self.local
+
+    @property
+    def end(self):
+        return self.block.index + self.local + self.length
+
+# runs the rules like Validator does, but records which token every error was found at,
+# and the structure (containers, keys and values) of what it parsed. base is the index of the first token,
+# with children the elements (token index, type) or keys (token index, key) of the first container are kept too
+class Recorder(Validator):
+    def __init__(self, rules, base, children=False):
+        super().__init__(rules)
+        self.base = base
+        self.found = {} # token index -> rule errors
+        self.roles = [] # (token index, role)
+        self.containers = [] # (token index, Container)
+        self.children = [] if children else None
+        self.open = []
+        self.kind = None # what the first value was: "container", "leaf" or "missing"
+        self.close = None # where the first value ended
+
+    def record(self, index, before, leaf):
+        if len(self.errors) > before:
+            entries = self.found.setdefault(index, [])
+            for message in self.errors[before:]:
+                entries.append(split_rule_error(message, index, leaf))
+            del self.errors[before:]
+
+    def element(self, token_type, index):
+        before = len(self.errors)
+        super().element(token_type, index)
+        self.record(index, before, False)
+        if self.stack and self.stack[-1][0]:
+            start, container = self.open[-1]
+            if container.first is None:
+                container.first = token_type
+            elif token_type != container.first:
+                if not container.others:
+                    container.mismatch = index - start
+                container.others += 1
+            if self.children is not None and len(self.open) == 1:
+                self.children.append((index, token_type))
+
+    def leaf(self, token_type, value, index):
+        before = len(self.errors)
+        super().leaf(token_type, value, index)
+        self.record(index, before, True)
+
+    def start_value(self, kind, index):
+        if self.kind is None:
+            self.kind = kind
+            if kind != "container":
+                self.close = index
+
+    def start_container(self, index):
+        self.start_value("container", index)
+        container = Container(self.open[-1][1] if self.open else None)
+        self.containers.append((index, container))
+        self.open.append((index, container))
+
+    def start_object(self, token_type, value, index):
+        index += self.base
+        super().start_object(token_type, value, index)
+        self.start_container(index)
+
+    def start_array(self, token_type, value, index):
+        index += self.base
+        super().start_array(token_type, value, index)
+        self.start_container(index)
+
+    def end_object(self, token_type, value, index):
+        index += self.base
+        super().end_object(token_type, value, index)
+        start, container = self.open.pop()
+        container.length = index - start
+        if not self.open:
+            self.close = index
+
+    end_array = end_object
+
+    def key(self, token_type, value, index):
+        index += self.base
+        self.roles.append((index, KEY))
+        if self.children is not None and len(self.open) == 1:
+            self.children.append((index, value))
+        before = len(self.errors)
+        for rule, state in zip(self.rules.key_rules, self.stack[-1][1]):
+            rule.check_key(value, index, state, self.errors)
+        self.record(index, before, False)
+        self.leaf(token_type, value, index)
+
+    def value(self, token_type, value, index):
+        index += self.base
+        self.start_value("leaf", index)
+        self.roles.append((index, VALUE))
+        super().value(token_type, value, index)
+
+    def missing(self, token_type, value, index):
+        index += self.base
+        self.start_value("missing", index)
+        super().missing(token_type, value, index)
+
+class Document:
+    def __init__(self, text, rules=None):
+        self.text = text
+        self.rules = rules if rules is not None else RuleSet()
+        self.blocks = []
+        self.bases = [] # first token index of every block, for bisect
+        self.count = 0
+        self.root = None # the top level Container, when the top level value is a dict or list
+        self.kind = None
+        records, self.eof_lexer = self.scan(0)
+        self.splice(0, 0, records, 0, self.eof_lexer)
+        self.parse_all()
+
+    # scans self.text from pos into records [type code, start, end, role, lexer errors, rule errors, container].
+    # resync(start) is asked about every token, the scan stops after the first one it says yes to.
+    # also returns the lexer errors after the last token, or None when the scan was stopped
+    def scan(self, pos, resync=None):
+        errors = []
+        records = []
+        for code, start, end in iter_spans(self.text, pos, errors):
+            records.append([code, start, end, OTHER, [split_lexer_error(message) for message in errors], None, None])
+            del errors[:]
+            if resync is not None and resync(start - 1 if code == STRING else start):
+                return records, None
+        return records, [split_lexer_error(message) for message in errors]
+
+    def block_at(self, index):
+        return bisect.bisect_right(self.bases, index) - 1
+
+    def start_at(self, index):
+        block = self.blocks[self.block_at(index)]
+        local = index - block.index
+        start = block.offset + block.starts[local]
+        return start - 1 if block.types[local] == STRING else start # strings start at their quote
+
+    # first token that ends at or after offset (or self.count)
+    def first_ending_at(self, offset):
+        number = bisect.bisect_left(self.blocks, offset, key=lambda block: block.offset + block.ends[-1])
+        if number == len(self.blocks):
+            return self.count
+        block = self.blocks[number]
+        return block.index + bisect.bisect_left(block.ends, offset - block.offset)
+
+    # first token that starts at or after offset (or self.count)
+    def first_starting_at(self, offset):
+        number = bisect.bisect_left(self.blocks, offset, key=lambda block: block.offset + block.starts[-1])
+        if number == len(self.blocks):
+            return self.count
+        block = self.blocks[number]
+        index = block.index + bisect.bisect_left(block.starts, offset - block.offset)
+        if index < self.count and self.start_at(index) < offset:
+            index += 1
+        return index
+
+    # records of the tokens in [start, end) of block number, with absolute offsets moved by shift
+    def block_records(self, number, start, end, shift=0):
+        block = self.blocks[number]
+        offset = block.offset + shift
+        records = []
+        for local in range(start - block.index, end - block.index):
+            lexer = [(head, position if position is None else position + offset, tail)
+                     for head, position, tail in block.lexer.get(local, ())]
+            records.append([block.types[local], block.starts[local] + offset, block.ends[local] + offset,
+                            block.roles[local], lexer, block.rules.get(local), block.containers.get(local)])
+        return records
+
+    def make_blocks(self, records, index):
+        blocks = []
+        for first in range(0, len(records), BLOCK_SIZE):
+            part = records[first:first + BLOCK_SIZE]
+            block = Block(index + first, part[0][1])
+            offset = block.offset
+            for local, (code, start, end, role, lexer, rules, container) in enumerate(part):
+                block.types.append(code)
+                block.starts.append(start - offset)
+                block.ends.append(end - offset)
+                block.roles.append(role)
+                if lexer:
+                    block.lexer[local] = [(head, position if position is None else position - offset, tail)
+                                          for head, position, tail in lexer]
+                if rules:
+                    block.rules[local] = rules
+                if container is not None:
+                    block.containers[local] = container
+                    container.block = block
+                    container.local = local
+            blocks.append(block)
+        return blocks
+
+    # replaces the tokens in [start, end) with records. every offset after them moves by delta,
+    # eof is the new list of lexer errors after the last token (None if it didn't change).
+    # when as many tokens come in as go out, what the parser knew about the old ones is carried over
+    def splice(self, start, end, records, delta, eof=None):
+        count = len(records) - (end - start)
+        if self.blocks:
+            first = self.block_at(min(start, self.count - 1))
+            last = self.block_at(end - 1) if end > start else first
+            index = self.blocks[first].index
+            head = self.block_records(first, index, start)
+            old = [record for number in range(first, last + 1)
+                   for record in self.block_records(number, max(start, self.blocks[number].index),
+                                                    min(end, self.blocks[number].index + len(self.blocks[number].types)))]
+            tail = self.block_records(last, end, self.blocks[last].index + len(self.blocks[last].types), delta)
+        else:
+            first, last, index, head, old, tail = 0, -1, 0, [], [], []
+
+        if count == 0:
+            for record, before in zip(records, old):
+                record[3] = before[3]
+                record[5] = before[5]
+                record[6] = before[6]
+
+        blocks = self.make_blocks(head + records + tail, index)
+        self.blocks[first:last + 1] = blocks
+        for block in self.blocks[first + len(blocks):]:
+            block.index += count
+            block.offset += delta
+        self.bases = [block.index for block in self.blocks]
+        self.count += count
+        if eof is not None:
+            self.eof_lexer = eof
+        else:
+            self.eof_lexer = [(head, position if position is None else position + delta, tail)
+                              for head, position, tail in self.eof_lexer]
+
+    # Token objects for the tokens from start on, the way the scanner would hand them out
+    def iter_tokens(self, start):
+        text = self.text
+        number = self.block_at(start) if start < self.count else len(self.blocks)
+        local = start - self.blocks[number].index if number < len(self.blocks) else 0
+        for block in self.blocks[number:]:
+            offset, types, starts, ends = block.offset, block.types, block.starts, block.ends
+            for local in range(local, len(types)):
+                code = types[local]
+                if code == STRING or code == NUMBER:
+                    yield Token(TYPES[code], text[offset + starts[local]:offset + ends[local]])
+                else:
+                    yield SHARED_BY_CODE[code]
+            local = 0
+
+    # parses the value that starts at token start, with the rules run on the way
+    def parse_from(self, start):
+        recorder = Recorder(self.rules, start)
+        for event, token_type, value, index in iter_events(self.iter_tokens(start)):
+            getattr(recorder, event)(token_type, value, index)
+        return recorder
+
+    # drops what was known about the tokens in [start, end] and puts in what recorder found.
+    # the rule errors at start are kept unless it's the whole document, they belong to the parent
+    def apply(self, recorder, start, end, replaced=None):
+        if self.count:
+            for number in range(self.block_at(start), self.block_at(min(end, self.count - 1)) + 1):
+                block = self.blocks[number]
+                low = max(start - block.index, 0)
+                high = min(end - block.index, len(block.types) - 1)
+                for local in [local for local in block.containers if low <= local <= high]:
+                    del block.containers[local]
+                first_rule = low + 1 if replaced is not None and start == block.index + low else low
+                for local in [local for local in block.rules if first_rule <= local <= high]:
+                    del block.rules[local]
+                block.formatted = None
+                block.roles[low:high + 1] = array('B', bytes(high - low + 1))
+
+        for index, container in recorder.containers:
+            block = self.blocks[self.block_at(index)]
+            container.block = block
+            container.local = index - block.index
+            block.containers[container.local] = container
+        for index, entries in recorder.found.items():
+            block = self.blocks[self.block_at(index)]
+            block.rules[index - block.index] = entries
+            block.formatted = None
+        for index, role in recorder.roles:
+            block = self.blocks[self.block_at(index)]
+            block.roles[index - block.index] = role
+
+        if replaced is not None:
+            top = recorder.containers[0][1]
+            top.parent = replaced.parent
+            if replaced is self.root:
+                self.root = top
+
+    def parse_all(self):
+        recorder = self.parse_from(0)
+        self.apply(recorder, 0, self.count)
+        self.kind = recorder.kind
+        self.root = recorder.containers[0][1] if recorder.kind == "container" else None
+
+    # the tokens the parser looks at end before this one
+    def inspected(self):
+        return self.root.end + 1 if self.kind == "container" else 1
+
+    # the last token the parser takes from the scanner, the lexer errors up to it are the ones reported
+    def fetched(self):
+        if self.kind == "container":
+            return self.root.end + 1
+        return 1 if self.kind == "leaf" else 0
+
+    # the smallest container that starts before token start and doesn't end before token last
+    def enclosing(self, start, last):
+        if start == 0 or not self.blocks:
+            return None
+        number = self.block_at(start - 1)
+        limit = start - 1 - self.blocks[number].index
+        container = None
+        while number >= 0 and container is None:
+            containers = self.blocks[number].containers
+            found = [local for local in containers if local <= limit]
+            if found:
+                container = containers[max(found)]
+            number -= 1
+            limit = BLOCK_SIZE
+        while container is not None and container.end < last:
+            container = container.parent
+        return container
+
+    # re-parses container (moving out to its parents until one ends where it did before) or the whole document.
+    # count is how many tokens the edit added
+    def reparse(self, container, count):
+        while container is not None:
+            start = container.start
+            end = container.end + count
+            recorder = self.parse_from(start)
+            if recorder.close == end:
+                self.apply(recorder, start, end, container)
+                self.grow(recorder.containers[0][1].parent, start, count)
+                return
+            container = container.parent
+        self.parse_all()
+
+    # count tokens came in after token start, inside container and so inside all its parents
+    def grow(self, container, start, count):
+        while container is not None:
+            container.length += count
+            if container.mismatch is not None and container.start + container.mismatch > start:
+                container.mismatch += count
+            container = container.parent
+
+    def is_list(self, container):
+        return container.block.types[container.local] == LBRACKET
+
+    def type_at(self, index):
+        block = self.blocks[self.block_at(index)]
+        return TYPES[block.types[index - block.index]]
+
+    # the child of container that token index is in (or starts), None when the token is container's own
+    def child_at(self, container, index):
+        child = self.enclosing(index + 1, index)
+        while child is not container and child.parent is not container:
+            child = child.parent
+        return None if child is container else child
+
+    # the children of container from token index on, where an element or a key may start, up to token close:
+    # (token index, type) for the elements of a list, (token index, key) for the keys of a dict.
+    # the steps are the ones iter_events takes at that level, jumping over the dicts and lists in it
+    def iter_children(self, container, index, close, text):
+        blocks = self.blocks
+        block = blocks[self.block_at(min(index, self.count - 1))]
+
+        def code_at(index):
+            nonlocal block
+            if not 0 <= index - block.index < len(block.types):
+                block = blocks[self.block_at(index)]
+            return block.types[index - block.index]
+
+        def skip_value(index):
+            if index >= close:
+                return index # a missing value, the token is left for the dict or list
+            code = code_at(index)
+            if code in OPENING:
+                return block.containers[index - block.index].end + 1
+            return index + 1 if code in LEAVES else index
+
+        if self.is_list(container):
+            while index < close:
+                yield index, TYPES[code_at(index)]
+                after = skip_value(index)
+                if after >= close:
+                    return
+                code = code_at(after)
+                if code == COMMA or (after == index and code != RBRACKET):
+                    after += 1
+                index = after
+        else:
+            separated = True # no comma to take in front of the first key
+            while index < close:
+                code = code_at(index)
+                if code == COMMA and not separated:
+                    index += 1
+                elif code == STRING:
+                    local = index - block.index
+                    yield index, text[block.offset + block.starts[local]:block.offset + block.ends[local]]
+                    index = skip_value(index + 2) # the key and whatever stands where the ":" should be
+                else:
+                    index += 1
+                separated = code == COMMA and not separated
+
+    # where the elements (or key/value pairs) around the changed tokens [start, end) of container begin,
+    # before the edit is spliced in: the token after the comma in front of them, or the first key. returns
+    # that, the old children from there to the first one at or after end and that one (None if there isn't one),
+    # or None when the changed tokens take in container's own end, or when an unclosed dict ends past the last
+    # token (the parser steps over the ":" missing after its last key), so that edit re-parses it whole
+    def element_region(self, container, start, end, text):
+        if container is None or end > container.end or container.end > self.count:
+            return None
+        is_list = self.is_list(container)
+        index = start - 1 if is_list else min(start, container.end - 1)
+        low = container.start + 1
+        while index > container.start:
+            child = self.child_at(container, index)
+            if child is not None:
+                index = child.start - 1
+                continue
+            block = self.blocks[self.block_at(index)]
+            local = index - block.index
+            if is_list and block.types[local] == COMMA:
+                low = index + 1
+                break
+            if not is_list and block.roles[local] == KEY:
+                low = index
+                break
+            index -= 1
+        old = []
+        for child in self.iter_children(container, low, container.end, text):
+            if child[0] >= end:
+                return low, old, child
+            old.append(child)
+        return low, old, None
+
+    # re-parses the children of container from the start of region on, behind a stand-in bracket, until the parse
+    # gets to one of the old children after the changed tokens (which end at token changed) or to the end of
+    # container, and runs the container's own key or element rules again where the new children need it.
+    # if container ends somewhere else now the edit took in its brackets, and its parent is re-parsed
+    def reparse_elements(self, container, region, changed, count):
+        low, old, following = region
+        close = container.end + count
+        is_list = self.is_list(container)
+        rest = iter(())
+        if following is not None:
+            rest = self.iter_children(container, following[0] + count, close, self.text)
+            following = next(rest, None)
+        base = low - 1
+        recorder = Recorder(self.rules, base, children=True)
+        opening = SHARED_TOKENS['[' if is_list else '{']
+        stop = None
+        for event, token_type, value, index in iter_events(chain([opening], self.iter_tokens(low))):
+            if index + base > close and container.parent is not None:
+                break
+            if len(recorder.open) == 1:
+                if event == "end_object" or event == "end_array":
+                    stop = index + base
+                    break
+                if index + base >= changed and (event == "key") != is_list:
+                    while following is not None and following[0] < index + base:
+                        old.append(following)
+                        following = next(rest, None)
+                    if following is not None and following[0] == index + base:
+                        stop = index + base
+                        break
+            getattr(recorder, event)(token_type, value, index)
+
+        if stop != close and (following is None or stop != following[0]):
+            if container.parent is not None:
+                self.reparse(container.parent, count)
+                return
+            # the top level container ends somewhere else, there's nothing after it to line up with
+            del recorder.containers[0] # the stand-in bracket isn't part of the document
+            self.apply(recorder, low, max(stop, close))
+            self.adopt(recorder, container)
+            container.length = stop - container.start
+            self.recheck_container(container)
+            return
+
+        del recorder.containers[0] # the stand-in bracket isn't part of the document
+        if stop == close and following is not None:
+            old.append(following)
+            old.extend(rest)
+            following = None
+        self.apply(recorder, low, stop - 1)
+        self.adopt(recorder, container)
+        container.length += count
+        self.grow(container.parent, container.start, count)
+        if is_list:
+            self.recheck_elements(container, low, stop, count, old, recorder.children, following)
+        else:
+            self.recheck_keys(container, old, recorder.children)
+
+    # the containers recorder found right under its first one go under container instead
+    def adopt(self, recorder, container):
+        for index, child in recorder.containers:
+            if child.parent is not None and child.parent.block is None:
+                child.parent = container
+
+    # types of the rules that keep state for every dict or list
+    def stateful(self, rules):
+        return {type(getattr(rule, "rule", rule)) for rule in rules if rule.container_state() is not None}
+
+    # puts messages in as the errors the dict or list around token index found at it, next to its leaf errors
+    def set_container_errors(self, index, messages):
+        block = self.blocks[self.block_at(index)]
+        local = index - block.index
+        entries = [split_rule_error(message, index, False) for message in messages]
+        entries.extend(entry for entry in block.rules.get(local, ()) if entry[2])
+        if entries:
+            block.rules[local] = entries
+        else:
+            block.rules.pop(local, None)
+        block.formatted = None
+
+    # runs the element rules on children of a list, with their states starting out as states
+    def check_elements(self, children, states):
+        for index, token_type in children:
+            errors = []
+            for rule, state in zip(self.rules.element_rules, states):
+                rule.check_element(token_type, index, state, errors)
+            self.set_container_errors(index, errors)
+
+    # runs the key or element rules of container again for all of its children
+    def recheck_container(self, container):
+        children = list(self.iter_children(container, container.start + 1, container.end, self.text))
+        if self.is_list(container):
+            self.check_elements(children, [rule.container_state() for rule in self.rules.element_rules])
+            container.first = children[0][1] if children else None
+            others = [index for index, token_type in children if token_type != container.first]
+            container.mismatch = others[0] - container.start if others else None
+            container.others = len(others)
+            return
+        states = [rule.container_state() for rule in self.rules.key_rules]
+        for index, key in children:
+            errors = []
+            for rule, state in zip(self.rules.key_rules, states):
+                rule.check_key(key, index, state, errors)
+            self.set_container_errors(index, errors)
+        container.keys = Counter(key for index, key in children)
+
+    # the keys old in a dict were replaced by new ones, which were checked as if they were the only ones.
+    # that's what Type 5 would have found too unless one of them is in the dict somewhere else
+    def recheck_keys(self, container, old, new):
+        kinds = self.stateful(self.rules.key_rules)
+        if not kinds:
+            return
+        if kinds != {DuplicateKey}:
+            self.recheck_container(container)
+            return
+        if container.keys is None:
+            container.keys = Counter(key for index, key in
+                                     self.iter_children(container, container.start + 1, container.end, self.text))
+        else:
+            container.keys.subtract(key for index, key in old)
+            container.keys.update(key for index, key in new)
+        inside = Counter(key for index, key in new)
+        if any(container.keys[key] > inside[key] for key in {key for index, key in old} | inside.keys()):
+            self.recheck_container(container)
+
+    # the elements old of a list, from token low up to token stop now, were replaced by new ones, which were
+    # checked as if they were the only ones. Type 6 only needs the first element's type and where the first
+    # one of another type is, so that's worked out again from what the list kept and the errors moved
+    def recheck_elements(self, container, low, stop, count, old, new, following):
+        kinds = self.stateful(self.rules.element_rules)
+        if not kinds:
+            return
+        if kinds != {ListTypes}:
+            self.recheck_container(container)
+            return
+        first = container.first
+        at_first = low == container.start + 1
+        if at_first:
+            head = new[0][1] if new else following[1] if following is not None else None
+            if head != first:
+                self.recheck_container(container)
+                return
+        if first is None:
+            return
+        container.others += (sum(token_type != first for index, token_type in new)
+                             - sum(token_type != first for index, token_type in old))
+        before = None if container.mismatch is None else container.start + container.mismatch
+        moved = before + count if before is not None and before >= stop - count else None # after the new elements
+        if not container.others:
+            mismatch = None
+        elif before is not None and before < low:
+            mismatch = before
+        else:
+            mismatch = next((index for index, token_type in new if token_type != first), moved)
+            if mismatch is None:
+                mismatch = next((index for index, token_type in
+                                 self.iter_children(container, stop, container.end, self.text) if token_type != first), None)
+
+        def states(reported):
+            return [([None, False] if at_first and reported is None else [first, reported])
+                    if isinstance(getattr(rule, "rule", rule), ListTypes) else rule.container_state()
+                    for rule in self.rules.element_rules]
+
+        self.check_elements(new, states(None if at_first else mismatch is not None and mismatch < low))
+        if moved != mismatch:
+            if moved is not None:
+                self.check_elements([(moved, self.type_at(moved))], states(True))
+            if mismatch is not None and mismatch >= stop:
+                self.check_elements([(mismatch, self.type_at(mismatch))], states(False))
+        container.mismatch = None if mismatch is None else mismatch - container.start
+
+    # the tokens in [start, end) kept their types, so only the leaf rules of the values among them run again
+    def recheck_leaves(self, start, end):
+        for index in range(start, end):
+            block = self.blocks[self.block_at(index)]
+            local = index - block.index
+            if block.roles[local] != VALUE:
+                continue
+            code = block.types[local]
+            token_type = TYPES[code]
+            if code == STRING or code == NUMBER:
+                value = self.text[block.offset + block.starts[local]:block.offset + block.ends[local]]
+            else:
+                value = SHARED_BY_CODE[code].value
+            errors = []
+            for rule in self.rules.leaf_table.get(token_type, ()):
+                rule.check_leaf(token_type, value, index, errors)
+            entries = [entry for entry in block.rules.get(local, ()) if not entry[2]]
+            entries.extend(split_rule_error(message, index, True) for message in errors)
+            if entries:
+                block.rules[local] = entries
+            else:
+                block.rules.pop(local, None)
+            block.formatted = None
+
+    def value_at(self, text, index):
+        block = self.blocks[self.block_at(index)]
+        local = index - block.index
+        return text[block.offset + block.starts[local]:block.offset + block.ends[local]]
+
+    # replaces deleted characters at offset with inserted and returns the new error list
+    def edit(self, offset, deleted, inserted):
+        if offset < 0 or deleted < 0 or offset + deleted > len(self.text):
+            raise ValueError(f"Edit at {offset} deleting {deleted} is outside the document")
+        old_text = self.text
+        delta = len(inserted) - deleted
+        edit_end = offset + deleted
+        count = self.count
+
+        # re-lex from the first token the edit could have changed, until a token lines up with an old one
+        # that starts after the edit, everything from there on scans the same as before
+        start = self.first_ending_at(offset)
+        position = 0
+        if start > 0:
+            block = self.blocks[self.block_at(start - 1)]
+            local = start - 1 - block.index
+            position = block.offset + block.ends[local] + (block.types[local] == STRING) # after the closing quote
+        candidate = self.first_starting_at(edit_end)
+
+        def resync(token_start):
+            nonlocal candidate
+            old_start = token_start - delta
+            while candidate < count and self.start_at(candidate) < old_start:
+                candidate += 1
+            return candidate < count and self.start_at(candidate) == old_start
+
+        self.text = old_text[:offset] + inserted + old_text[edit_end:]
+        records, eof = self.scan(position, resync)
+        end = count if eof is not None else candidate + 1
+
+        # the parser only looks at token types (and key values), so if those are the same the structure is too
+        same = len(records) == end - start
+        for index, record in zip(range(start, end), records):
+            if not same:
+                break
+            block = self.blocks[self.block_at(index)]
+            local = index - block.index
+            same = block.types[local] == record[0] and (
+                block.roles[local] != KEY or self.value_at(old_text, index) == self.text[record[1]:record[2]])
+
+        # otherwise only the elements (or key/value pairs) of the smallest dict or list around the changed tokens
+        # are re-parsed, unless the changed tokens take in one of its brackets
+        inspected = self.inspected()
+        container = region = None
+        if start < inspected and not same:
+            container = self.enclosing(start, max(end - 1, start))
+            region = self.element_region(container, start, end, old_text)
+        self.splice(start, end, records, delta, eof)
+        if start < inspected:
+            if same:
+                self.recheck_leaves(start, start + len(records))
+            elif region is not None:
+                self.reparse_elements(container, region, start + len(records), len(records) - (end - start))
+            else:
+                self.reparse(container, len(records) - (end - start))
+        return self.errors()
+
+    # the same list compile_json(self.text) returns. the blocks keep theirs, so only the ones an edit
+    # changed (or moved, when their messages have token indices or positions in them) are put together again
+    def errors(self):
+        fetched = self.fetched()
+        errors = []
+        for block in self.blocks:
+            if block.index > fetched:
+                break
+            if block.index + len(block.types) - 1 <= fetched:
+                errors.extend(self.block_errors(block))
+            else:
+                errors.extend(self.format_errors(block, fetched - block.index))
+        if fetched >= self.count:
+            for head, position, tail in self.eof_lexer:
+                errors.append(head if position is None else f"{head}{position}{tail}")
+        return errors
+
+    # the messages of block up to its token last, the way compile_json words them
+    def format_errors(self, block, last):
+        errors = []
+        for local in sorted(block.lexer.keys() | block.rules.keys()):
+            if local > last:
+                break
+            for head, position, tail in block.lexer.get(local, ()):
+                errors.append(head if position is None else f"{head}{block.offset + position}{tail}")
+            for head, tail, leaf in block.rules.get(local, ()):
+                errors.append(head if tail is None else f"{head}{block.index + local}{tail}")
+        return errors
+
+    # the messages of the whole block, kept along with the index and offset they were put together for
+    # (None when none of them has one in it, then they stay the same when the block moves)
+    def block_errors(self, block):
+        formatted = block.formatted
+        if formatted is None or formatted[0] not in (None, block.index) or formatted[1] not in (None, block.offset):
+            moves = any(tail is not None for entries in block.rules.values() for head, tail, leaf in entries)
+            shifts = any(position is not None for entries in block.lexer.values() for head, position, tail in entries)
+            formatted = block.formatted = (block.index if moves else None, block.offset if shifts else None,
+                                           self.format_errors(block, len(block.types) - 1))
+        return formatted[2]
@@ -0,0 +1,192 @@
+# optional instrumentation for the compiler
+# nothing in here runs unless an Instruments object is handed to compiler.compile_json / compile_file,
+# without one the pipeline is exactly the same code as before, so it costs nothing when it's off.
+#
+# with one, a run records:
+#   timers   - wall and cpu seconds per stage: "total", "scan", "parse" (which includes the semantic checks)
+#              and "semantic" (the part of parse spent in the rules, wall time only). when tokens are
+#              streamed into the parser, scan and parse run interleaved and only get wall time
+#              (a cpu clock read per token would cost more than scanning the token)
+#   counters - characters (or bytes, for files) scanned, tokens by type, nodes allocated,
+#              max nesting depth and errors by type
+# observers are called as observer(event, data) when a stage is timed ("stage") and when a run is done
+# ("metrics", with everything above), so the numbers can be sent to any collector.
+#
+# profile="cprofile" or profile="tracemalloc" runs the whole compile under that profiler and writes
+# the results into profile_dir (next to output.txt by default):
+#   profile.prof / profile.txt - cProfile stats, as a pstats file and sorted by cumulative time
+#   tracemalloc.txt            - the lines that allocated the most memory
+#
+#   instruments = Instruments(observers=[print], profile="cprofile")
+#   ast, errors = compile_json(text, instruments=instruments)
+
+import cProfile
+import io
+import os
+import pstats
+import re
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+from core import TokenType
+
+ERROR_TYPE = re.compile(r"(Type \d+|Lexer) Error")
+
+# error messages are counted by their "Type N Error" / "Lexer Error" prefix, anything else is a parse error
+def error_type(message):
+    found = ERROR_TYPE.match(message)
+    return found.group(1) if found else "Parse"
+
+class Instruments:
+    def __init__(self, observers=(), profile=None, profile_dir="."):
+        if profile not in (None, "cprofile", "tracemalloc"):
+            raise ValueError(f"Unknown profiler: {profile}")
+        self.observers = list(observers)
+        self.profile = profile
+        self.profile_dir = profile_dir
+        self.timers = {}
+        self.counters = {
+            "chars_scanned": 0,
+            "bytes_scanned": 0,
+            "tokens": 0,
+            "tokens_by_type": {},
+            "nodes": 0,
+            "max_depth": 0,
+            "errors": 0,
+            "errors_by_type": {},
+        }
+
+    def add_observer(self, observer):
+        self.observers.append(observer)
+
+    def emit(self, event, data):
+        for observer in self.observers:
+            observer(event, data)
+
+    # adds to a stage's timers, cpu is None when it couldn't be measured on its own
+    def add_time(self, name, wall, cpu=None):
+        timer = self.timers.setdefault(name, {"wall": 0.0, "cpu": None})
+        timer["wall"] += wall
+        if cpu is not None:
+            timer["cpu"] = (timer["cpu"] or 0.0) + cpu
+        self.emit("stage", {"name": name, "wall": wall, "cpu": cpu})
+
+    # times the block as one stage, wall and cpu
+    @contextmanager
+    def stage(self, name):
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - wall, time.process_time() - cpu)
+
+    # passes tokens through, counting them and tracking how deeply they nest, see CountingTokens
+    def count_tokens(self, tokens, timed=False):
+        return CountingTokens(tokens, self.counters, timed)
+
+    def count_tree(self, tree):
+        return CountingTree(tree, self.counters)
+
+    def count_errors(self, errors):
+        by_type = self.counters["errors_by_type"]
+        for message in errors:
+            kind = error_type(message)
+            by_type[kind] = by_type.get(kind, 0) + 1
+        self.counters["errors"] += len(errors)
+
+    def metrics(self):
+        return {
+            "timers": {name: dict(timer) for name, timer in self.timers.items()},
+            "counters": {name: dict(value) if isinstance(value, dict) else value for name, value in self.counters.items()},
+        }
+
+    def finish(self):
+        self.emit("metrics", self.metrics())
+
+    # runs the block under the chosen profiler (if any) and writes out what it found
+    @contextmanager
+    def profiled(self):
+        if self.profile == "cprofile":
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                yield
+            finally:
+                profiler.disable()
+                profiler.dump_stats(os.path.join(self.profile_dir, "profile.prof"))
+                text = io.StringIO()
+                pstats.Stats(profiler, stream=text).sort_stats("cumulative").print_stats(40)
+                with open(os.path.join(self.profile_dir, "profile.txt"), "w") as file:
+                    file.write(text.getvalue())
+        elif self.profile == "tracemalloc":
+            tracemalloc.start()
+            try:
+                yield
+            finally:
+                snapshot = tracemalloc.take_snapshot()
+                current, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                with open(os.path.join(self.profile_dir, "tracemalloc.txt"), "w") as file:
+                    file.write(f"current {current} bytes, peak {peak} bytes\n")
+                    for stat in snapshot.statistics("lineno")[:40]:
+                        file.write(f"{stat}\n")
+        else:
+            yield
+
+# iterator over tokens that counts them by type and tracks how deeply they nest.
+# with timed=True the time spent getting each token out of tokens is added up in seconds
+class CountingTokens:
+    def __init__(self, tokens, counters, timed=False):
+        self.tokens = iter(tokens)
+        self.counters = counters
+        self.by_type = counters["tokens_by_type"]
+        self.timed = timed
+        self.seconds = 0.0
+        self.depth = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.timed:
+            start = time.perf_counter()
+            token = next(self.tokens)
+            self.seconds += time.perf_counter() - start
+        else:
+            token = next(self.tokens)
+        token_type = token.type
+        self.by_type[token_type] = self.by_type.get(token_type, 0) + 1
+        self.counters["tokens"] += 1
+        if token_type == TokenType.LBRACE or token_type == TokenType.LBRACKET:
+            self.depth += 1
+            if self.depth > self.counters["max_depth"]:
+                self.counters["max_depth"] = self.depth
+        elif (token_type == TokenType.RBRACE or token_type == TokenType.RBRACKET) and self.depth:
+            self.depth -= 1
+        return token
+
+# wraps a tree builder (core.NodeTree, flattree.FlatTree) and counts the nodes it is asked to make
+class CountingTree:
+    def __init__(self, tree, counters):
+        self.tree = tree
+        self.root = tree.root
+        self.counters = counters
+
+    def add_container(self, parent, label, index):
+        self.counters["nodes"] += 1
+        return self.tree.add_container(parent, label, index)
+
+    def add_leaf(self, parent, token_type, value, index):
+        self.counters["nodes"] += 1
+        self.tree.add_leaf(parent, token_type, value, index)
+
+    def add_missing(self, parent, index):
+        self.tree.add_missing(parent, index)
+
+    def close(self, node, index):
+        self.tree.close(node, index)
+
+    def result(self):
+        return self.tree.result()
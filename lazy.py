@@ -0,0 +1,296 @@
+# lazy documents, for reading a few values out of a big document without building its whole AST
+# a LazyDocument only scans the text into a tokenbuffer.TokenBuffer (token types and offsets, no Token or Node
+# objects). the first time a container has to be stepped over, the matching close of every "{" and "[" is
+# found in one pass over the bracket tokens, and from then on a whole dict or list is skipped by jumping
+# straight to the token after its close. values are LazyValue views of one token index, nothing is made
+# for them until they are asked for: .value slices a leaf out of the source, .node() builds a Node tree
+# for just that value, and .compile() does the same with the semantic checks, run on that value only.
+#
+# the dicts and lists that are walked (to find a key or an index) take their tokens the same way the
+# semantic parser does. brackets are paired like it closes containers (a "}" never closes a list), which
+# is where it ends them in any document without syntax errors.
+#
+# paths are JSONPath-like: $ is the top level value, .name or ['name'] a dict key (as written in the
+# document, escapes aren't decoded; the first one wins when a key is there twice), [n] a list item
+# (negative counts from the end) and [*] or .* every value of a dict or list.
+#
+#   doc = LazyDocument(text)
+#   doc.get("$.courses[1]").value         ->  'Physics'
+#   [item.value for item in doc.query("$.items[*].id")]
+#   node, errors = doc.get("$.items[3]").compile()
+
+import re
+from array import array
+
+from core import TokenType, ErrorCollector, ErrorLimitReached
+from rules import RuleSet
+from semanticparser import Parser, LEAF_TYPES
+from tokenbuffer import TokenBuffer, CODES, offset_typecode
+
+OPEN = {CODES[TokenType.LBRACE]: CODES[TokenType.RBRACE], CODES[TokenType.LBRACKET]: CODES[TokenType.RBRACKET]}
+BRACKETS = re.compile(re.escape(bytes(sorted(OPEN) + sorted(OPEN.values()))).join([b'[', b']']))
+LBRACE = CODES[TokenType.LBRACE]
+LBRACKET = CODES[TokenType.LBRACKET]
+RBRACE = CODES[TokenType.RBRACE]
+RBRACKET = CODES[TokenType.RBRACKET]
+COMMA = CODES[TokenType.COMMA]
+STRING = CODES[TokenType.STRING]
+EOF = -1
+LEAF_CODES = {CODES[token_type] for token_type in LEAF_TYPES}
+
+# a rule set without any rules, for building nodes without checking them
+NO_RULES = RuleSet(enabled=())
+
+PATH_STEP = re.compile(r'''
+    \.(\*|[^.\[\]]+)                       # 1: .name or .*
+  | \[\s*(\*|-?\d+)\s*\]                   # 2: [n] or [*]
+  | \[\s*'([^']*)'\s*\]                    # 3: ['name']
+  | \[\s*"([^"]*)"\s*\]                    # 4: ["name"]
+''', re.VERBOSE)
+
+# the steps of a path as ("key", name), ("index", n) or ("all", None)
+def parse_path(path):
+    path = path.strip()
+    if not path.startswith("$"):
+        raise ValueError(f"Path must start with '$': {path}")
+    steps = []
+    pos = 1
+    while pos < len(path):
+        found = PATH_STEP.match(path, pos)
+        if found is None:
+            raise ValueError(f"Invalid path at position {pos}: {path}")
+        name = found.group(1) or found.group(3) or found.group(4)
+        if found.group(2) is not None:
+            steps.append(("all", None) if found.group(2) == "*" else ("index", int(found.group(2))))
+        elif found.group(1) == "*":
+            steps.append(("all", None))
+        else:
+            steps.append(("key", name if name is not None else ""))
+        pos = found.end()
+    return steps
+
+class LazyDocument:
+    # engine is "regex" (TokenBuffer.from_text) or "structural" (structural.scan_buffer, needs numpy).
+    # the lexer errors of the whole text are in errors
+    def __init__(self, text, engine="regex"):
+        self.errors = []
+        if engine == "structural":
+            from structural import scan_buffer # imported here since it needs numpy, which the regex engine doesn't
+            self.buffer = scan_buffer(text, self.errors)
+        else:
+            self.buffer = TokenBuffer.from_text(text, self.errors)
+        self.types = self.buffer.types
+        self.closes = None # token index of the matching close for every "{" and "[", see pair_brackets
+
+    @classmethod
+    def from_file(cls, path, engine="regex"):
+        with open(path, encoding="utf-8", errors="replace") as file:
+            return cls(file.read(), engine)
+
+    @property
+    def root(self):
+        return LazyValue(self, 0 if self.code(0) in LEAF_CODES or self.code(0) in OPEN else None)
+
+    # code of the token at index, EOF past the end
+    def code(self, index):
+        return self.types[index] if index < len(self.types) else EOF
+
+    # one pass over just the bracket tokens. a close only closes the last open container if it's the right kind,
+    # a container that is never closed ends at the end of the tokens
+    def pair_brackets(self):
+        types = self.types
+        closes = array(offset_typecode(len(types) + 1))
+        closes.frombytes(bytes(closes.itemsize * len(types)))
+        stack = []
+        for found in BRACKETS.finditer(types.tobytes()):
+            index = found.start()
+            code = types[index]
+            if code in OPEN:
+                stack.append(index)
+            elif stack and OPEN[types[stack[-1]]] == code:
+                closes[stack.pop()] = index
+        for index in stack:
+            closes[index] = len(types)
+        self.closes = closes
+
+    # the index right after the value starting at index
+    def skip(self, index):
+        code = self.code(index)
+        if code in OPEN:
+            if self.closes is None:
+                self.pair_brackets()
+            return self.closes[index] + 1
+        if code in LEAF_CODES:
+            return index + 1
+        return index # a missing value takes no token
+
+    # (key index, value index) for every pair of the dict at index, value index is None for a missing value.
+    # the tokens are taken like semanticparser.Parser does, nested containers are skipped
+    def iter_pairs(self, index):
+        position = index + 1
+        first = True
+        while True:
+            if not first and self.code(position) == COMMA:
+                position += 1
+            first = False
+            code = self.code(position)
+            if code == RBRACE or code == EOF:
+                return
+            if code == STRING:
+                value = position + 2 # the key and whatever stands where the ":" should be
+                after = self.skip(value)
+                yield position, value if after > value else None
+                position = after
+            else:
+                position += 1
+
+    # index of every value of the list at index, None for a missing one
+    def iter_items(self, index):
+        position = index + 1
+        start = None
+        while True:
+            if start is not None:
+                if self.code(position) == COMMA:
+                    position += 1
+                elif position == start and self.code(position) != RBRACKET:
+                    position += 1 # the token couldn't start a value, skip it so the list can carry on
+            code = self.code(position)
+            if code == RBRACKET or code == EOF:
+                return
+            start = position
+            after = self.skip(position)
+            yield position if after > position else None
+            position = after
+
+    # every value the path leads to, in document order
+    def query(self, path):
+        values = [self.root]
+        for kind, argument in parse_path(path):
+            values = [child for value in values for child in value.step(kind, argument)]
+        return values
+
+    # the first value the path leads to, KeyError when there is none
+    def get(self, path):
+        values = self.query(path)
+        if not values:
+            raise KeyError(path)
+        return values[0]
+
+# one value in a LazyDocument, index is the token it starts at (None for a missing value)
+class LazyValue:
+    __slots__ = ('document', 'index')
+
+    def __init__(self, document, index):
+        self.document = document
+        self.index = index
+
+    def __repr__(self):
+        return f"LazyValue({self.token_type}, Token {self.index})"
+
+    # the token type it starts with: LBRACE for a dict, LBRACKET for a list, None when it's missing
+    @property
+    def token_type(self):
+        return None if self.index is None else self.document.buffer.type_at(self.index)
+
+    @property
+    def is_dict(self):
+        return self.index is not None and self.document.code(self.index) == LBRACE
+
+    @property
+    def is_list(self):
+        return self.index is not None and self.document.code(self.index) == LBRACKET
+
+    # the label a leaf would have in the AST, None for containers and missing values
+    @property
+    def value(self):
+        if self.index is None or self.document.code(self.index) not in LEAF_CODES:
+            return None
+        return self.document.buffer.value_at(self.index)
+
+    # the source text of the whole value (with the quotes for strings)
+    @property
+    def text(self):
+        if self.index is None:
+            return ""
+        buffer = self.document.buffer
+        end = self.document.skip(self.index) - 1
+        start = buffer.starts[self.index] - (buffer.types[self.index] == STRING)
+        if end >= len(buffer):
+            return buffer.source[start:]
+        return buffer.source[start:buffer.ends[end] + (buffer.types[end] == STRING)]
+
+    def keys(self):
+        if not self.is_dict:
+            return []
+        return [self.document.buffer.value_at(key) for key, value in self.document.iter_pairs(self.index)]
+
+    def items(self):
+        if not self.is_dict:
+            return []
+        return [(self.document.buffer.value_at(key), LazyValue(self.document, value))
+                for key, value in self.document.iter_pairs(self.index)]
+
+    # the values of a list or a dict
+    def values(self):
+        if self.is_list:
+            return [LazyValue(self.document, item) for item in self.document.iter_items(self.index)]
+        if self.is_dict:
+            return [LazyValue(self.document, value) for key, value in self.document.iter_pairs(self.index)]
+        return []
+
+    def __len__(self):
+        if self.is_list:
+            return sum(1 for _ in self.document.iter_items(self.index))
+        if self.is_dict:
+            return sum(1 for _ in self.document.iter_pairs(self.index))
+        return 0
+
+    def __iter__(self):
+        return iter(self.keys() if self.is_dict else self.values())
+
+    # a dict value by key or a list item by position, KeyError / IndexError when it isn't there
+    def __getitem__(self, key):
+        found = self.step("index" if isinstance(key, int) else "key", key)
+        if not found:
+            raise (IndexError if isinstance(key, int) else KeyError)(key)
+        return found[0]
+
+    # the values one path step leads to from here
+    def step(self, kind, argument):
+        document = self.document
+        if kind == "key":
+            if self.is_dict:
+                buffer = document.buffer
+                for key, value in document.iter_pairs(self.index):
+                    if buffer.source[buffer.starts[key]:buffer.ends[key]] == argument:
+                        return [LazyValue(document, value)]
+            return []
+        if kind == "index":
+            if not self.is_list:
+                return []
+            if argument < 0:
+                items = list(document.iter_items(self.index))
+                return [LazyValue(document, items[argument])] if -argument <= len(items) else []
+            for position, item in enumerate(document.iter_items(self.index)):
+                if position == argument:
+                    return [LazyValue(document, item)]
+            return []
+        return self.values()
+
+    # builds the AST of just this value with the semantic parser, checked with rules (all of them by default).
+    # returns the node and the errors found in it, token numbers are the same as in the whole document
+    def compile(self, rules=None, max_errors=None):
+        errors = ErrorCollector(max_errors)
+        if self.index is None:
+            return None, errors
+        buffer = self.document.buffer
+        end = min(self.document.skip(self.index), len(buffer))
+        parser = Parser(tokens=map(buffer.token, range(self.index, end)), rules=rules, errors=errors, start=self.index)
+        try:
+            return parser.parse(), errors
+        except ErrorLimitReached:
+            return None, errors
+
+    # the Node tree of this value, without any checks
+    def node(self):
+        return self.compile(NO_RULES)[0]
@@ -0,0 +1,156 @@
+# numbers: the json number grammar, batched checks over many numbers at once, and packed number lists
+# the scanner takes any run of digits, ".", "e", "E", "+" and "-" as a NUMBER, so the grammar is checked
+# afterwards: by the Type 1 and Type 3 rules for every NUMBER leaf (one compiled pattern match per number,
+# only the ones that fail it are looked at any further) and, in one pass over all of them, by
+# invalid_numbers / number_errors. a flat parse (over a TokenBuffer) uses the latter for the Type 1 and
+# Type 3 rules too, a batch of tokens at a time (BufferNumbers, see rules.RuleSet.batched).
+#
+# PackedTree is a tree builder (see core.NodeTree) that turns every list holding nothing but valid numbers
+# into a PackedList, whose values are one array('q') or array('d') (or a numpy array) instead of a leaf
+# Node and a string per number. the numbers of an open list are kept as plain strings until it closes,
+# then checked and converted in one go.
+#
+#   ast, errors = compile_json(text, pack_numbers="array")
+#   ast.children[0].values  ->  array('d', [1.5, 2.0, ...])
+
+import re
+from array import array
+from bisect import bisect_right
+from itertools import accumulate
+
+from core import Node, NodeTree, TokenType
+
+try:
+    import numpy
+except ImportError: # only needed for pack_numbers="numpy"
+    numpy = None
+
+NUMBER = re.compile(r"-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][+-]?[0-9]+)?")
+# a line of numbers joined with "\n" that isn't a valid number
+INVALID_LINE = re.compile(r"^(?!" + NUMBER.pattern + r"$).*$", re.M)
+# numbers joined with "\n" (and one at the end) that are all integers that fit in 8 bytes
+INTEGER_LINES = re.compile(r"(?:-?(?:0|[1-9][0-9]{0,17})\n)*")
+LEADING_ZEROS = re.compile(r"-?0[0-9]")
+
+# the error for a NUMBER that doesn't match the grammar. anything with a "." in it is an invalid decimal (Type 1),
+# anything else an invalid number (Type 3)
+def number_error(value, index):
+    if "." in value:
+        return f"Type 1 Error: Invalid decimal number '{value}' at Token {index}"
+    if LEADING_ZEROS.match(value):
+        return f"Type 3 Error: Leading zeros in number '{value}' at Token {index}"
+    if value.startswith("+") or value.startswith("-+"):
+        return f"Type 3 Error: Leading '+' in number '{value}' at Token {index}"
+    return f"Type 3 Error: Invalid number '{value}' at Token {index}"
+
+# positions (in values) of the values that aren't valid numbers, found with one pattern over all of them
+def invalid_numbers(values):
+    if not values:
+        return []
+    text = "\n".join(values)
+    found = [match.start() for match in INVALID_LINE.finditer(text)]
+    if not found:
+        return []
+    starts = list(accumulate((len(value) + 1 for value in values), initial=0))
+    return [bisect_right(starts, start) - 1 for start in found]
+
+# (token index, message) for every NUMBER among the tokens [start, end) of a tokenbuffer.TokenBuffer that doesn't
+# match the grammar, the same messages the Type 1 and Type 3 rules give
+def number_errors(buffer, start=0, end=None):
+    from tokenbuffer import CODES # imported here since tokenbuffer needs the scanner, which this module doesn't
+    code = bytes([CODES[TokenType.NUMBER]])
+    source, starts, ends = buffer.source, buffer.starts, buffer.ends
+    indices = [start + match.start() for match in re.finditer(re.escape(code), buffer.types[start:end].tobytes())]
+    values = [source[starts[index]:ends[index]] for index in indices]
+    return [(indices[position], number_error(values[position], indices[position]))
+            for position in invalid_numbers(values)]
+
+# the number errors of a TokenBuffer that is filled while it's parsed (see TokenBuffer.fill), found holds the
+# message of every invalid NUMBER among the tokens checked so far by token index. once a token past them is
+# asked about, check runs number_errors over all the tokens in the buffer by then
+class BufferNumbers:
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self.checked = 0
+        self.found = {}
+
+    def check(self):
+        end = len(self.buffer)
+        self.found = dict(number_errors(self.buffer, self.checked, end))
+        self.checked = end
+
+# valid numbers as one array: array('q') when they are all integers that fit, array('d') otherwise,
+# viewed as a numpy array with as_numpy
+def pack(values, as_numpy=False):
+    if INTEGER_LINES.fullmatch("\n".join(values) + "\n"):
+        packed = array('q', map(int, values))
+    else:
+        packed = array('d', map(float, values))
+    if as_numpy:
+        return numpy.frombuffer(packed, dtype=numpy.int64 if packed.typecode == 'q' else numpy.float64)
+    return packed
+
+# a list of numbers with its values packed into one array.
+# children still hands out NUMBER leaves (made from the values, so 1.50 comes back as 1.5) for code that walks Nodes
+class PackedList(Node):
+    __slots__ = ('values',)
+
+    def __init__(self, values):
+        self.label = "list"
+        self.is_leaf = False
+        self.token_type = None
+        self.values = values
+
+    @property
+    def children(self):
+        return [Node(label=repr(value), is_leaf=True, token_type=TokenType.NUMBER) for value in self.values.tolist()]
+
+# NodeTree that packs lists of numbers, pack_numbers is "array" or "numpy"
+class PackedTree(NodeTree):
+    def __init__(self, pack_numbers="array"):
+        if pack_numbers not in ("array", "numpy"):
+            raise ValueError(f"Unknown packing: {pack_numbers}")
+        if pack_numbers == "numpy" and numpy is None:
+            raise ImportError("pack_numbers='numpy' needs numpy installed")
+        super().__init__()
+        self.as_numpy = pack_numbers == "numpy"
+        self.numbers = {} # id of every open list that has only had numbers so far -> (its parent, the numbers)
+
+    # the list stops being a candidate, its numbers so far become leaves
+    def unpack(self, parent):
+        parent_and_values = self.numbers.pop(id(parent), None)
+        if parent_and_values is not None:
+            for value in parent_and_values[1]:
+                parent.add_child(Node(label=value, is_leaf=True, token_type=TokenType.NUMBER))
+
+    def add_container(self, parent, label, index):
+        self.unpack(parent)
+        node = super().add_container(parent, label, index)
+        if label == "list":
+            self.numbers[id(node)] = (parent, [])
+        return node
+
+    def add_leaf(self, parent, token_type, value, index):
+        parent_and_values = self.numbers.get(id(parent))
+        if parent_and_values is not None and token_type == TokenType.NUMBER:
+            parent_and_values[1].append(value)
+            return
+        self.unpack(parent)
+        super().add_leaf(parent, token_type, value, index)
+
+    def add_missing(self, parent, index):
+        self.unpack(parent)
+        super().add_missing(parent, index)
+
+    # every list is closed, at its "]" or at the end of the input. one that only ever had valid numbers
+    # in it is swapped for a PackedList: everything after the list was inside it, so it is still the last child of its parent
+    def close(self, node, index):
+        parent_and_values = self.numbers.get(id(node))
+        if parent_and_values is None:
+            return
+        parent, values = parent_and_values
+        if not values or invalid_numbers(values):
+            self.unpack(node)
+            return
+        del self.numbers[id(node)]
+        parent.children[-1] = PackedList(pack(values, self.as_numpy))
@@ -0,0 +1,303 @@
+# parallel parsing of one big json document whose top level value is a list
+# the list's values are independent of each other (apart from Type 6, see below), so the file is cut into
+# byte ranges between them and every range is scanned and semantically checked in a pool of worker processes:
+#   pre-scan  - one pass over the raw bytes that only looks at brackets and skips strings whole, to find
+#               commas between top level values near the places the file should be cut (split_points)
+#   lengths   - every range is decoded in the pool to find how many characters it has, so lexer errors
+#               can be given the positions they'd have in the whole file
+#   parse     - every range goes through the scanner and semantic parser as the rest of the top level list
+#               (parse_range), and the results are put back together in file order
+# the merged errors and AST are the same as compile_file gives:
+#   - token numbers in a range start at 0 and are moved up by the tokens of the ranges before it
+#     (the last "Token N" of every semantic error, which is where every rule puts it)
+#   - the element rules of the top level list (Type 6) can't be checked in a range, whose first value
+#     isn't the list's first. the workers only note the type, token and place in the errors of every
+#     top level value, the checks are run here in file order and their errors put back where they belong
+#   - the values of every range are appended to one list node
+# a range is only trusted when its worker could tell the whole file would be in the same state there:
+# its last token has to be the comma it was cut after, and the top level list the only thing still open.
+# anything else (an unbalanced bracket, a string the pre-scan saw differently) means the file is parsed
+# on from that range on in this process, so invalid documents give the same results too, only slower.
+# rules are given token numbers from the start of their range, so a rule's checks shouldn't depend on them.
+# rule hit counters and shape cache stats are counted in the workers and not brought back.
+#
+#   ast, errors = compile_array_file("huge.json", workers=8)
+#   python parallel.py huge.json --workers 8
+
+import argparse
+import copy
+import mmap
+import os
+import re
+import sys
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import accumulate, chain
+
+from compiler import compile_file
+from core import Node, NodeTree, TokenType, ErrorCollector, ErrorLimitReached
+from rules import RuleSet
+from scanner import SHARED_TOKENS, scan_text, iter_file_tokens
+from semanticparser import Parser
+from serialize import to_binary, from_binary
+from tokenbuffer import CODES, TYPES
+
+# ranges smaller than this aren't worth sending to another process
+MIN_RANGE_SIZE = 1 << 20
+
+# everything up to the next bracket, skipping strings (the scanner's string pattern). a string that is
+# never closed ends the match at its quote, the end of the file at the end
+BRACKET = re.compile(rb'[^"\[\]{}]*(?:"[^"\\]*(?:\\.[^"\\]*)*"[^"\[\]{}]*)*(?:[\[\]{}]|"|\Z)')
+# everything before the string a position is in (or up to the position, when it isn't in one)
+STRINGS = re.compile(rb'[^"]*(?:"[^"\\]*(?:\\.[^"\\]*)*"[^"]*)*')
+# up to and including the next comma that isn't in a string
+COMMA = re.compile(rb'[^",]*(?:"[^"\\]*(?:\\.[^"\\]*)*"[^",]*)*,')
+# the token number in a semantic error, the last one in the message (keys in it come before it)
+TOKEN_NUMBER = re.compile(r'(.*Token )(\d+)', re.DOTALL)
+
+# byte offsets that cut the file into about count ranges, each one after a comma between two values of the top level
+# list. [0, size] when the file doesn't start with a list
+def split_points(path, count):
+    size = os.path.getsize(path)
+    targets = deque(size * index // count for index in range(1, count))
+    points = [0]
+    with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as view:
+        depth = 0
+        pos = 0
+        while targets and pos < size:
+            found = BRACKET.match(view, pos)
+            end = found.end()
+            bracket = view[end - 1:end] if end > pos else b''
+            if bracket == b'"' or (depth == 0 and bracket != b'['):
+                break # a string that is never closed, or something other than a list at the top
+            region_end = end - 1 if bracket else end
+
+            # between pos and region_end the top level list's values are only separated by commas
+            while depth == 1 and targets and targets[0] < region_end:
+                start = STRINGS.match(view, pos, max(targets[0], pos)).end()
+                comma = COMMA.match(view, start, region_end)
+                if comma is None:
+                    break
+                points.append(comma.end())
+                pos = comma.end()
+                while targets and targets[0] < pos + MIN_RANGE_SIZE // 2:
+                    targets.popleft()
+
+            if not bracket:
+                break
+            depth += 1 if bracket in (b'[', b'{') else -1
+            if depth == 0:
+                break # the top level list is closed
+            pos = end
+    points.append(size)
+    return points
+
+# the text of the bytes in [start, end), decoded like scanner.iter_file_tokens does
+def read_range(path, start, end):
+    with open(path, "rb") as file:
+        file.seek(start)
+        return file.read(end - start).decode("utf-8", errors="replace")
+
+def range_length(args):
+    return len(read_range(*args))
+
+# stands in for the element rules of a range's RuleSet, the first list (the top level one) is only noted down:
+# the type of each of its values, the token it starts at and how many errors were found before it
+class TopLevelElements:
+    def __init__(self, rules):
+        self.rules = rules
+        self.top = None
+        self.codes = array('B')
+        self.indices = array('q')
+        self.positions = array('q')
+
+    def container_state(self):
+        if self.top is None:
+            self.top = []
+            return self.top
+        return [rule.container_state() for rule in self.rules]
+
+    def check_element(self, token_type, index, state, errors):
+        if state is self.top:
+            self.codes.append(CODES[token_type])
+            self.indices.append(index)
+            self.positions.append(len(errors))
+            return
+        for rule, rule_state in zip(self.rules, state):
+            rule.check_element(token_type, index, rule_state, errors)
+
+# NodeTree that remembers the first list and the last two containers closed.
+# with keep=False the first list's values aren't added to it, so each one can go as soon as it's parsed
+class RangeTree(NodeTree):
+    def __init__(self, keep=True):
+        super().__init__()
+        self.keep = keep
+        self.top = None
+        self.closed = deque(maxlen=2)
+
+    def add_container(self, parent, label, index):
+        if parent is self.top and not self.keep:
+            return Node(label=label)
+        node = super().add_container(parent, label, index)
+        if self.top is None and label == "list":
+            self.top = node
+        return node
+
+    def add_leaf(self, parent, token_type, value, index):
+        if parent is not self.top or self.keep:
+            super().add_leaf(parent, token_type, value, index)
+
+    def add_missing(self, parent, index):
+        if parent is not self.top or self.keep:
+            super().add_missing(parent, index)
+
+    def close(self, node, index):
+        self.closed.append((node, index))
+
+# tokens, keeping count of them and the last one in last
+def tracked(tokens, last):
+    for token in tokens:
+        last[0] += 1
+        last[1] = token
+        yield token
+
+# scans and parses the bytes in [start, end) as the values of the top level list from some comma on (or from the
+# start of the file, first=True), base is the position of its first character in the file. final is set when
+# end is the end of the file.
+# token numbers start at 0 (at the first token of the range). returns the errors, the top level values noted down
+# by TopLevelElements, the tokens in the range, the list's values as serialize.to_binary bytes (with keep_ast),
+# whether the run stopped at max_errors and whether the whole file is known to be in the same state at end
+def parse_range(path, start, end, base, first, final, rules=None, max_errors=None, recover=False, keep_ast=True):
+    rules = copy.copy(rules) if rules is not None else RuleSet() # the element rules are swapped in this copy only
+    elements = TopLevelElements(rules.element_rules) if rules.element_rules else None
+    if elements is not None:
+        rules.element_rules = [elements]
+    errors = ErrorCollector(max_errors)
+    tree = RangeTree(keep_ast)
+    last = [0, None]
+    if final:
+        # the last range runs to the end of the file, which is most of it when it's parsed on from an untrusted
+        # range in compile_array_file, so it's streamed instead of read in whole
+        tokens = iter_file_tokens(path, errors=errors, recover=recover, start=start, base=base)
+    else:
+        tokens = scan_text(read_range(path, start, end), 0, base, errors=errors, recover=recover)
+    tokens = tracked(tokens, last)
+    if not first:
+        tokens = chain([SHARED_TOKENS['[']], tokens) # the list the values are in, as token -1
+    stopped = False
+    try:
+        Parser(tokens=tokens, tree=tree, rules=rules, errors=errors, start=0 if first else -1).parse()
+    except ErrorLimitReached:
+        stopped = True
+
+    # the top level list has to be the only container left open once the comma the range was cut after is eaten
+    count = last[0]
+    closed = list(tree.closed)
+    ready = (not stopped and last[1] is not None and last[1].type == TokenType.COMMA and tree.top is not None
+             and closed and closed[-1] == (tree.top, count) and (len(closed) == 1 or closed[0][1] < count))
+    value = tree.result() if first else tree.top # the whole AST when the range starts the file
+    return {
+        "errors": list(errors),
+        "codes": elements.codes if elements is not None else array('B'),
+        "indices": elements.indices if elements is not None else array('q'),
+        "positions": elements.positions if elements is not None else array('q'),
+        "tokens": count,
+        "ast": to_binary(value) if keep_ast and value is not None and not stopped else None,
+        "stopped": stopped,
+        "ready": ready or final,
+    }
+
+def parse_range_args(args):
+    return parse_range(*args)
+
+# the errors of one range, with token numbers moved up by offset and the top level list's element rules run
+# (with their states, which carry on from range to range) where the range noted its values down
+def merge_errors(result, offset, element_rules, states, errors):
+    messages = result["errors"]
+    done = 0
+    for code, index, position in zip(result["codes"], result["indices"], result["positions"]):
+        for message in messages[done:position]:
+            errors.append(renumber(message, offset))
+        done = position
+        for rule, state in zip(element_rules, states):
+            rule.check_element(TYPES[code], index + offset, state, errors)
+    for message in messages[done:]:
+        errors.append(renumber(message, offset))
+
+def renumber(message, offset):
+    if not offset or message.startswith("Lexer Error"):
+        return message
+    found = TOKEN_NUMBER.match(message)
+    if found is None:
+        return message
+    return f"{found.group(1)}{int(found.group(2)) + offset}{message[found.end():]}"
+
+# same as compiler.compile_file for a file whose top level value is a list, with the values parsed in
+# worker processes. with keep_ast=False the AST isn't sent back (and is None), only the errors.
+# files that are too small to split, or don't start with a list, are compiled in this process
+def compile_array_file(path, workers=None, rules=None, max_errors=None, recover=False, keep_ast=True):
+    workers = workers or os.cpu_count() or 1
+    size = os.path.getsize(path)
+    count = max(1, min(workers * 4, size // MIN_RANGE_SIZE))
+    points = split_points(path, count) if workers > 1 and count > 1 and size else [0, size]
+    if len(points) < 3:
+        ast, errors = compile_file(path, rules=rules, max_errors=max_errors, recover=recover)
+        return (ast if keep_ast else None), errors
+
+    rules = rules if rules is not None else RuleSet()
+    ranges = list(zip(points, points[1:]))
+    errors = ErrorCollector(max_errors)
+    element_rules = rules.element_rules
+    states = [rule.container_state() for rule in element_rules]
+    ast = None
+    offset = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        lengths = list(pool.map(range_length, [(path, start, end) for start, end in ranges]))
+        bases = list(accumulate(lengths[:-1], initial=0)) # where each range starts, in characters
+        jobs = [(path, start, end, base, number == 0, number == len(ranges) - 1, rules, max_errors, recover, keep_ast)
+                for number, ((start, end), base) in enumerate(zip(ranges, bases))]
+        results = pool.map(parse_range_args, jobs)
+        try:
+            for number, result in enumerate(results):
+                rest = not result["ready"] and not result["stopped"]
+                if rest:
+                    # the file isn't known to be in the same state at the end of this range, so from its start on
+                    # it's parsed here in one go, as the last range
+                    result = parse_range(path, ranges[number][0], size, bases[number], number == 0, True, rules,
+                                         max_errors, recover, keep_ast)
+                merge_errors(result, offset, element_rules, states, errors)
+                if keep_ast and result["ast"] is not None:
+                    values = from_binary(result["ast"])
+                    if ast is None:
+                        ast = values
+                    else:
+                        ast.children.extend(values.children)
+                if rest or result["stopped"]:
+                    break
+                offset += result["tokens"]
+        except ErrorLimitReached:
+            ast = None
+        pool.shutdown(cancel_futures=True)
+    return ast, errors
+
+# only the errors, the AST isn't kept
+def validate_array_file(path, workers=None, rules=None, max_errors=None, recover=False):
+    return compile_array_file(path, workers, rules, max_errors, recover, keep_ast=False)[1]
+
+def main(argv=None):
+    arguments = argparse.ArgumentParser(description="Validate a json file whose top level value is a big list in parallel.")
+    arguments.add_argument("path")
+    arguments.add_argument("--workers", type=int, default=None, help="worker processes (default: one per CPU)")
+    arguments.add_argument("--max-errors", type=int, default=None, help="stop after this many errors")
+    arguments.add_argument("--recover", action="store_true", help="report runs of invalid characters as one error")
+    options = arguments.parse_args(argv)
+
+    errors = validate_array_file(options.path, options.workers, max_errors=options.max_errors, recover=options.recover)
+    for error in errors:
+        print(error)
+    print(f"{len(errors)} error(s)")
+    return 1 if errors else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,79 +1,40 @@
 # I would like to credit the supplementary parser provided on Brightspace (2024) for the CSCI 2115 Fall24 class.
 # The code provided in that example was referenced heavily during the creation of this parser. Thank you!
 
-# TokenType class taken from Part1 Scanner to help identify scanner output tokens
-class TokenType:  # JSON token types
-    LBRACE = '{'  # '{'
-    RBRACE = '}'  # '}'
-    LBRACKET = '['  # '['
-    RBRACKET = ']'  # ']'
-    COMMA = ','  # ','
-    COLON = ':'  # ':'
-    STRING = 'STRING'  # strings
-    NUMBER = 'NUMBER'  # numeric values
-    BOOL_TRUE = 'BOOL_TRUE'  # true
-    BOOL_FALSE = 'BOOL_FALSE'  # false
-    NULL = 'NULL'  # null
-    EOF = 'EOF'  # end of input
-
-# Token class taken from Part1 Scanner to help identify scanner output tokens
-class Token:
-    def __init__(self, type_, value=None):
-        self.type = type_
-        self.parse = value
-
-    def __repr__(self):
-        if self.parse is not None:
-            return f"<{self.type}, {self.parse}>"
-        return f"<{self.type}>"
-
-class Node:
-    def __init__(self, label=None, is_leaf=False, token_type=None):
-        self.label = label # value of the node
-        self.children = [] # child nodes of a node on the tree (leaves should have an empty list)
-        self.is_leaf = is_leaf
-        self.token_type = token_type  # token type to distinguish terminal symbols
-
-    def add_child(self, child):
-        self.children.append(child)
-
-    def print_tree(self, file, depth=0):
-        indent = "    " * (depth)
-        if self.is_leaf:  # terminal nodes like STRING, NUMBER, etc.
-            file.write(f"{indent}{self.token_type}: {self.label}\n")
-        else:
-            file.write(f"{indent}{self.label}\n")  # internal nodes (e.g., value, dict, list)
-            for child in self.children:
-                child.print_tree(file,depth + 1)  
-        
+from core import TokenType, Token, Node, read_tokens, default_errors
+
+# steps on the parser's stack
+VALUE = 0 # parse a value and add it to the node
+DICT = 1 # start of a dict's loop over its pairs
+DICT_NEXT = 2 # a pair was just parsed, eat the "," if there is one and carry on with the dict
+PAIR_VALUE = 3 # a pair's key was just parsed, eat the ":" and parse its value
+LIST = 4 # start of a list's loop over its values
+LIST_NEXT = 5 # a value was just parsed, eat the "," if there is one and carry on with the list
+
+LEAF_TYPES = {
+    TokenType.STRING,
+    TokenType.NUMBER,
+    TokenType.BOOL_TRUE,
+    TokenType.BOOL_FALSE,
+    TokenType.NULL,
+}
 
 class Parser:
-    def __init__(self, token_file):
-        self.tokens = self.read_tokens(token_file)
+    # tokens either come from a scanner output file or straight from an iterable of Token objects
+    # (e.g. DFA.iter_tokens), they are pulled one at a time so the parser never needs the whole list
+    # errors is the list this run's errors go to, core.errors if none is given
+    def __init__(self, token_file=None, tokens=None, errors=None):
+        self.errors = errors if errors is not None else default_errors()
+        if tokens is None:
+            tokens = read_tokens(token_file)
+        self.tokens = iter(tokens)
         self.current_index = 0
-        self.current_token = self.tokens[0] if self.tokens else None
-
-    # have to read tokens somehow, so we do it quickly with this method
-    # tokens are read from the "sample input" file which contains scanner output
-    def read_tokens(self, token_file):
-        tokens = []
-        with open(token_file, "r") as file:
-            for line in file:
-                line = line.strip()
-                if line.startswith("<") and line.endswith(">"):
-                    parts = line[1:-1].split(", ", 1)
-                    tokenType = parts[0]
-                    tokenValue = parts[1] if len(parts) > 1 else None
-                    tokens.append(Token(tokenType, tokenValue))
-        return tokens
+        self.current_token = next(self.tokens, None) or Token(TokenType.EOF)
 
     # start processing the next token in the stream
     def get_next_token(self):
         self.current_index += 1
-        if self.current_index < len(self.tokens):
-            self.current_token = self.tokens[self.current_index]
-        else:
-            self.current_token = Token(TokenType.EOF)
+        self.current_token = next(self.tokens, None) or Token(TokenType.EOF)
 
     def eat(self, token_type, parent_node):
         if self.current_token.type == token_type:
@@ -83,101 +44,94 @@ class Parser:
             parent_node.add_child(Node(label=label, is_leaf=False, token_type=token_type))
             self.get_next_token()
         else:
-            errors.append(f"Expected {token_type} but got {self.current_token.type} at Token {self.current_index}")
+            self.errors.append(f"Expected {token_type} but got {self.current_token.type} at Token {self.current_index}")
             self.get_next_token()
 
+    # the grammar is parsed with an explicit stack instead of recursive calls, so deeply nested
+    # documents never hit python's recursion limit. each entry on the stack is a step that is still
+    # left to do (parse a value, continue a dict or list, finish a pair), in the same order the
+    # recursive version used to do them, so the tree and the error list come out the same
     def parse(self):
-        node = Node()  # create a placeholder node, content to be decided by token!
-        
-        # THE FOLLOWING CONDITIONS CHECK FOR NODES THAT FALL UNDER "value"
-        # IN THE PROVIDED JSON GRAMMAR
-        # NOTE: "pair" is implicitly handled here since it falls under "dict"
-        if self.current_token.type == TokenType.LBRACE:
-            node.label = "value"
-            node.add_child(self.dict())
-        elif self.current_token.type == TokenType.LBRACKET:
-            node.label = "value"
-            node.add_child(self.list())
-        elif self.current_token.type == TokenType.STRING:
-            node.label = "value"
-            node.add_child(self.leaf_node(TokenType.STRING))
-        elif self.current_token.type == TokenType.NUMBER:
-            node.label = "value"
-            node.add_child(self.leaf_node(TokenType.NUMBER))
-        elif self.current_token.type == TokenType.BOOL_TRUE:
-            node.label = "value"
-            node.add_child(self.leaf_node(TokenType.BOOL_TRUE))
-        elif self.current_token.type == TokenType.BOOL_FALSE:
-            node.label = "value"
-            node.add_child(self.leaf_node(TokenType.BOOL_FALSE))
-        elif self.current_token.type == TokenType.NULL:
-            node.label = "value"
-            node.add_child(self.leaf_node(TokenType.NULL))
-        # THE ABOVE CONDITIONS CHECK FOR NODES THAT FALL UNDER "value"
-        # IN THE PROVIDED JSON GRAMMAR
-
-        # THE FOLLOWING CONDITIONS CHECK FOR NODES THAT FALL UNDER "list",
-        # IN THE PROVIDED JSON GRAMMAR
-        else:
-            errors.append(f"Unexpected token {self.current_token.type} in value at Token {self.current_index}")
-            self.get_next_token()
-        return node 
-        
-    def dict(self):
-        node = Node(label="dict")
-        self.eat(TokenType.LBRACE, node)  # adds "{" as a node
-
-        # eat as many pairs as necessary until we close the dict
-        while self.current_token.type != TokenType.RBRACE:
-            node.add_child(self.pair())
-            if self.current_token.type == TokenType.COMMA:
-                self.eat(TokenType.COMMA, node)
-
-        self.eat(TokenType.RBRACE, node)  # adds "}" as a node
-        return node
-
-    def pair(self):
-        node = Node(label="pair")
-        if self.current_token.type == TokenType.STRING:
-            node.add_child(self.parse())  # adds the STRING key
-            self.eat(TokenType.COLON, node)   # adds ":" as a node
-            node.add_child(self.parse())      # adds the value node
-        else:
-            errors.append(f"Expected STRING in pair but got {self.current_token.type} at Token {self.current_index}")
-            self.get_next_token()
-
-        return node
-
-    def list(self):
-        node = Node(label="list")
-        self.eat(TokenType.LBRACKET, node)  # opening square bracket [
-
-        # eat as many pairs as necessary until we close the dict
-        while self.current_token.type != TokenType.RBRACKET:
-            node.add_child(self.parse())
-            if self.current_token.type == TokenType.COMMA:
-                self.eat(TokenType.COMMA, node)
-
-        self.eat(TokenType.RBRACKET, node)  # closing square bracket ]
-        return node
+        root = Node()  # holds the top level value until parsing is done
+        stack = [(VALUE, root)]
+        while stack:
+            step, node = stack.pop()
+
+            # THE FOLLOWING CONDITIONS CHECK FOR NODES THAT FALL UNDER "value"
+            # IN THE PROVIDED JSON GRAMMAR
+            # NOTE: "pair" is implicitly handled here since it falls under "dict"
+            if step == VALUE:
+                value = Node()  # create a placeholder node, content to be decided by token!
+                node.add_child(value)
+                token_type = self.current_token.type
+                if token_type == TokenType.LBRACE:
+                    value.label = "value"
+                    child = Node(label="dict")
+                    value.add_child(child)
+                    self.eat(TokenType.LBRACE, child)  # adds "{" as a node
+                    stack.append((DICT, child))
+                elif token_type == TokenType.LBRACKET:
+                    value.label = "value"
+                    child = Node(label="list")
+                    value.add_child(child)
+                    self.eat(TokenType.LBRACKET, child)  # opening square bracket [
+                    stack.append((LIST, child))
+                elif token_type in LEAF_TYPES:
+                    value.label = "value"
+                    value.add_child(self.leaf_node(token_type))
+                else:
+                    self.errors.append(f"Unexpected token {token_type} in value at Token {self.current_index}")
+                    self.get_next_token()
+
+            # eat as many pairs as necessary until we close the dict
+            elif step == DICT or step == DICT_NEXT:
+                if step == DICT_NEXT and self.current_token.type == TokenType.COMMA:
+                    self.eat(TokenType.COMMA, node)
+                if self.current_token.type == TokenType.RBRACE or self.current_token.type == TokenType.EOF:
+                    self.eat(TokenType.RBRACE, node)  # adds "}" as a node
+                    continue
+                pair = Node(label="pair")
+                node.add_child(pair)
+                stack.append((DICT_NEXT, node))
+                if self.current_token.type == TokenType.STRING:
+                    stack.append((PAIR_VALUE, pair))
+                    stack.append((VALUE, pair))  # adds the STRING key
+                else:
+                    self.errors.append(f"Expected STRING in pair but got {self.current_token.type} at Token {self.current_index}")
+                    self.get_next_token()
+
+            elif step == PAIR_VALUE:
+                self.eat(TokenType.COLON, node)  # adds ":" as a node
+                stack.append((VALUE, node))  # adds the value node
+
+            # eat as many values as necessary until we close the list
+            elif step == LIST or step == LIST_NEXT:
+                if step == LIST_NEXT and self.current_token.type == TokenType.COMMA:
+                    self.eat(TokenType.COMMA, node)
+                if self.current_token.type == TokenType.RBRACKET or self.current_token.type == TokenType.EOF:
+                    self.eat(TokenType.RBRACKET, node)  # closing square bracket ]
+                    continue
+                stack.append((LIST_NEXT, node))
+                stack.append((VALUE, node))
+
+        return root.children[0]
 
     def leaf_node(self, token_type):
-        label = self.current_token.parse
+        label = self.current_token.value
         node = Node(label=label, is_leaf=True, token_type=token_type) 
         self.eat(token_type, node)
         return node
 
 if __name__ == "__main__":
-    global errors
     errors = []
     token_file = "sample inputs parser/input1.txt"  # input token file generated by scanner
     error_output_file = "errors.txt"
     output_file = "output.txt"
     
-    parser = Parser(token_file)
+    parser = Parser(token_file, errors=errors)
     parse_tree = parser.parse()
     with open(output_file, "w") as file:
-        parse_tree.print_tree(file)
+        parse_tree.print_tree(file, show_types=True)
     
     with open(error_output_file, "w") as file:
         file.write("ERROR LIST:\n")
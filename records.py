@@ -0,0 +1,127 @@
+# validation of newline-delimited json (json lines / ndjson): one json document per line
+# every line is its own record, scanned and semantically checked on its own with compiler.compile_json,
+# so duplicate keys, list types and token numbers all start over with each record and errors never
+# leak from one record into the next. only one record is held in memory at a time.
+# errors come out in file order as (record number, byte offset of the record, error message),
+# where the record number is the line number (starting at 1, blank lines are skipped but still counted).
+# lexer error positions are characters from the start of the record's line, leading whitespace included.
+#
+# with workers > 1 the file is cut into byte ranges at line boundaries and the ranges are checked
+# in a pool of worker processes, the errors are put back together in file order.
+#
+#   python records.py feed.ndjson --workers 4
+
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from compiler import compile_json
+from rules import RuleSet
+
+# ranges smaller than this aren't worth sending to another process
+MIN_RANGE_SIZE = 1 << 20
+
+# (line number in the range, byte offset, text) for every line that starts in [start, end).
+# only the end of the line is stripped, so positions in the text still count from the offset
+def iter_lines(path, start=0, end=None):
+    with open(path, "rb") as file:
+        file.seek(start)
+        offset = start
+        number = 0
+        while end is None or offset < end:
+            line = file.readline()
+            if not line:
+                break
+            number += 1
+            yield number, offset, line.decode("utf-8", errors="replace").rstrip()
+            offset += len(line)
+
+# (record number, offset, message) for every error in the records in [start, end), as they are found.
+# record numbers are counted from the start of the range
+def iter_record_errors(path, start=0, end=None, engine="regex"):
+    rules = RuleSet() # rule state lives in the parser, so one rule set is enough for every record
+    for number, offset, text in iter_lines(path, start, end):
+        if text:
+            ast, errors = compile_json(text, engine=engine, rules=rules)
+            for error in errors:
+                yield number, offset, error
+
+# lines that start in [start, end), read in blocks so the range is never held in memory
+def count_lines(path, start, end):
+    lines = 0
+    last = b"\n"
+    with open(path, "rb") as file:
+        file.seek(start)
+        while start < end:
+            block = file.read(min(MIN_RANGE_SIZE, end - start))
+            if not block:
+                break
+            lines += block.count(b"\n")
+            last = block[-1:]
+            start += len(block)
+    return lines + (last != b"\n") # the last line doesn't have to end with a newline
+
+# errors of the records in [start, end) and the number of lines in it, so the record numbers can be made global
+def validate_range(path, start, end, engine="regex"):
+    return list(iter_record_errors(path, start, end, engine)), count_lines(path, start, end)
+
+# byte offsets that cut the file into about count ranges, each one starting at the beginning of a line
+def split_points(path, count):
+    size = os.path.getsize(path)
+    points = [0]
+    with open(path, "rb") as file:
+        for index in range(1, count):
+            file.seek(max(size * index // count, points[-1]))
+            if file.tell() > 0:
+                file.seek(file.tell() - 1)
+                file.readline() # skip to the end of the line the cut fell in
+            if file.tell() >= size:
+                break
+            if file.tell() > points[-1]:
+                points.append(file.tell())
+    points.append(size)
+    return points
+
+def validate_range_args(args):
+    return validate_range(*args)
+
+# every error in the file as (record number, offset, message), in file order
+def validate_records(path, workers=1, engine="regex"):
+    if workers == 1 or os.path.getsize(path) < 2 * MIN_RANGE_SIZE:
+        return list(iter_record_errors(path, engine=engine))
+
+    count = max(1, min(workers * 4, os.path.getsize(path) // MIN_RANGE_SIZE))
+    points = split_points(path, count)
+    ranges = [(path, start, end, engine) for start, end in zip(points, points[1:])]
+    errors = []
+    first_line = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for range_errors, lines in pool.map(validate_range_args, ranges):
+            errors.extend((first_line + number, offset, error) for number, offset, error in range_errors)
+            first_line += lines
+    return errors
+
+def main(argv=None):
+    arguments = argparse.ArgumentParser(description="Validate a newline-delimited json file one record at a time.")
+    arguments.add_argument("path")
+    arguments.add_argument("--workers", type=int, default=1, help="worker processes to split the file across (default: 1)")
+    arguments.add_argument("--engine", choices=["regex", "dfa"], default="regex")
+    options = arguments.parse_args(argv)
+
+    # with one worker errors are printed as they are found
+    if options.workers == 1:
+        errors = iter_record_errors(options.path, engine=options.engine)
+    else:
+        errors = validate_records(options.path, options.workers, options.engine)
+    count = 0
+    records = set()
+    for number, offset, error in errors:
+        print(f"Record {number} (offset {offset}): {error}")
+        count += 1
+        records.add(number)
+    print(f"{count} error(s) in {len(records)} record(s)")
+    return 1 if count else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
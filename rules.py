@@ -0,0 +1,286 @@
+# semantic rules for the semantic parser
+# every Type 1-7 check is its own Rule. a rule says which nodes it looks at:
+#   "key"     - every STRING key of a dict, with state kept per dict (check_key)
+#   "element" - the first token of every value in a list, with state kept per list (check_element)
+#   "leaf"    - every leaf whose token type is in token_types (check_leaf)
+# a RuleSet picks the enabled rules and precomputes which ones to call for each of those,
+# so the parser only loops over the rules that apply and disabled rules cost nothing.
+#
+# in-house rules are added by subclassing Rule and registering it:
+#   @register
+#   class NoUppercaseKeys(Rule):
+#       name = "no-uppercase-keys"
+#       kinds = ("key",)
+#       pure = True
+#       def check_key(self, key, index, state, errors):
+#           if key != key.lower():
+#               self.report(errors, f"Uppercase key '{key}' at Token {index}")
+
+import copy
+import time
+
+from core import TokenType
+from numeric import NUMBER, BufferNumbers, number_error
+from shapes import ShapeCache
+
+# every registered rule class by name, in the order they were registered (which is the order they run in)
+RULES = {}
+
+def register(rule_class):
+    RULES[rule_class.name] = rule_class
+    return rule_class
+
+class Rule:
+    name = None
+    kinds = ()
+    token_types = ()
+    version = 1 # bump when the rule's checks or messages change, cached results (see cache.py) depend on it
+    # True when a check only depends on what it's given (and the state, for key and element rules),
+    # so dict keys it passed once don't have to be checked again for the same shape (see shapes.py)
+    pure = False
+
+    def __init__(self):
+        self.hits = 0 # errors reported by this rule
+
+    def report(self, errors, message):
+        self.hits += 1
+        errors.append(message)
+
+    # fresh state for every dict ("key" rules) or list ("element" rules)
+    def container_state(self):
+        return None
+
+    def check_key(self, key, index, state, errors):
+        pass
+
+    def check_element(self, token_type, index, state, errors):
+        pass
+
+    def check_leaf(self, token_type, value, index, errors):
+        pass
+
+# rules are registered in the order the checks ran in the original parser, so errors come out in the same order
+
+# checking for Type 5 Error: No Duplicate Keys in Dictionary
+# the keys seen so far are kept in a set, so wide dicts stay linear
+@register
+class DuplicateKey(Rule):
+    name = "type5"
+    kinds = ("key",)
+    pure = True
+
+    def container_state(self):
+        return set()
+
+    def check_key(self, key, index, state, errors):
+        if key in state:
+            self.report(errors, f"Type 5 Error: Duplicate key '{key}' at Token {index}")
+        else:
+            state.add(key)
+
+# checking for Type 4 Error: Reserved Words as Dictionary Key
+@register
+class ReservedKey(Rule):
+    name = "type4"
+    kinds = ("key",)
+    pure = True
+
+    def check_key(self, key, index, state, errors):
+        if key == "true" or key == "false" or key == "null":
+            self.report(errors, f"Type 4 Error: Reserved word '{key}' cannot be a dictionary key at Token {index}")
+
+# checking for Type 2 Error: Empty key
+# either null or just completely blank
+@register
+class EmptyKey(Rule):
+    name = "type2"
+    kinds = ("key",)
+    pure = True
+
+    def check_key(self, key, index, state, errors):
+        if not key or all(char == ' ' for char in key):
+            self.report(errors, f"Type 2 Error: Empty dictionary key at Token {index}")
+
+# checking for Type 6 Error: Consistent Types for List Elements
+# state is the type to be stored in our list (i.e STRING, NUMBER, etc) and whether it was already reported
+@register
+class ListTypes(Rule):
+    name = "type6"
+    kinds = ("element",)
+    pure = True
+
+    def container_state(self):
+        return [None, False]
+
+    def check_element(self, token_type, index, state, errors):
+        if state[0] is None:
+            state[0] = token_type # set the type of the list to its first element's type
+        elif token_type != state[0] and not state[1]:
+            self.report(errors, f"Type 6 Error: Inconsistent types in list at Token {index}. Expected {state[0]} and got {token_type}.")
+            state[1] = True # boolean to prevent spamming errors list with this error
+
+# checking for Type 1 Error: Invalid Decimal Numbers
+# numbers are checked against the json number grammar (numeric.NUMBER), only the ones that don't match are
+# looked at any further. Type 1 takes the ones with a "." in them and Type 3 the rest, see numeric.number_error
+@register
+class InvalidDecimal(Rule):
+    name = "type1"
+    kinds = ("leaf",)
+    pure = True
+    token_types = (TokenType.NUMBER,)
+    version = 2
+
+    def check_leaf(self, token_type, value, index, errors):
+        if '.' in value and NUMBER.fullmatch(value) is None:
+            self.report(errors, number_error(value, index))
+
+# checking for Type 3 Error: Invalid Numbers (leading zeros, a leading '+', or anything else the grammar doesn't allow)
+@register
+class InvalidNumber(Rule):
+    name = "type3"
+    kinds = ("leaf",)
+    pure = True
+    token_types = (TokenType.NUMBER,)
+    version = 2
+
+    def check_leaf(self, token_type, value, index, errors):
+        if '.' not in value and NUMBER.fullmatch(value) is None:
+            self.report(errors, number_error(value, index))
+
+# checking for Type 7 Error: Reserved Words as Strings
+@register
+class ReservedString(Rule):
+    name = "type7"
+    kinds = ("leaf",)
+    pure = True
+    token_types = (TokenType.STRING,)
+
+    def check_leaf(self, token_type, value, index, errors):
+        if value == "true" or value == "false":
+            self.report(errors, f"Type 7 Error: Reserved word '{value}' cannot be used as a string at Token {index}")
+
+# stands in for a rule when timing is on, counts calls and time spent and passes everything through
+class TimedRule:
+    def __init__(self, rule):
+        self.rule = rule
+        self.calls = 0
+        self.seconds = 0.0
+
+    def container_state(self):
+        return self.rule.container_state()
+
+    def check_key(self, key, index, state, errors):
+        start = time.perf_counter()
+        self.rule.check_key(key, index, state, errors)
+        self.seconds += time.perf_counter() - start
+        self.calls += 1
+
+    def check_element(self, token_type, index, state, errors):
+        start = time.perf_counter()
+        self.rule.check_element(token_type, index, state, errors)
+        self.seconds += time.perf_counter() - start
+        self.calls += 1
+
+    def check_leaf(self, token_type, value, index, errors):
+        start = time.perf_counter()
+        self.rule.check_leaf(token_type, value, index, errors)
+        self.seconds += time.perf_counter() - start
+        self.calls += 1
+
+# calls the check_leaf of number rules (a run of them that are next to each other) only for the numbers
+# that are invalid, see RuleSet.batched
+class BatchedNumberRule:
+    def __init__(self, numbers):
+        self.numbers = numbers
+        self.callers = []
+
+    def check_leaf(self, token_type, value, index, errors):
+        numbers = self.numbers
+        if index >= numbers.checked:
+            numbers.check()
+        if index in numbers.found:
+            for caller in self.callers:
+                caller.check_leaf(token_type, value, index, errors)
+
+# the rules used for one run
+# enabled/disabled are rule names, enabled defaults to every registered rule.
+# extra rules can be passed as instances (they don't need to be registered).
+# with timed=True every rule call is counted and timed, see stats()
+class RuleSet:
+    def __init__(self, enabled=None, disabled=(), extra=(), timed=False):
+        unknown = (set(enabled or ()) | set(disabled)) - set(RULES)
+        if unknown:
+            raise ValueError(f"Unknown rules: {', '.join(sorted(unknown))}")
+        self.rules = [rule() for name, rule in RULES.items()
+                      if (enabled is None or name in enabled) and name not in disabled]
+        self.rules.extend(extra)
+        self.timed = timed
+        self.build_tables()
+
+    # precomputes which rules run for keys, list elements and each leaf token type
+    def build_tables(self):
+        callers = [TimedRule(rule) if self.timed else rule for rule in self.rules]
+        self.callers = dict(zip((rule.name for rule in self.rules), callers))
+        pairs = list(zip(self.rules, callers))
+
+        self.key_rules = [caller for rule, caller in pairs if "key" in rule.kinds]
+        self.element_rules = [caller for rule, caller in pairs if "element" in rule.kinds]
+
+        self.leaf_table = {}
+        for token_type in (TokenType.STRING, TokenType.NUMBER, TokenType.BOOL_TRUE, TokenType.BOOL_FALSE, TokenType.NULL):
+            callers = [caller for rule, caller in pairs
+                       if "leaf" in rule.kinds and (not rule.token_types or token_type in rule.token_types)]
+            if callers:
+                self.leaf_table[token_type] = callers
+
+        # the rules every dict key goes through, dict shapes are only cached when all of them are pure
+        key_checks = [rule for rule in self.rules if "key" in rule.kinds or
+                      ("leaf" in rule.kinds and (not rule.token_types or TokenType.STRING in rule.token_types))]
+        self.shapes = ShapeCache() if all(rule.pure for rule in key_checks) else None
+
+    def enable(self, name):
+        if name not in self.callers:
+            self.rules.append(RULES[name]())
+            self.build_tables()
+
+    def disable(self, name):
+        self.rules = [rule for rule in self.rules if rule.name != name]
+        self.build_tables()
+
+    # a copy for parsing the tokens of a tokenbuffer.TokenBuffer: the Type 1 and Type 3 rules are only called for
+    # the numbers numeric.BufferNumbers finds invalid, a batch of the buffer's tokens at a time, instead of
+    # matching every number on its own. they are still called at the number's token, so the errors keep their order
+    def batched(self, buffer):
+        callers = self.leaf_table.get(TokenType.NUMBER)
+        gated = {id(self.callers[rule.name]) for rule in self.rules if type(rule) in (InvalidDecimal, InvalidNumber)}
+        if not callers or not gated:
+            return self
+        numbers = BufferNumbers(buffer)
+        number_callers = []
+        for caller in callers:
+            if id(caller) not in gated:
+                number_callers.append(caller)
+                continue
+            if not number_callers or not isinstance(number_callers[-1], BatchedNumberRule):
+                number_callers.append(BatchedNumberRule(numbers))
+            number_callers[-1].callers.append(caller)
+        batched = copy.copy(self)
+        batched.leaf_table = dict(self.leaf_table)
+        batched.leaf_table[TokenType.NUMBER] = number_callers
+        return batched
+
+    # names and versions of the rules that run, in order. two rule sets with the same signature find the same errors
+    def signature(self):
+        return ",".join(f"{rule.name}:{type(rule).__module__}.{type(rule).__qualname__}:{rule.version}" for rule in self.rules)
+
+    # hits, calls and seconds for every rule (calls and seconds are only counted when timed)
+    def stats(self):
+        result = {}
+        for rule in self.rules:
+            caller = self.callers[rule.name]
+            result[rule.name] = {
+                "hits": rule.hits,
+                "calls": caller.calls if self.timed else None,
+                "seconds": caller.seconds if self.timed else None,
+            }
+        return result
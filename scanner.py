@@ -1,29 +1,11 @@
 # I would like to credit the supplementary scanner provided on Brightspace (2024) for the CSCI 2115 Fall24 class.
 # The code provided in that example was referenced for things like creating tokens and my lexer. Thank you!
 
-class TokenType: # JSON token types
-    LBRACE = '{' # '{'
-    RBRACE = '}' # '}'
-    LBRACKET = '[' # '['
-    RBRACKET = ']' # ']'
-    COMMA = ',' # ','
-    COLON = ':' # ':'
-    STRING = 'STRING' # strings
-    NUMBER = 'NUMBER' # numeric values
-    BOOL_TRUE = 'BOOL_TRUE' # true
-    BOOL_FALSE = 'BOOL_FALSE' # false
-    NULL = 'NULL' # null
-    EOF = 'EOF' # end of input
-
-class Token:
-    def __init__(self, type_, value=None):
-        self.type = type_
-        self.value = value
-
-    def __repr__(self):
-        if self.value is not None:
-            return f"<{self.type}, {self.value}>"
-        return f"<{self.type}>"
+import codecs
+import mmap
+import re
+
+from core import TokenType, Token, default_errors
 
 class LexerError(Exception):
     def __init__(self, position, character):
@@ -31,6 +13,23 @@ class LexerError(Exception):
         self.character = character
         super().__init__(f"Invalid character '{character}' at position {position}!")
 
+# a backslash inside a string starts an escape, the valid ones are \" \\ \/ \b \f \n \r \t and \uXXXX
+# escapes are matched pairwise so "\\x" is read as an escaped backslash followed by x
+ESCAPE_PATTERN = re.compile(r'\\(?:(["\\/bfnrt]|u[0-9a-fA-F]{4})|(.?))', re.DOTALL)
+
+# string values are kept exactly as written, escapes are only checked, not decoded
+# position is where the string's value starts in the input
+def check_escapes(value, position, errors=None):
+    if errors is None:
+        errors = default_errors()
+    for match in ESCAPE_PATTERN.finditer(value):
+        if match.group(2) is not None:
+            errors.append(f"Lexer Error: Invalid escape sequence '{match.group()}' at position {position + match.start()}!")
+
+# characters a NUMBER is made of. digits are the ascii ones only (like in the json grammar, numeric.NUMBER),
+# every engine goes by this, so a character like '²' is an invalid character everywhere
+NUMBER_CHARS = "0123456789.eE+-"
+
 # dfa class that reads input using a lexer object
 # uses dfas to recognize numbers and strings (other types are trivial)
 # the assumption is that by completing a method and returning a token without encountering an error,
@@ -40,15 +39,23 @@ class DFA:
     def recognize_string(self, lexer):
         result = ''
         lexer.advance() # skip opening quote
+        start = lexer.position
         while lexer.current_char is not None and lexer.current_char != '"':
+            if lexer.current_char == '\\': # an escaped character never ends the string
+                result += lexer.current_char
+                lexer.advance()
+                if lexer.current_char is None:
+                    break
             result += lexer.current_char
             lexer.advance()
         lexer.advance() # skip closing quote
+        if '\\' in result:
+            check_escapes(result, start, lexer.errors)
         return Token(TokenType.STRING, result)
     
     def recognize_number(self, lexer):
         result = ''
-        while lexer.current_char is not None and (lexer.current_char.isdigit() or lexer.current_char in ['.', 'e', 'E', '-', '+']):
+        while lexer.current_char is not None and lexer.current_char in NUMBER_CHARS:
             result += lexer.current_char
             lexer.advance()
         return Token(TokenType.NUMBER, result)
@@ -78,7 +85,7 @@ class DFA:
                 return Token(TokenType.COMMA)
             if lexer.current_char == '"':
                 return self.recognize_string(lexer)
-            if lexer.current_char.isdigit() or lexer.current_char in ['.', 'e', 'E', '-', '+']:
+            if lexer.current_char in NUMBER_CHARS:
                 return self.recognize_number(lexer)
             if lexer.current_char == 't' and lexer.input_text[lexer.position:lexer.position + 4] == 'true':
                 lexer.position += 4
@@ -95,23 +102,232 @@ class DFA:
             raise LexerError(lexer.position, lexer.current_char)
         return Token(TokenType.EOF)
     
-    def tokenize(self, lexer):
-        tokens = []
+    # yields tokens one at a time so a parser can consume them as soon as they are scanned
+    # errors go to lexer.errors. with lexer.recover a run of invalid characters is skipped in one go (see bad_run_end)
+    def iter_tokens(self, lexer):
         while True:
             try:
                 token = self.useDFA(lexer)
-                if token.type == TokenType.EOF:
-                    break
-                tokens.append(token)
             except LexerError as e:
-                errors.append(f"Lexer Error: {e}")
+                if lexer.recover:
+                    end = bad_run_end(lexer.input_text, lexer.position)
+                    lexer.errors.append(bad_run_error(lexer.input_text, lexer.position, end))
+                    lexer.position = end - 1
+                else:
+                    lexer.errors.append(f"Lexer Error: {e}")
                 lexer.advance()
-        return tokens
+                continue
+            if token.type == TokenType.EOF:
+                return
+            yield token
+
+    def tokenize(self, lexer):
+        return list(self.iter_tokens(lexer))
+
+# second scanner engine, selected with ENGINES["regex"]
+# instead of walking the lexer one character at a time, one compiled pattern matches a whole token
+# (plus the whitespace in front of it) and values are sliced straight out of lexer.input_text.
+# it produces the same tokens and errors as DFA, just without a python call per character
+TOKEN_PATTERN = re.compile(r'''
+    \s*
+    (?:
+        ([\[\]{}:,])                           # 1: punctuation
+      | "([^"\\]*(?:\\.[^"\\]*)*)"             # 2: string, escapes are skipped pairwise
+      | ([0-9.eE+\-]+)                       # 3: number, NUMBER_CHARS
+      | (true|false|null)                    # 4: keyword
+      | (\S)                                 # 5: anything else, handed back to the DFA
+    )
+''', re.VERBOSE | re.DOTALL)
+
+# recovery mode: instead of one error per invalid character, a whole run of characters that can't start
+# a token is matched at once and reported as one range error. a character can't start a token when it isn't
+# whitespace, punctuation, a quote, something a number can start with, or the start of true/false/null
+BAD_RUN = re.compile(r'(?:[^\s\[\]{}:,"0-9.eE+\-tfn]|t(?!rue)|f(?!alse)|n(?!ull))+')
+PREVIEW_SIZE = 20
+
+# where the run of invalid characters starting at pos ends
+def bad_run_end(text, pos):
+    found = BAD_RUN.match(text, pos)
+    end = found.end() if found else pos + 1
+    return max(end, pos + 1)
+
+# one character gets the same message as without recovery, a longer run is shown (cut short) with its range.
+# base is where text starts in the whole input
+def bad_run_error(text, start, end, base=0):
+    if end - start == 1:
+        return f"Lexer Error: {LexerError(base + start, text[start])}"
+    preview = text[start:min(end, start + PREVIEW_SIZE)] + ("..." if end - start > PREVIEW_SIZE else "")
+    return f"Lexer Error: Invalid characters '{preview}' at positions {base + start}-{base + end - 1}!"
+
+# tokens without a value of their own are never changed, so one shared object per type is enough
+SHARED_TOKENS = {
+    '{': Token(TokenType.LBRACE),
+    '}': Token(TokenType.RBRACE),
+    '[': Token(TokenType.LBRACKET),
+    ']': Token(TokenType.RBRACKET),
+    ',': Token(TokenType.COMMA),
+    ':': Token(TokenType.COLON),
+    'true': Token(TokenType.BOOL_TRUE, 'true'),
+    'false': Token(TokenType.BOOL_FALSE, 'false'),
+    'null': Token(TokenType.NULL, 'null'),
+}
+
+# scans text with TOKEN_PATTERN starting at pos and yields tokens, returns the position it stopped at.
+# base is where text starts in the whole input, so error positions stay correct for chunks of a file.
+# when final is False, text is only one chunk of a bigger input: a number that reaches the end of text
+# or a string/keyword cut off by it might carry on in the next chunk, so the scan stops in front of it
+# and the caller hands that part back in along with the next chunk.
+# errors is the list lexer errors go to, with recover runs of invalid characters are one error (see BAD_RUN)
+def scan_text(text, pos=0, base=0, final=True, errors=None, recover=False):
+    if errors is None:
+        errors = default_errors()
+    size = len(text)
+    shared = SHARED_TOKENS
+    while True:
+        for found in TOKEN_PATTERN.finditer(text, pos):
+            kind = found.lastindex
+            if kind == 1 or kind == 4:
+                yield shared[found.group(kind)]
+            elif kind == 2:
+                value = found.group(2)
+                if '\\' in value:
+                    check_escapes(value, base + found.start(2), errors)
+                yield Token(TokenType.STRING, value)
+            elif kind == 3:
+                if not final and found.end() == size:
+                    return found.start()
+                yield Token(TokenType.NUMBER, found.group(3))
+            else:
+                break
+        else:
+            return size # nothing but whitespace is left
+
+        pos = found.start(5)
+        if not final and (text[pos] == '"' or size - pos < 5):
+            return pos
+
+        # a string that is never closed takes the rest of the input, like it does in the DFA
+        if text[pos] == '"':
+            value = text[pos + 1:]
+            if '\\' in value:
+                check_escapes(value, base + pos + 1, errors)
+            yield Token(TokenType.STRING, value)
+            return size
+
+        # anything else is rare enough that the original DFA handles it exactly like it always has
+        lexer = Lexer(text, errors)
+        lexer.position = pos
+        lexer.current_char = text[pos]
+        try:
+            token = DFA().useDFA(lexer)
+        except LexerError as e:
+            if recover:
+                end = bad_run_end(text, pos)
+                if not final and size - end < 5:
+                    return pos # the run might carry on in the next chunk
+                errors.append(bad_run_error(text, pos, end, base))
+                pos = end
+            else:
+                errors.append(f"Lexer Error: {LexerError(base + e.position, e.character)}")
+                pos += 1
+            continue
+        pos = lexer.position
+        yield token
+
+class RegexDFA(DFA):
+    def useDFA(self, lexer):
+        found = TOKEN_PATTERN.match(lexer.input_text, lexer.position)
+        if found is None or found.lastindex == 5:
+            # nothing but whitespace is left, a string is never closed or the character is invalid.
+            # these are rare so the original DFA handles them exactly like it always has
+            return DFA.useDFA(self, lexer)
+        lexer.position = found.end()
+        lexer.current_char = lexer.input_text[lexer.position] if lexer.position < len(lexer.input_text) else None
+        kind = found.lastindex
+        if kind == 2:
+            value = found.group(2)
+            if '\\' in value:
+                check_escapes(value, found.start(2), lexer.errors)
+            return Token(TokenType.STRING, value)
+        if kind == 3:
+            return Token(TokenType.NUMBER, found.group(3))
+        return SHARED_TOKENS[found.group(kind)]
+
+    # lexer.position is written back once the scan finishes
+    def iter_tokens(self, lexer):
+        lexer.position = yield from scan_text(lexer.input_text, lexer.position, errors=lexer.errors, recover=lexer.recover)
+        lexer.current_char = lexer.input_text[lexer.position] if lexer.position < len(lexer.input_text) else None
+
+# streams tokens out of a json file without ever holding the whole document (or its tokens) in memory.
+# the file is memory-mapped, or read chunk by chunk when it can't be (empty files, pipes), and decoded
+# chunk_size bytes at a time. anything scan_text leaves at the end of a chunk is carried into the next one,
+# so only the largest single token decides how much text is held at once.
+# a carried token is only scanned again once at least as much new text has arrived, which keeps
+# a string spread over many chunks linear instead of rescanning it for every chunk.
+# error positions are character offsets into the file. errors and recover are passed on to scan_text.
+# start is a byte offset (at a token boundary) to begin at instead of the top, base the character offset it has
+def iter_file_tokens(path, chunk_size=1 << 20, errors=None, recover=False, start=0, base=0):
+    if errors is None:
+        errors = default_errors()
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    text = ''
+    carried = 0
+    for chunk in read_chunks(path, chunk_size, start):
+        text += decoder.decode(chunk)
+        if len(text) < 2 * carried:
+            continue
+        stop = yield from scan_text(text, 0, base, final=False, errors=errors, recover=recover)
+        text = text[stop:]
+        carried = len(text)
+        base += stop
+    text += decoder.decode(b'', final=True)
+    yield from scan_text(text, 0, base, errors=errors, recover=recover)
+
+def read_chunks(path, chunk_size, start=0):
+    with open(path, 'rb') as file:
+        try:
+            view = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError):
+            view = None
+        if view is None:
+            file.seek(start)
+            chunk = file.read(chunk_size)
+            while chunk:
+                yield chunk
+                chunk = file.read(chunk_size)
+            return
+        with view:
+            for position in range(start, len(view), chunk_size):
+                chunk = view[position:position + chunk_size]
+                # the chunk has been copied out, so its pages no longer need to count towards our memory
+                # (from the page it starts in, madvise only takes page aligned offsets)
+                if hasattr(view, 'madvise'):
+                    page = position - position % mmap.PAGESIZE
+                    view.madvise(mmap.MADV_DONTNEED, page, position + len(chunk) - page)
+                yield chunk
+
+# third scanner engine, selected with ENGINES["structural"]: a structural index of the whole input is built
+# with numpy first and tokens are made from it, see structural.py. same tokens and errors again
+class StructuralDFA(RegexDFA):
+    def iter_tokens(self, lexer):
+        from structural import iter_structural_tokens # imported here since structural needs this module first
+        lexer.position = yield from iter_structural_tokens(lexer.input_text, lexer.position, lexer.errors, lexer.recover)
+
+# scanner engines that can be picked by name, e.g. ENGINES["regex"]().tokenize(lexer)
+ENGINES = {
+    'dfa': DFA,
+    'regex': RegexDFA,
+    'structural': StructuralDFA,
+}
 
 # lexer class used to read over json input
 # utilized by DFA class to receive input
+# errors is the list the run's lexer errors go to (core.errors if none is given),
+# recover turns on recovery mode for runs of invalid characters (see BAD_RUN)
 class Lexer:
-    def __init__(self, input_text):
+    def __init__(self, input_text, errors=None, recover=False):
+        self.errors = errors if errors is not None else default_errors()
+        self.recover = recover
         self.input_text = input_text
         self.position = 0
         self.current_char = self.input_text[self.position] if self.input_text else None
@@ -130,31 +346,21 @@ class Lexer:
     
 
 # scanner reads input from the "sample inputs" folder
-# creates a lexer and DFA objects
-# uses lexer object to pass information to DFA
-# tokens are sent to output.txt
+# tokens are streamed out of the file and sent to output.txt as they are found,
+# so neither the input nor the token list is ever held in memory
 # lexer errors are printed to terminal
 if __name__ == "__main__":
-    global errors
     errors = []
-    input_string = ""
-    json_location = "sample inputs scanner\input1.json" 
+    json_location = "sample inputs scanner/input1.json"
     output_location = "output.txt"
 
-    with open(json_location, 'r') as file:
-        for line in file:
-            input_string += line.strip()
-    lexer = Lexer(input_string)
-    tokens = DFA() # need to create the DFA object separately first so python can send the "self" argument to tokens.tokenize()
-    tokens = tokens.tokenize(lexer)
-    
     # send each token on its own line to output.txt
     with open(output_location, 'w') as file:
-        for i in range(0,len(tokens)):
-            if i < len(tokens) - 1:
-                file.write(tokens[i].__repr__() + "\n")
-            else: file.write(tokens[i].__repr__())
-    
+        separator = ""
+        for token in iter_file_tokens(json_location, errors=errors):
+            file.write(separator + token.__repr__())
+            separator = "\n"
+
     # print all lexer errors to terminal
     for error in errors:
         print(error)
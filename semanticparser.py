@@ -1,73 +1,42 @@
-class TokenType:  # JSON token types
-    LBRACE = '{'  # '{'
-    RBRACE = '}'  # '}'
-    LBRACKET = '['  # '['
-    RBRACKET = ']'  # ']'
-    COMMA = ','  # ','
-    COLON = ':'  # ':'
-    STRING = 'STRING'  # strings
-    NUMBER = 'NUMBER'  # numeric values
-    BOOL_TRUE = 'BOOL_TRUE'  # true
-    BOOL_FALSE = 'BOOL_FALSE'  # false
-    NULL = 'NULL'  # null
-    EOF = 'EOF'  # end of input
-
-class Token:
-    def __init__(self, type_, value=None):
-        self.type = type_
-        self.parse = value
-
-    def __repr__(self):
-        if self.parse is not None:
-            return f"<{self.type}, {self.parse}>"
-        return f"<{self.type}>"
-
-class Node:
-    def __init__(self, label=None, is_leaf=False, token_type=None):
-        self.label = label
-        self.children = []
-        self.is_leaf = is_leaf
-        self.token_type = token_type  # token type to distinguish terminal symbols
-
-    def add_child(self, child):
-        self.children.append(child)
-
-    def print_tree(self, file, depth=0):
-        indent = "    " * (depth)
-        if self.is_leaf:  # terminal nodes like STRING, NUMBER, etc.
-            file.write(f"{indent}{self.label}\n")
-        else:
-            file.write(f"{indent}{self.label}\n")  # internal nodes (e.g., value, dict, list)
-            for child in self.children:
-                child.print_tree(file,depth + 1)  
-        
+from core import TokenType, Token, NodeTree, read_tokens, default_errors
+from rules import RuleSet
+
+# steps on the parser's stack
+VALUE = 0 # parse a value and add it to the node
+DICT = 1 # start of a dict's loop over its pairs
+DICT_NEXT = 2 # a pair was just parsed, eat the "," if there is one and carry on with the dict
+LIST = 3 # start of a list's loop over its values
+LIST_NEXT = 4 # a value was just parsed, eat the "," if there is one and carry on with the list
+
+LEAF_TYPES = {
+    TokenType.STRING,
+    TokenType.NUMBER,
+    TokenType.BOOL_TRUE,
+    TokenType.BOOL_FALSE,
+    TokenType.NULL,
+}
 
 class Parser:
-    def __init__(self, token_file):
-        self.tokens = self.read_tokens(token_file)
-        self.current_index = 0
-        self.current_token = self.tokens[0] if self.tokens else None
-
-    # have to create token objects somehow, so we do it quickly with this method
-    # tokens are read from the "sample input" file which contains scanner output
-    def read_tokens(self, token_file):
-        tokens = []
-        with open(token_file, 'r') as file:
-            for line in file:
-                line = line.strip()
-                if line.startswith('<') and line.endswith('>'):
-                    parts = line[1:-1].split(', ', 1)
-                    tokenType = parts[0]
-                    tokenValue = parts[1] if len(parts) > 1 else None
-                    tokens.append(Token(tokenType, tokenValue))
-        return tokens
+    # tokens either come from a scanner output file or straight from an iterable of Token objects
+    # (e.g. DFA.iter_tokens), they are pulled one at a time so the parser never needs the whole list
+    # tree is the builder the AST is made with, a NodeTree of Node objects unless another one is given
+    # rules is the rules.RuleSet of semantic checks to run, every registered rule unless another one is given
+    # errors is the list this run's errors go to, core.errors if none is given
+    # start is the index of the first token, when tokens are only part of a document (see lazy.py)
+    def __init__(self, token_file=None, tokens=None, tree=None, rules=None, errors=None, start=0):
+        self.errors = errors if errors is not None else default_errors()
+        if tokens is None:
+            tokens = read_tokens(token_file)
+        self.tokens = iter(tokens)
+        self.tree = tree if tree is not None else NodeTree()
+        self.rules = rules if rules is not None else RuleSet()
+        self.keys = {} # symbol table, every dict key of the document is kept as one string per distinct key
+        self.current_index = start
+        self.current_token = next(self.tokens, None) or Token(TokenType.EOF)
 
     def get_next_token(self):
         self.current_index += 1
-        if self.current_index < len(self.tokens):
-            self.current_token = self.tokens[self.current_index]
-        else:
-            self.current_token = Token(TokenType.EOF)
+        self.current_token = next(self.tokens, None) or Token(TokenType.EOF)
 
     # for the AST, the eat method is modified since we don't want terminals
     # instead of adding terminals to the tree, skip over them
@@ -75,131 +44,135 @@ class Parser:
         self.get_next_token()
 
     # parse method is also modified from Part 2 since we're outputting an AST
-    # we can now just directly return the result of whatever production we're
+    # we can now just directly add the result of whatever production we're
     # using since we want to cut unnecessary information from the parse tree
     # this leaves us with what we need for our AST and nothing in between
+    # like the parse tree, the grammar is walked with an explicit stack of steps instead of recursion,
+    # so nesting depth is only limited by memory. the steps run in the same order the recursive
+    # productions used to, so the semantic checks report the same errors in the same order.
+    # the checks themselves are the rules in self.rules (see rules.py), called for every dict key,
+    # every list element and every leaf. keys of a dict whose shape passed them before aren't checked again,
+    # see shapes.py
     def parse(self):
-        
-        if self.current_token.type == TokenType.LBRACE:
-            return self.dict()
-        elif self.current_token.type == TokenType.LBRACKET:
-            return self.list()
-        
-        # if it's not not a dict or a list: 
-        # we can just make leaf node directly out of whatever type the token is
-        elif self.current_token.type in {
-            TokenType.STRING,
-            TokenType.NUMBER,
-            TokenType.BOOL_TRUE,
-            TokenType.BOOL_FALSE,
-            TokenType.NULL,
-        }:
-            return self.leaf_node(self.current_token.type)
-        
-    def dict(self):
-        node = Node(label="dict")
-        self.eat()
-        seen_keys = []
-
-        # eat as many pairs as necessary until we close the dict
-        while self.current_token.type != TokenType.RBRACE:
-            if self.current_token.type == TokenType.STRING:
-                key = self.current_token.parse
-                
-                # checking for Type 5 Error: No Duplicate Keys in Dictionary
-                if key in seen_keys:
-                    errors.append(f"Type 5 Error: Duplicate key '{key}' at Token {self.current_index}")
+        tree = self.tree
+        errors = self.errors
+        keys = self.keys
+        shapes = self.rules.shapes
+        key_rules = self.rules.key_rules
+        element_rules = self.rules.element_rules
+        stack = [(VALUE, tree.root, None)]
+        while stack:
+            step, node, state = stack.pop()
+
+            if step == VALUE:
+                token_type = self.current_token.type
+                if token_type == TokenType.LBRACE:
+                    child = tree.add_container(node, "dict", self.current_index)
+                    self.eat()
+                    # state is what each key rule keeps for this dict (e.g. the keys seen so far)
+                    # and where the dict's keys so far are in the shape cache. as long as they are in it,
+                    # the key rule states aren't made yet
+                    if shapes is not None:
+                        stack.append((DICT, child, [None, shapes.root]))
+                    else:
+                        stack.append((DICT, child, [[rule.container_state() for rule in key_rules], None]))
+                elif token_type == TokenType.LBRACKET:
+                    child = tree.add_container(node, "list", self.current_index)
+                    self.eat()
+                    # state is the token the current value started at
+                    # and what each element rule keeps for this list (e.g. the type of its first element)
+                    stack.append((LIST, child, [0, [rule.container_state() for rule in element_rules]]))
+
+                # if it's not not a dict or a list:
+                # we can just make leaf node directly out of whatever type the token is
+                elif token_type in LEAF_TYPES:
+                    self.leaf_node(token_type, node)
                 else:
-                    seen_keys.append(key)
-
-            node.add_child(self.pair())
-            if self.current_token.type == TokenType.COMMA:
-                self.eat()
-
-        self.eat()
-        return node
-
-    def pair(self):
-        node = Node(label="pair")
-        if self.current_token.type == TokenType.STRING:
-            key_value = self.current_token.parse
-
-            # checking for Type 4 Error: Reserved Words as Dictionary Key
-            if self.current_token.parse == "true" or self.current_token.parse == "false" or self.current_token.parse == "null":
-                errors.append(f"Type 4 Error: Reserved word '{self.current_token.parse}' cannot be a dictionary key at Token {self.current_index}")
-            
-            # checking for Type 2 Error: Empty key
-            # either null or just completely blank
-            if not key_value or all(char == ' ' for char in key_value):
-                errors.append(f"Type 2 Error: Empty dictionary key at Token {self.current_index}")
-
-            node.add_child(self.parse())  # adds the STRING key
-            self.eat() 
-            node.add_child(self.parse())  # adds the value node
-        else:
-            self.get_next_token()
-        return node
-
-    def list(self):
-        node = Node(label="list")
-        self.eat()
-        first_type = None  # used to track the type to be stored in our list (i.e STRING, NUMBER, etc)
-        incorrect_types = False
-
-        # eat as many pairs as necessary until we close the dict
-        while self.current_token.type != TokenType.RBRACKET:
-            
-            # checking for Type 6 Error: Consistent Types for List Elements
-            if first_type is None:  
-                first_type = self.current_token.type # set the type of the list to its first element's type
-            elif self.current_token.type != first_type and not incorrect_types:
-                errors.append(f"Type 6 Error: Inconsistent types in list at Token {self.current_index}. Expected {first_type} and got {self.current_token.type}.")
-                incorrect_types = True  # boolean to prevent spamming errors list with this error
-            
-            node.add_child(self.parse())
-            if self.current_token.type == TokenType.COMMA:
-                self.eat()
-
+                    tree.add_missing(node, self.current_index)  # nothing to parse here, the token is left for the caller
+
+            # eat as many pairs as necessary until we close the dict
+            elif step == DICT or step == DICT_NEXT:
+                if step == DICT_NEXT and self.current_token.type == TokenType.COMMA:
+                    self.eat()
+                if self.current_token.type == TokenType.RBRACE or self.current_token.type == TokenType.EOF:
+                    tree.close(node, self.current_index)
+                    self.eat()
+                    continue
+
+                pair = tree.add_container(node, "pair", self.current_index)
+                stack.append((DICT_NEXT, node, state))
+                if self.current_token.type == TokenType.STRING:
+                    key = self.current_token.value
+                    shape = state[1]
+                    known = shape.children.get(key) if shape is not None else None
+                    if known is not None:
+                        # this dict's keys so far passed every check before
+                        shapes.hits += 1
+                        state[0] = None # states made before don't have this key, they are made again if needed
+                        state[1] = known
+                        tree.add_leaf(pair, TokenType.STRING, known.key, self.current_index)
+                        self.eat()
+                    else:
+                        if state[0] is None:
+                            state[0] = shapes.replay(shape, key_rules)
+                        key = keys.setdefault(key, key)
+                        before = len(errors)
+                        for rule, rule_state in zip(key_rules, state[0]):
+                            rule.check_key(key, self.current_index, rule_state, errors)
+
+                        self.key_node(key, pair)  # adds the STRING key
+                        if shape is not None:
+                            shapes.misses += 1
+                            state[1] = shapes.add(shape, key) if len(errors) == before else None
+                    self.eat()
+                    stack.append((VALUE, pair, None))  # adds the value node
+                else:
+                    self.get_next_token()
+
+            # eat as many values as necessary until we close the list
+            elif step == LIST or step == LIST_NEXT:
+                if step == LIST_NEXT:
+                    if self.current_token.type == TokenType.COMMA:
+                        self.eat()
+                    elif self.current_index == state[0] and self.current_token.type != TokenType.RBRACKET:
+                        self.get_next_token()  # the token couldn't start a value, skip it so the list can carry on
+                if self.current_token.type == TokenType.RBRACKET or self.current_token.type == TokenType.EOF:
+                    tree.close(node, self.current_index)
+                    self.eat()
+                    continue
+
+                for rule, rule_state in zip(element_rules, state[1]):
+                    rule.check_element(self.current_token.type, self.current_index, rule_state, errors)
+
+                state[0] = self.current_index
+                stack.append((LIST_NEXT, node, state))
+                stack.append((VALUE, node, None))
+
+        return tree.result()
+
+    # the same for a dict key, which is added as the string from the symbol table
+    def key_node(self, key, parent):
+        self.tree.add_leaf(parent, TokenType.STRING, key, self.current_index)
+        for rule in self.rules.leaf_table.get(TokenType.STRING, ()):
+            rule.check_leaf(TokenType.STRING, key, self.current_index, self.errors)
         self.eat()
-        return node
-
-    def leaf_node(self, token_type):
-        label = self.current_token.parse
-        node = Node(label=label, is_leaf=True, token_type=token_type)
-
-        # checking for Type 1 Error: Invalid Decimal Numbers
-        if token_type == TokenType.NUMBER and '.' in label:
-            parts = label.split('.')
-            if len(parts) != 2 or (not parts[0].isdigit() and '-' not in parts[0]) or not parts[1].isdigit():
-                    errors.append(f"Type 1 Error: Invalid decimal number '{label}'")
-            
-            # accounting for the case where we have a number like 00.14159 or something. INVALID!
-            elif len(parts[0]) > 1 and all(char == '0' for char in parts[0]):
-                errors.append(f"Type 1 Error: Invalid decimal number '{label}'")
-        
-        # checking for Type 3 Error: Invalid Numbers
-        if token_type == TokenType.NUMBER:
-            if label.startswith('0') and len(label) > 1 and '.' not in label:
-                errors.append(f"Type 3 Error: Leading zeros in number '{label}'")
-            elif label.startswith('+') and "e" not in label.lower(): # checking for both e and E 
-                errors.append(f"Type 3 Error: Leading '+' in number '{label}'")
-        
-        # checking for Type 7 Error: Reserved Words as Strings
-        if token_type == TokenType.STRING and self.current_token.parse in ["true", "false"]:
-            errors.append(f"Type 7 Error: Reserved word '{self.current_token.parse}' cannot be used as a string at Token {self.current_index}")
 
+    # checks the current token with the leaf rules for its type and adds it to parent as a leaf
+    def leaf_node(self, token_type, parent):
+        label = self.current_token.value
+        self.tree.add_leaf(parent, token_type, label, self.current_index)
+        for rule in self.rules.leaf_table.get(token_type, ()):
+            rule.check_leaf(token_type, label, self.current_index, self.errors)
         self.eat()
-        return node
 
 
 if __name__ == "__main__":
-    global errors
     errors = []
     token_file = "sample inputs semantic parser/input8.txt"  # input token file generated by scanner
     error_output_file = "errors.txt"
     output_file = "output.txt"
     
-    parser = Parser(token_file)
+    parser = Parser(token_file, errors=errors)
     parse_tree = parser.parse()
     
     with open(error_output_file, 'w') as file:
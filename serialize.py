@@ -0,0 +1,338 @@
+# writing trees out, and reading them back in
+# there are three formats:
+#   text   - the indented one print_tree has always written to output.txt, one line per node.
+#            Node.print_tree and FlatNode.print_tree both write through write_text
+#   json   - {"version": 1, "nodes": [...]} with the nodes in preorder, each one as
+#              [label, child count] or [label, child count, token type]  for a node that isn't a leaf
+#              [token type, label] or [token type, label, child count]  for a leaf
+#              null                                                     for a missing value
+#            (a node is a leaf when its second item isn't a number). the nodes are a flat list,
+#            so any json reader can load trees of any depth
+#   binary - the same nodes as typed arrays, see to_binary. the fastest to read back
+# every walk uses an explicit stack, so deep trees don't run into the recursion limit, and output goes
+# to the file in batches of lines instead of one write per node.
+#
+#   with open("ast.bin", "wb") as file:
+#       write_binary(ast, file)
+#   ast = read_binary(open("ast.bin", "rb"))
+
+import argparse
+import gc
+import json
+import sys
+from array import array
+from contextlib import contextmanager
+from json.encoder import encode_basestring
+
+from core import Node
+from flattree import FlatNode, MISSING, STRING, LABELS, TOKEN_TYPES
+from tokenbuffer import TYPES
+
+# lines (or json nodes) collected before they are written out
+BATCH_SIZE = 4096
+
+VERSION = 1
+
+# the text format. leaves print as "TYPE: value" with show_types (the parse tree) or just "value" (the AST),
+# anything a leaf has under it isn't printed. missing values have no line.
+# the stack holds an iterator over the children of every open container, so a run of leaves is written
+# in one tight loop without going through the stack, the indent is made once per container, and lines
+# are collected and written batch_size at a time
+def write_text(ast, file, depth=0, show_types=False, batch_size=BATCH_SIZE):
+    if isinstance(ast, FlatNode):
+        write_flat_text(ast.tree, ast.index, file, depth, show_types, batch_size)
+        return
+    batch = []
+    append = batch.append
+    stack = [(iter([ast]), "    " * depth)]
+    while stack:
+        children, indent = stack[-1]
+        for node in children:
+            if node is None:
+                continue
+            if node.is_leaf:
+                if show_types:
+                    append(f"{indent}{node.token_type}: {node.label}\n")
+                else:
+                    append(f"{indent}{node.label}\n")
+            else:
+                append(f"{indent}{node.label}\n")
+                stack.append((iter(node.children), indent + "    "))
+                break
+            if len(batch) >= batch_size:
+                file.write("".join(batch))
+                batch.clear()
+        else:
+            stack.pop()
+    file.write("".join(batch))
+
+# the same straight over a flattree.FlatTree's arrays, the stack holds the next child to write
+# of every open container
+def write_flat_text(tree, index, file, depth=0, show_types=False, batch_size=BATCH_SIZE):
+    kinds, first_child, next_sibling, source = tree.kinds, tree.first_child, tree.next_sibling, tree.source
+    starts, ends = tree.starts, tree.ends
+    batch = []
+    append = batch.append
+    stack = [[index, "    " * depth, True]] # next child, indent, whether it's the last one (only for the top)
+    while stack:
+        top = stack[-1]
+        child, indent, only = top
+        while child >= 0:
+            kind = kinds[child]
+            following = -1 if only else next_sibling[child]
+            if kind < STRING:
+                append(f"{indent}{LABELS[kind]}\n")
+                top[0] = following
+                stack.append([first_child[child], indent + "    ", False])
+                break
+            if kind != MISSING:
+                if show_types:
+                    append(f"{indent}{TOKEN_TYPES[kind]}: {source[starts[child]:ends[child]]}\n")
+                else:
+                    append(f"{indent}{source[starts[child]:ends[child]]}\n")
+                if len(batch) >= batch_size:
+                    file.write("".join(batch))
+                    batch.clear()
+            child = following
+        else:
+            stack.pop()
+    file.write("".join(batch))
+
+# joins pieces into one string per batch_size of them before writing it
+def write_batched(pieces, file, batch_size=BATCH_SIZE):
+    batch = []
+    for piece in pieces:
+        batch.append(piece)
+        if len(batch) >= batch_size:
+            file.write("".join(batch))
+            batch.clear()
+    if batch:
+        file.write("".join(batch))
+
+# every node in preorder as (label, is_leaf, token_type, child count), None for a missing value.
+# works for Node trees and FlatNode views
+def iter_nodes(ast):
+    stack = [ast]
+    while stack:
+        node = stack.pop()
+        if node is None:
+            yield None
+            continue
+        children = node.children
+        yield node.label, node.is_leaf, node.token_type, len(children)
+        stack.extend(reversed(children))
+
+# trees only point down, so there are no cycles for the garbage collector to find while one is
+# built, and with big trees its passes over the new nodes cost more than making them
+@contextmanager
+def paused_gc():
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+# builds a Node tree back out of nodes in the form iter_nodes gives them
+def build_tree(nodes):
+    with paused_gc():
+        return build_nodes(nodes)
+
+def build_nodes(nodes):
+    root = Node()
+    stack = [[root, 1]] # nodes that still have children to come, and how many
+    for item in nodes:
+        parent = stack[-1]
+        if item is None:
+            node = None
+        else:
+            node = Node(label=item[0], is_leaf=item[1], token_type=item[2])
+        parent[0].children.append(node)
+        parent[1] -= 1
+        if parent[1] == 0:
+            stack.pop()
+        if item is not None and item[3]:
+            stack.append([node, item[3]])
+    return root.children[0] if root.children else None
+
+# json
+
+def json_node(item):
+    if item is None:
+        return "null"
+    label, is_leaf, token_type, count = item
+    label = "null" if label is None else encode_basestring(label)
+    if is_leaf:
+        return f'["{token_type}",{label}]' if not count else f'["{token_type}",{label},{count}]'
+    if token_type is None:
+        return f"[{label},{count}]"
+    return f'[{label},{count},"{token_type}"]'
+
+def json_pieces(ast):
+    yield f'{{"version": {VERSION}, "nodes": ['
+    first = True
+    for item in iter_nodes(ast):
+        if first:
+            yield json_node(item)
+            first = False
+        else:
+            yield "," + json_node(item)
+    yield "]}\n"
+
+def write_json(ast, file):
+    write_batched(json_pieces(ast), file)
+
+def to_json(ast):
+    return "".join(json_pieces(ast))
+
+def json_items(nodes):
+    for node in nodes:
+        if node is None:
+            yield None
+        elif isinstance(node[1], int):
+            yield node[0], False, node[2] if len(node) > 2 else None, node[1]
+        else:
+            yield node[1], True, node[0], node[2] if len(node) > 2 else 0
+
+def from_json(text):
+    document = json.loads(text)
+    if document.get("version") != VERSION:
+        raise ValueError(f"Unsupported AST version: {document.get('version')}")
+    return build_tree(json_items(document["nodes"]))
+
+def read_json(file):
+    return from_json(file.read())
+
+# binary layout:
+#   MAGIC, 1 byte byte order ('<' or '>'),
+#   node count, label count and label text size in bytes (8 bytes each, in that byte order),
+#   kinds (1 byte per node: 1 = leaf, 2 = missing, plus the token type as (tokenbuffer.CODES + 1) << 2,
+#   0 for none), labels (4 bytes per node, an index into the labels, 0 for none), child counts (4 bytes per node),
+#   label ends (4 bytes per label, in characters), then the label text as utf-8.
+# every distinct label is stored once, so repeated keys and values cost 4 bytes a node
+MAGIC = b'JASTBIN1'
+LEAF_FLAG = 1
+MISSING_FLAG = 2
+TYPE_BITS = {token_type: (code + 1) << 2 for code, token_type in enumerate(TYPES)}
+TYPE_BITS[None] = 0
+
+# walked like write_text, with an iterator over the children of every open node on the stack
+def to_binary(ast):
+    kinds = array('B')
+    labels = array('I')
+    counts = array('I')
+    table = {None: 0}
+    stack = [iter([ast])]
+    while stack:
+        for node in stack[-1]:
+            if node is None:
+                kinds.append(MISSING_FLAG)
+                labels.append(0)
+                counts.append(0)
+                continue
+            children = node.children
+            kinds.append(TYPE_BITS[node.token_type] + (LEAF_FLAG if node.is_leaf else 0))
+            index = table.get(node.label)
+            if index is None:
+                index = table[node.label] = len(table)
+            labels.append(index)
+            counts.append(len(children))
+            if children:
+                stack.append(iter(children))
+                break
+        else:
+            stack.pop()
+    del table[None]
+    ends = array('I')
+    end = 0
+    for label in table:
+        end += len(label)
+        ends.append(end)
+    text = "".join(table).encode("utf-8", errors="surrogatepass")
+    order = b'<' if sys.byteorder == 'little' else b'>'
+    header = array('q', [len(kinds), len(table), len(text)])
+    return b''.join([MAGIC, order, header.tobytes(), kinds.tobytes(), labels.tobytes(), counts.tobytes(),
+                     ends.tobytes(), text])
+
+def from_binary(data):
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError("not a binary AST")
+    swap = data[len(MAGIC):len(MAGIC) + 1] != (b'<' if sys.byteorder == 'little' else b'>')
+    position = len(MAGIC) + 1
+
+    def column(typecode, count):
+        nonlocal position
+        values = array(typecode)
+        values.frombytes(data[position:position + count * values.itemsize])
+        position += count * values.itemsize
+        if swap:
+            values.byteswap()
+        return values
+
+    count, label_count, text_size = column('q', 3)
+    kinds = column('B', count)
+    labels = column('I', count)
+    counts = column('I', count)
+    ends = column('I', label_count)
+    text = bytes(data[position:position + text_size]).decode("utf-8", errors="surrogatepass")
+
+    table = [None]
+    start = 0
+    for end in ends:
+        table.append(text[start:end])
+        start = end
+    # (is_leaf, token_type) for every kind byte
+    token_types = [None] + TYPES
+    kind_info = [(bool(kind & LEAF_FLAG), token_types[kind >> 2] if kind >> 2 < len(token_types) else None)
+                 for kind in range(256)]
+
+    root = Node()
+    stack = [[root, 1]] # nodes that still have children to come, and how many
+    with paused_gc():
+        for kind, label, child_count in zip(kinds, labels, counts):
+            parent = stack[-1]
+            if kind & MISSING_FLAG:
+                node = None
+            else:
+                is_leaf, token_type = kind_info[kind]
+                node = Node(table[label], is_leaf, token_type)
+            parent[0].children.append(node)
+            parent[1] -= 1
+            if parent[1] == 0:
+                stack.pop()
+            if child_count:
+                stack.append([node, child_count])
+    return root.children[0] if root.children else None
+
+def write_binary(ast, file):
+    file.write(to_binary(ast))
+
+def read_binary(file):
+    return from_binary(file.read())
+
+FORMATS = {
+    "text": (write_text, "w"),
+    "json": (write_json, "w"),
+    "binary": (write_binary, "wb"),
+}
+
+def main(argv=None):
+    arguments = argparse.ArgumentParser(description="Compile a json file and write out its AST.")
+    arguments.add_argument("path")
+    arguments.add_argument("--format", choices=list(FORMATS), default="text")
+    arguments.add_argument("--output", default="output.txt", help="file the AST is written to (default: output.txt)")
+    options = arguments.parse_args(argv)
+
+    from compiler import compile_file # imported here since core.Node.print_tree imports this module
+    ast, errors = compile_file(options.path)
+    for error in errors:
+        print(error)
+    write, mode = FORMATS[options.format]
+    with open(options.output, mode, **({} if "b" in mode else {"encoding": "utf-8"})) as file:
+        if ast is not None:
+            write(ast, file)
+    return 1 if errors else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
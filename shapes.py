@@ -0,0 +1,64 @@
+# shape cache for dict keys
+# record-oriented documents are mostly lists of dicts with the same keys in the same order, and the key rules
+# (Type 2, 4 and 5, and the leaf rules keys go through) find the same thing for every one of them.
+# a ShapeCache is a trie of key sequences that were checked before and gave no errors: the parser follows
+# it key by key, and as long as a dict's keys are a path in the trie nothing is checked for them.
+# when a dict goes off the trie, fresh rule states are made and the keys so far are run through them
+# (they are known to be clean, so this finds nothing), and the dict is checked as usual from there.
+# keys in the trie are kept as the one string the AST uses for every dict of that shape.
+#
+# this only finds the same errors as checking every key when the rules only depend on the key and the
+# state they are given (Rule.pure), RuleSet only makes a ShapeCache when all key and STRING leaf rules are.
+# the trie lives as long as its RuleSet, so it also works across the records of records.py, and is
+# limited to max_nodes keys so documents with ever new keys don't grow it forever.
+
+DEFAULT_MAX_NODES = 1 << 14
+
+# one key of a shape, children are the keys that came after it in some dict
+class Shape:
+    __slots__ = ('key', 'parent', 'children')
+
+    def __init__(self, key=None, parent=None):
+        self.key = key
+        self.parent = parent
+        self.children = {}
+
+    # the keys from the start of the dict up to this one
+    def keys(self):
+        keys = []
+        shape = self
+        while shape.parent is not None:
+            keys.append(shape.key)
+            shape = shape.parent
+        keys.reverse()
+        return keys
+
+class ShapeCache:
+    def __init__(self, max_nodes=DEFAULT_MAX_NODES):
+        self.root = Shape()
+        self.max_nodes = max_nodes
+        self.nodes = 0
+        self.hits = 0 # keys that weren't checked
+        self.misses = 0 # keys that were
+
+    # shape followed by key, after key was checked and gave no errors. None once the trie is full
+    def add(self, shape, key):
+        child = shape.children.get(key)
+        if child is None:
+            if self.nodes >= self.max_nodes:
+                return None
+            self.nodes += 1
+            child = shape.children.setdefault(key, Shape(key, shape))
+        return child
+
+    # fresh states for key_rules with the keys of shape run through them
+    def replay(self, shape, key_rules):
+        states = [rule.container_state() for rule in key_rules]
+        unused = []
+        for key in shape.keys():
+            for rule, state in zip(key_rules, states):
+                rule.check_key(key, 0, state, unused)
+        return states
+
+    def stats(self):
+        return {"nodes": self.nodes, "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,220 @@
+# structural index scanner (simdjson style), selected with ENGINES["structural"] or compile_json(engine="structural")
+# instead of matching one token at a time, the whole input is looked at as one numpy array of characters:
+#   stage 1 - every character is classified with a lookup table (whitespace, punctuation, quote, anything else),
+#             quotes with an odd run of backslashes in front of them are dropped, and the ones left are
+#             paired up with a running xor, which gives a mask of everything inside strings. outside of it,
+#             punctuation are tokens on their own and every run of other characters is a number or keyword
+#   stage 2 - the positions found in stage 1 are turned into arrays of token codes, starts and ends
+#             (the same spans tokenbuffer.iter_spans gives), sorted by where they start
+# all of that is done by numpy without a python step per character or token. tokens are then made from
+# the arrays (iter_structural_tokens) or the arrays become a TokenBuffer as they are (scan_buffer).
+#
+# anything that isn't plain valid json (a run that isn't a number or keyword, a string that is never closed,
+# a backslash outside of a string, whitespace or anything else outside of strings that isn't ascii) ends
+# the index there, and the rest of the input is scanned by scanner.scan_text / tokenbuffer.iter_spans, which
+# pick up at any token boundary. so the tokens and errors are always the same as the other engines give,
+# inputs with errors are just only fast up to the first one.
+#
+# needs numpy, the other engines don't.
+#
+#   ast, errors = compile_json(text, engine="structural")
+#   buffer = scan_buffer(text)
+
+import re
+
+from core import Token, TokenType, default_errors
+from scanner import NUMBER_CHARS, SHARED_TOKENS, check_escapes, scan_text
+from tokenbuffer import TokenBuffer, CODES, STRING, NUMBER, KEYWORD_CODES, iter_spans, offset_typecode
+
+try:
+    import numpy
+except ImportError: # only needed for this engine
+    numpy = None
+
+# character classes
+OTHER = 0
+SPACE = 1
+PUNCTUATION = 2
+QUOTE = 3
+
+# tokens handed out per block when tokens are made from the index, so the arrays are never all python ints at once
+BLOCK_SIZE = 1 << 16
+
+# the shared token for every code that has one
+TOKENS = {CODES[token.type]: token for token in SHARED_TOKENS.values()}
+
+def lookup_tables():
+    classes = numpy.zeros(256, dtype=numpy.uint8)
+    numeric = numpy.zeros(256, dtype=bool)
+    codes = numpy.zeros(256, dtype=numpy.uint8)
+    for char in range(128):
+        if re.match(r"\s", chr(char)): # whatever the regex engine skips as whitespace
+            classes[char] = SPACE
+        if chr(char) in NUMBER_CHARS:
+            numeric[char] = True
+    for char in "{}[]:,":
+        classes[ord(char)] = PUNCTUATION
+        codes[ord(char)] = CODES[char]
+    classes[ord('"')] = QUOTE
+    return classes, numeric, codes
+
+TABLES = None
+
+# the input as an array with one item per character: bytes when it's all ascii, 4 bytes a character otherwise
+def char_array(text):
+    if text.isascii():
+        return numpy.frombuffer(text.encode("ascii"), dtype=numpy.uint8)
+    return numpy.frombuffer(text.encode("utf-32-le", errors="surrogatepass"), dtype=numpy.uint32)
+
+# keywords as arrays, to compare runs of their length with
+def keyword_arrays():
+    return [(numpy.frombuffer(keyword.encode("ascii"), dtype=numpy.uint8), code)
+            for keyword, code in KEYWORD_CODES.items()]
+
+# stage 1 and 2 over text[pos:]. returns (codes, starts, ends, escaped, stop): the tokens up to stop as numpy
+# arrays, escaped says which of them are strings with a backslash in them (their escapes still need checking),
+# and stop is where the index ends (len(text) unless something in the input isn't plain valid json)
+def structural_index(text, pos=0):
+    global TABLES
+    if numpy is None:
+        raise ImportError("the structural engine needs numpy installed")
+    if TABLES is None:
+        TABLES = lookup_tables()
+    classes_table, numeric_table, codes_table = TABLES
+
+    chars = char_array(text[pos:] if pos else text)
+    size = len(chars)
+    small = chars if chars.dtype == numpy.uint8 else numpy.minimum(chars, 255).astype(numpy.uint8)
+    classes = classes_table[small] # anything that isn't ascii is OTHER
+    stop = size
+
+    # quotes that aren't escaped: a quote is escaped by an odd number of backslashes right in front of it
+    backslashes = numpy.flatnonzero(chars == 92)
+    quotes = numpy.flatnonzero(classes == QUOTE)
+    if len(backslashes) and len(quotes):
+        is_backslash = numpy.zeros(size, dtype=bool)
+        is_backslash[backslashes] = True
+        last_other = numpy.maximum.accumulate(numpy.where(is_backslash, -1, numpy.arange(size)))
+        before = quotes - 1
+        run = numpy.where(quotes > 0, before - last_other[numpy.maximum(before, 0)], 0)
+        quotes = quotes[run % 2 == 0]
+
+    # every opening quote is paired with the next quote, a last one without a pair is a string that's never closed
+    opens = quotes[0::2]
+    closes = quotes[1::2]
+    if len(opens) > len(closes):
+        stop = int(opens[-1])
+        opens = opens[:-1]
+
+    # inside strings (from the opening quote up to just before the closing one) the running xor is 1
+    toggles = numpy.zeros(size, dtype=numpy.uint8)
+    toggles[quotes] = 1
+    outside = numpy.bitwise_xor.accumulate(toggles) == 0
+    del toggles
+
+    punctuation = numpy.flatnonzero(outside & (classes == PUNCTUATION))
+    other = outside & (classes == OTHER)
+    edges = numpy.diff(other.view(numpy.int8), prepend=0, append=0)
+    run_starts = numpy.flatnonzero(edges == 1)
+    run_ends = numpy.flatnonzero(edges == -1)
+    del edges
+
+    # a run is a number when all of its characters can be in one, a keyword when it's exactly one
+    not_numeric = numpy.flatnonzero(other & ~numeric_table[small])
+    run_codes = numpy.full(len(run_starts), NUMBER, dtype=numpy.uint8)
+    irregular = (numpy.searchsorted(not_numeric, run_starts) < numpy.searchsorted(not_numeric, run_ends))
+    lengths = run_ends - run_starts
+    for word, code in keyword_arrays():
+        candidates = numpy.flatnonzero(irregular & (lengths == len(word)))
+        if len(candidates):
+            matches = candidates[(chars[run_starts[candidates, None] + numpy.arange(len(word))] == word).all(axis=1)]
+            irregular[matches] = False
+            run_codes[matches] = code
+    if irregular.any():
+        stop = min(stop, int(run_starts[numpy.argmax(irregular)]))
+
+    starts = numpy.concatenate([punctuation, opens + 1, run_starts])
+    ends = numpy.concatenate([punctuation + 1, closes, run_ends])
+    codes = numpy.concatenate([codes_table[small[punctuation]], numpy.full(len(opens), STRING, dtype=numpy.uint8),
+                               run_codes])
+    # tokens are ordered by the character they start at, the quote for strings
+    order = numpy.argsort(numpy.concatenate([punctuation, opens, run_starts]), kind="stable")
+    starts, ends, codes = starts[order], ends[order], codes[order]
+    keep = numpy.searchsorted(starts - (codes == STRING), stop)
+    starts, ends, codes = starts[:keep], ends[:keep], codes[:keep]
+
+    # strings with a backslash between their start and end
+    escaped = (codes == STRING) & (numpy.searchsorted(backslashes, starts) < numpy.searchsorted(backslashes, ends))
+    if pos:
+        starts += pos
+        ends += pos
+    return codes, starts, ends, escaped, pos + stop
+
+# tokens for text from pos on, the same ones (and errors, into errors) scanner.scan_text gives.
+# returns where the scan ended, like scan_text
+def iter_structural_tokens(text, pos=0, errors=None, recover=False):
+    if errors is None:
+        errors = default_errors()
+    codes, starts, ends, escaped, stop = structural_index(text, pos)
+    tokens = TOKENS
+    for block in range(0, len(codes), BLOCK_SIZE):
+        section = slice(block, block + BLOCK_SIZE)
+        for code, start, end, check in zip(codes[section].tolist(), starts[section].tolist(),
+                                           ends[section].tolist(), escaped[section].tolist()):
+            if code == STRING:
+                value = text[start:end]
+                if check:
+                    check_escapes(value, start, errors)
+                yield Token(TokenType.STRING, value)
+            elif code == NUMBER:
+                yield Token(TokenType.NUMBER, text[start:end])
+            else:
+                yield tokens[code]
+    return (yield from scan_text(text, stop, errors=errors, recover=recover))
+
+# a tokenbuffer.TokenBuffer for text, the same one TokenBuffer.from_text makes. the arrays go into the buffer
+# as they are, only escapes and whatever comes after the index are looked at one token at a time
+def scan_buffer(text, errors=None, recover=False):
+    if errors is None:
+        errors = default_errors()
+    buffer, escaped, stop = index_buffer(text)
+    for index in escaped:
+        check_escapes(text[buffer.starts[index]:buffer.ends[index]], buffer.starts[index], errors)
+    types, starts, ends = buffer.types, buffer.starts, buffer.ends
+    for code, start, end in iter_spans(text, stop, errors, recover):
+        types.append(code)
+        starts.append(start)
+        ends.append(end)
+    return buffer
+
+# the same buffer and its tokens, like TokenBuffer.scanning: the index is put in the buffer up front, but escapes
+# are only checked, and whatever comes after the index only scanned, once the tokens get that far
+def scanning_buffer(text, errors=None, recover=False):
+    if errors is None:
+        errors = default_errors()
+    buffer, escaped, stop = index_buffer(text)
+    return buffer, iter_indexed_tokens(buffer, escaped, stop, errors, recover)
+
+def iter_indexed_tokens(buffer, escaped, stop, errors, recover):
+    token, source, starts, ends = buffer.token, buffer.source, buffer.starts, buffer.ends
+    count = len(buffer)
+    escaped = iter(escaped)
+    check = next(escaped, count)
+    for index in range(count):
+        if index == check:
+            check_escapes(source[starts[index]:ends[index]], starts[index], errors)
+            check = next(escaped, count)
+        yield token(index)
+    held = []
+    yield from buffer.fill(iter_spans(source, stop, held, recover), held, errors)
+
+# a TokenBuffer holding the structural index of text, the indices of its strings with escapes to check, and where
+# the index stops
+def index_buffer(text):
+    codes, starts, ends, escaped, stop = structural_index(text)
+    buffer = TokenBuffer(text)
+    offsets = numpy.uint32 if offset_typecode(len(text)) == 'I' else numpy.int64
+    buffer.types.frombytes(codes.tobytes())
+    buffer.starts.frombytes(starts.astype(offsets).tobytes())
+    buffer.ends.frombytes(ends.astype(offsets).tobytes())
+    return buffer, numpy.flatnonzero(escaped).tolist(), stop
@@ -0,0 +1,11 @@
+from cache import ResultCache
+from compiler import compile_json
+
+# a lone surrogate can't be encoded as plain utf-8, the key and the stored tokens both have to take it
+def test_lone_surrogate(tmp_path):
+    text = '["\ud800"]'
+    cache = ResultCache(str(tmp_path))
+    expected = compile_json(text)[1]
+    assert cache.compile_json(text)[1] == expected
+    assert cache.compile_json(text)[1] == expected
+    assert cache.hits == 1
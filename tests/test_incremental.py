@@ -0,0 +1,84 @@
+# Document.edit checked against compile_json on the edited text, on edits that went wrong before and on
+# random edits of seeded documents. the pieces are typed in or pasted over what's there, many of them change
+# the structure, open or close a string (so the scan has to go on a long way before it lines up again) or
+# make values of another type or duplicate keys
+import json
+import random
+
+import pytest
+
+import incremental
+from compiler import compile_json
+from incremental import Document
+
+EDIT_PIECES = list('{}[]:,"0123456789 tfn.e+-@\\\n') + [
+    '"a"', '"a": 1', '00.5', '+1', '1.5e3', '01', '"\\q"', 'true', ', "a": 1', '[1, "x"]', '{"a": ', ']', '}', ', ',
+]
+
+# as (text, offset, deleted, inserted)
+EDGE_EDITS = [
+    ('[12, 13, 14]', 2, 0, ','), # a number split in two
+    ('[1, 2, 3, 4]', 4, 0, '"'), # a string that is never closed swallows the rest
+    ('["a", "b", "c"]', 1, 1, ''), # a quote deleted, every string after it flips
+    ('[1, [2, 3], 4]', 9, 1, ''), # a bracket deleted, the list around it ends somewhere else
+    ('{"a": 1, "b": 2}', 6, 0, '{'),
+    ('{"a": 1, "b": 2, "a": 3}', 2, 1, 'c'), # the first of two duplicate keys renamed
+    ('[1, "x", 2, "y"]', 4, 3, '5'), # the first value of another type replaced
+    ('[[1], "x"]', 1, 3, '"x"'), # the first element changes type
+    ('{"a"', 4, 0, '}'), # typed after the last key of an unclosed dict, which ends past the last token
+    ('{"a"', 4, 0, ','),
+    ('{"a": 1 "b"', 11, 0, ','),
+]
+
+SEEDS = range(5)
+DOCUMENTS = 100 # for each seed
+EDITS = 30 # on each document
+
+def random_value(rng, depth=0):
+    kind = rng.random()
+    if depth < 5 and kind < 0.3:
+        keys = ["a", "b", "c", "", " ", "true", "null"]
+        return {rng.choice(keys): random_value(rng, depth + 1) for _ in range(rng.randrange(7))}
+    if depth < 5 and kind < 0.55:
+        return [random_value(rng, depth + 1) for _ in range(rng.randrange(12))]
+    return rng.choice(["x", "true", 1, 1.5, 0.25, None, True, False, -3, 1e50, "a\\qb", 12, 345])
+
+def random_edit(rng, text):
+    offset = rng.randint(0, len(text))
+    deleted = rng.randint(0, min(3, len(text) - offset)) if rng.random() < 0.5 else 0
+    inserted = rng.choice(EDIT_PIECES) if deleted == 0 or rng.random() < 0.8 else ""
+    return offset, deleted, inserted
+
+# the first edit Document.edit gets wrong, as (text before it, offset, deleted, inserted), or None
+def edit_differences(text, edits):
+    document = Document(text)
+    if document.errors() != list(compile_json(text)[1]):
+        return text, 0, 0, ""
+    for edit in edits:
+        offset, deleted, inserted = edit(document.text) if callable(edit) else edit
+        before = document.text
+        expected = before[:offset] + inserted + before[offset + deleted:]
+        if document.edit(offset, deleted, inserted) != list(compile_json(expected)[1]) or document.text != expected:
+            return before, offset, deleted, inserted
+    return None
+
+# small blocks, so edits cross them
+@pytest.fixture(params=[2, 6, 8])
+def block_size(request, monkeypatch):
+    monkeypatch.setattr(incremental, "BLOCK_SIZE", request.param)
+    return request.param
+
+@pytest.mark.parametrize("text, offset, deleted, inserted", EDGE_EDITS)
+def test_edge_edits(block_size, text, offset, deleted, inserted):
+    assert edit_differences(text, [(offset, deleted, inserted)]) is None
+
+# some documents are cut off, so the edits land in dicts and lists that are never closed
+@pytest.mark.parametrize("seed", SEEDS)
+def test_random_edits(monkeypatch, seed):
+    monkeypatch.setattr(incremental, "BLOCK_SIZE", 8)
+    rng = random.Random(seed)
+    for _ in range(DOCUMENTS):
+        text = json.dumps(random_value(rng), indent=rng.choice([None, 1]))
+        if rng.random() < 0.3:
+            text = text[:rng.randint(0, len(text))]
+        assert edit_differences(text, [lambda current: random_edit(rng, current)] * EDITS) is None
@@ -0,0 +1,239 @@
+# columnar token stream, an alternative to one Token object per token
+# token types are stored as small integer codes and every token keeps the start/end offsets of its value
+# in the original source text, so no substring is made until a value is actually asked for.
+# the buffer can be saved to a compact binary file that either parser loads without parsing any text
+
+import sys
+from array import array
+from itertools import islice
+
+from core import TokenType, Token, default_errors
+from scanner import TOKEN_PATTERN, SHARED_TOKENS, DFA, Lexer, LexerError, check_escapes, bad_run_end, bad_run_error
+
+# integer code for every token type, the order is part of the file format so only ever append to it
+TYPES = [
+    TokenType.LBRACE,
+    TokenType.RBRACE,
+    TokenType.LBRACKET,
+    TokenType.RBRACKET,
+    TokenType.COMMA,
+    TokenType.COLON,
+    TokenType.STRING,
+    TokenType.NUMBER,
+    TokenType.BOOL_TRUE,
+    TokenType.BOOL_FALSE,
+    TokenType.NULL,
+]
+CODES = {token_type: code for code, token_type in enumerate(TYPES)}
+
+KEYWORD_CODES = {
+    'true': CODES[TokenType.BOOL_TRUE],
+    'false': CODES[TokenType.BOOL_FALSE],
+    'null': CODES[TokenType.NULL],
+}
+STRING = CODES[TokenType.STRING]
+NUMBER = CODES[TokenType.NUMBER]
+# tokens TokenBuffer.fill scans ahead of the parser at a time
+FILL_BATCH = 4096
+
+# binary file layout:
+#   MAGIC, 1 byte byte order ('<' or '>'), 1 byte offset typecode ('I' or 'q'),
+#   token count and source size in bytes (8 bytes each, in that byte order),
+#   types (1 byte per token), starts and ends (4 or 8 bytes per token each), then the source as utf-8
+MAGIC = b'JTOKBUF1'
+
+# offsets only need 8 bytes each once the source is too big for 4
+def offset_typecode(size):
+    return 'I' if size < 2 ** 32 and array('I').itemsize == 4 else 'q'
+
+# scans text from pos with the regex engine and yields (type code, start, end) for every token,
+# where start and end are the span of the token's value (inside the quotes for strings).
+# the tokens and errors are the same as scanner.scan_text's, errors go to errors (core.errors if none is given),
+# recover works like it does there
+def iter_spans(text, pos=0, errors=None, recover=False):
+    if errors is None:
+        errors = default_errors()
+    size = len(text)
+    while True:
+        for found in TOKEN_PATTERN.finditer(text, pos):
+            kind = found.lastindex
+            if kind == 1:
+                yield CODES[found.group(1)], found.start(1), found.end(1) # punctuation types are the characters themselves
+            elif kind == 2:
+                if '\\' in found.group(2):
+                    check_escapes(found.group(2), found.start(2), errors)
+                yield STRING, found.start(2), found.end(2)
+            elif kind == 3:
+                yield NUMBER, found.start(3), found.end(3)
+            elif kind == 4:
+                yield KEYWORD_CODES[found.group(4)], found.start(4), found.end(4)
+            else:
+                break
+        else:
+            return
+
+        # same fallbacks as scanner.scan_text
+        pos = found.start(5)
+        if text[pos] == '"':
+            if '\\' in text[pos + 1:]:
+                check_escapes(text[pos + 1:], pos + 1, errors)
+            yield STRING, pos + 1, size
+            return
+        lexer = Lexer(text, errors)
+        lexer.position = pos
+        lexer.current_char = text[pos]
+        try:
+            token = DFA().useDFA(lexer)
+        except LexerError as e:
+            if recover:
+                end = bad_run_end(text, pos)
+                errors.append(bad_run_error(text, pos, end))
+                pos = end
+            else:
+                errors.append(f"Lexer Error: {e}")
+                pos += 1
+            continue
+        yield CODES[token.type], pos, lexer.position
+        pos = lexer.position
+
+class TokenBuffer:
+    def __init__(self, source=''):
+        self.source = source
+        self.types = array('B')
+        self.starts = array(offset_typecode(len(source)))
+        self.ends = array(offset_typecode(len(source)))
+
+    def __len__(self):
+        return len(self.types)
+
+    def append(self, token_type, start, end):
+        self.types.append(CODES[token_type])
+        self.starts.append(start)
+        self.ends.append(end)
+
+    def type_at(self, index):
+        return TYPES[self.types[index]]
+
+    def value_at(self, index):
+        return self.token(index).value
+
+    # only STRING and NUMBER tokens carry text of their own, the rest are the scanner's shared tokens
+    def token(self, index):
+        code = self.types[index]
+        if code == STRING or code == NUMBER:
+            return Token(TYPES[code], self.source[self.starts[index]:self.ends[index]])
+        return SHARED_TOKENS[self.source[self.starts[index]:self.ends[index]]]
+
+    # tokens are made one at a time, so a parser given a TokenBuffer never holds more than the current one
+    def __iter__(self):
+        token = self.token
+        for index in range(len(self.types)):
+            yield token(index)
+
+    # scans text with the regex engine, recording spans instead of making tokens
+    # errors and recover are handled exactly like they are by the scanner
+    @classmethod
+    def from_text(cls, text, errors=None, recover=False):
+        buffer = cls(text)
+        types, starts, ends = buffer.types, buffer.starts, buffer.ends
+        for code, start, end in iter_spans(text, 0, errors, recover):
+            types.append(code)
+            starts.append(start)
+            ends.append(end)
+        return buffer
+
+    # an empty buffer for text, and its tokens: they are scanned with the regex engine as they are read and
+    # added to the buffer as they go (see fill), so the scan and its errors only get as far as a streamed scan would
+    @classmethod
+    def scanning(cls, text, errors=None, recover=False):
+        if errors is None:
+            errors = default_errors()
+        buffer = cls(text)
+        held = []
+        return buffer, buffer.fill(iter_spans(text, 0, held, recover), held, errors)
+
+    # adds the spans to the buffer FILL_BATCH at a time and hands out their tokens, so the tokens a parser is
+    # about to read are already in the buffer (see rules.RuleSet.batched). the spans report their lexer errors
+    # to held, they are only passed on to errors when the token they were found before is handed out (or
+    # the spans run out), so they come in the same order as a streamed scan's and none past where the parser stops
+    def fill(self, spans, held, errors):
+        types, starts, ends, source = self.types, self.starts, self.ends, self.source
+        while True:
+            batch = [] # the spans, with how many errors were held once each of them was scanned
+            for code, start, end in islice(spans, FILL_BATCH):
+                types.append(code)
+                starts.append(start)
+                ends.append(end)
+                batch.append((code, start, end, len(held)))
+            passed = 0
+            for code, start, end, mark in batch:
+                while passed < mark:
+                    errors.append(held[passed])
+                    passed += 1
+                if code == STRING or code == NUMBER:
+                    yield Token(TYPES[code], source[start:end])
+                else:
+                    yield SHARED_TOKENS[source[start:end]]
+            if len(batch) < FILL_BATCH:
+                for message in held[passed:]:
+                    errors.append(message)
+                del held[:]
+                return
+            del held[:]
+
+    # builds a buffer out of tokens that have no source text, e.g. ones read from a scanner output file.
+    # the values are joined into a new source so the offsets have something to point at
+    @classmethod
+    def from_tokens(cls, tokens):
+        types = []
+        pieces = []
+        for token in tokens:
+            types.append(token.type)
+            pieces.append(token.value if token.value is not None else token.type)
+        buffer = cls(''.join(pieces))
+        offset = 0
+        for token_type, value in zip(types, pieces):
+            buffer.append(token_type, offset, offset + len(value))
+            offset += len(value)
+        return buffer
+
+    def to_bytes(self):
+        source = self.source.encode('utf-8', errors='surrogatepass')
+        order = b'<' if sys.byteorder == 'little' else b'>'
+        header = array('q', [len(self.types), len(source)])
+        return b''.join([MAGIC, order, self.starts.typecode.encode(), header.tobytes(), self.types.tobytes(),
+                         self.starts.tobytes(), self.ends.tobytes(), source])
+
+    @classmethod
+    def from_bytes(cls, data):
+        if data[:len(MAGIC)] != MAGIC:
+            raise ValueError("not a token buffer file")
+        swap = data[len(MAGIC):len(MAGIC) + 1] != (b'<' if sys.byteorder == 'little' else b'>')
+        offsets = data[len(MAGIC) + 1:len(MAGIC) + 2].decode()
+        position = len(MAGIC) + 2
+
+        def column(typecode, count):
+            nonlocal position
+            values = array(typecode)
+            values.frombytes(data[position:position + count * values.itemsize])
+            position += count * values.itemsize
+            if swap:
+                values.byteswap()
+            return values
+
+        count, source_size = column('q', 2)
+        buffer = cls()
+        buffer.types = column('B', count)
+        buffer.starts = column(offsets, count)
+        buffer.ends = column(offsets, count)
+        buffer.source = bytes(data[position:position + source_size]).decode('utf-8', errors='surrogatepass')
+        return buffer
+
+    def save(self, path):
+        with open(path, 'wb') as file:
+            file.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as file:
+            return cls.from_bytes(file.read())